@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reprocessamento em lote - Regenera chords.json e waveforms de todos os uploads
+processados (e opcionalmente da biblioteca public/assets/multitrack)
+
+Os diretórios são processados em um pool de processos (cada processo importa
+o librosa e cria o ChordAnalyzer uma única vez). Ao terminar um diretório é
+gravado um carimbo (.reprocess.json) com a versão e os parâmetros usados;
+diretórios com carimbo atual são pulados, então uma execução interrompida
+continua de onde parou.
+
+Uso:
+    python3 batch_reprocess.py [--multitrack] [--workers N] [--stem other|all] [--profile fast] [--force]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chord_analyzer import (ANALYSIS_PROFILES, DEFAULT_PROFILE, ChordAnalyzer, ChromaStore, parse_fusion_weights,
+                            parse_resolutions)
+from process_audio import STEMS, STEM_COLORS, get_data_dir, get_db_path, render_waveform
+import waveform_renderer
+import peak_pyramid
+from pcm_cache import load_pcm
+
+
+# Versão do reprocessamento; mudar força o reprocessamento de todos os diretórios
+REPROCESS_VERSION = 1
+
+# Carimbo gravado em cada diretório reprocessado
+STAMP_FILE = '.reprocess.json'
+
+# Biblioteca estática de multitracks
+MULTITRACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public', 'assets', 'multitrack')
+
+# Cor do waveform de stems fora de STEM_COLORS (ex: piano da biblioteca)
+DEFAULT_COLOR = '#4CAF50'
+
+# ChordAnalyzer de cada processo do pool
+_analyzer = None
+
+
+def build_params(args):
+    """Parâmetros que determinam o resultado (gravados no carimbo)"""
+    analyzer = ChordAnalyzer.from_profile(args.profile,
+                                          resolutions=parse_resolutions(os.environ.get('CHORD_RESOLUTIONS')))
+    return {
+        'version': REPROCESS_VERSION,
+        'chords': not args.no_chords,
+        'waveforms': not args.no_waveforms,
+        'stem': args.stem,
+        'profile': analyzer.profile,
+        'chroma_type': analyzer.chroma_type,
+        'sample_rate': analyzer.sample_rate,
+        'hop_length': analyzer.hop_length,
+        'frame_size': analyzer.frame_size,
+        'segment_duration': analyzer.segment_duration,
+        'resolutions': [list(resolution) for resolution in analyzer.resolutions],
+        'min_confidence': analyzer.MIN_CONFIDENCE,
+        'fusion_weights': parse_fusion_weights(os.environ.get('CHORD_FUSION_WEIGHTS')) or analyzer.FUSION_WEIGHTS,
+        'waveform_size': [waveform_renderer.WIDTH_PX, waveform_renderer.HEIGHT_PX],
+        'peak_pyramid': [peak_pyramid.VERSION, peak_pyramid.BASE_SAMPLES_PER_PIXEL]
+    }
+
+
+def completed_upload_ids():
+    """IDs dos uploads concluídos no banco (None se o banco não puder ser lido)"""
+    try:
+        conn = sqlite3.connect(get_db_path(), timeout=30)
+        try:
+            rows = conn.execute("SELECT id FROM uploads WHERE processing_status = 'completed'").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível ler o banco ({e}); todos os diretórios serão considerados")
+        return None
+
+    return {row[0] for row in rows}
+
+
+def find_directories(include_multitrack):
+    """
+    Lista os diretórios a reprocessar
+
+    Uploads que ainda não terminaram de processar (ou falharam) são ignorados
+    para não concorrer com o worker de processamento.
+    """
+    directories = []
+
+    processed_root = os.path.join(get_data_dir(), 'processed')
+    if os.path.isdir(processed_root):
+        completed = completed_upload_ids()
+        uploads = []
+        for name in os.listdir(processed_root):
+            upload_id = name[len('upload_'):]
+            if not name.startswith('upload_') or not upload_id.isdigit():
+                continue
+            if completed is not None and int(upload_id) not in completed:
+                continue
+            uploads.append((int(upload_id), os.path.join(processed_root, name)))
+        directories.extend(path for _, path in sorted(uploads))
+
+    if include_multitrack and os.path.isdir(MULTITRACK_DIR):
+        for name in sorted(os.listdir(MULTITRACK_DIR)):
+            path = os.path.join(MULTITRACK_DIR, name)
+            if os.path.isdir(path):
+                directories.append(path)
+
+    return directories
+
+
+def find_stems(directory):
+    """Stems (arquivos .mp3) do diretório: nome -> caminho"""
+    return {
+        os.path.splitext(name)[0]: os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith('.mp3')
+    }
+
+
+def sources_signature(stems):
+    """Tamanho e mtime de cada stem; um stem regravado invalida o carimbo"""
+    signature = {}
+    for stem, path in stems.items():
+        stat = os.stat(path)
+        signature[stem] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def read_stamp(directory):
+    try:
+        with open(os.path.join(directory, STAMP_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(directory, stamp):
+    """Grava o carimbo de forma atômica (uma interrupção não deixa carimbo inválido)"""
+    path = os.path.join(directory, STAMP_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stamp, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def init_worker(params):
+    """Inicializa um processo do pool (import e analyzer criados uma única vez)"""
+    global _analyzer
+
+    # Logs dos processos intercalados linha a linha com o progresso
+    sys.stdout.reconfigure(line_buffering=True)
+
+    _analyzer = ChordAnalyzer.from_profile(params['profile'], params['segment_duration'], params['resolutions'])
+
+
+def reprocess_directory(directory, params, force=False):
+    """
+    Regenera waveforms e acordes de um diretório
+
+    Args:
+        directory: Diretório com os stems (.mp3)
+        params: Parâmetros do reprocessamento (build_params)
+        force: Reprocessa mesmo com carimbo atual
+
+    Returns:
+        Dicionário com status ('ok', 'skipped', 'empty' ou 'error'), tempo,
+        duração do áudio e erros
+    """
+    start = time.time()
+    result = {'directory': directory, 'status': 'ok', 'elapsed': 0.0, 'audio_seconds': 0.0, 'errors': []}
+
+    stems = find_stems(directory)
+    if not stems:
+        result['status'] = 'empty'
+        return result
+
+    signature = sources_signature(stems)
+    stamp = read_stamp(directory)
+    if not force and stamp and stamp.get('params') == params and stamp.get('sources') == signature:
+        result['status'] = 'skipped'
+        result['audio_seconds'] = stamp.get('audio_seconds', 0.0)
+        return result
+
+    if params['waveforms']:
+        for stem, path in stems.items():
+            try:
+                y, sr = load_pcm(path, sr=None, mono=True)
+            except Exception as e:
+                print(f"Erro ao decodificar {path}: {e}")
+                result['errors'].append(f'{stem}:waveform')
+                continue
+
+            result['audio_seconds'] = max(result['audio_seconds'], len(y) / sr)
+            peaks_file = os.path.join(directory, f'{stem}.peaks.json')
+            pyramid_file = os.path.join(directory, f'{stem}.peaks.bin')
+            if not render_waveform(y, sr, os.path.join(directory, f'{stem}.png'),
+                                   STEM_COLORS.get(stem, DEFAULT_COLOR), peaks_file, pyramid_file):
+                result['errors'].append(f'{stem}:waveform')
+
+    if params['chords']:
+        chord_stems = {stem: path for stem, path in stems.items() if stem in STEMS}
+        store = ChromaStore(directory)
+
+        if params['stem'] == 'all':
+            chord_data = _analyzer.analyze_fused(chord_stems, params['sample_rate'], store=store,
+                                                 weights=params['fusion_weights'])
+        elif params['stem'] in chord_stems:
+            chord_data = _analyzer.analyze_stem(params['stem'], chord_stems[params['stem']],
+                                                params['sample_rate'], store=store)
+            chord_data['primary_stem'] = params['stem']
+        else:
+            chord_data = _analyzer.analyze_stems(chord_stems, params['sample_rate'], store=store)
+
+        result['audio_seconds'] = max(result['audio_seconds'], chord_data.get('duration', 0.0))
+        if chord_data.get('error') or not _analyzer.save_to_json(chord_data, os.path.join(directory, 'chords.json')):
+            result['errors'].append('chords')
+
+    if result['errors']:
+        result['status'] = 'error'
+    else:
+        write_stamp(directory, {
+            'params': params,
+            'sources': signature,
+            'audio_seconds': result['audio_seconds'],
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        })
+
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:d}h{minutes:02d}m' if hours else f'{minutes:d}m{seconds:02d}s'
+
+
+def run_batch(directories, params, workers, force=False):
+    """
+    Reprocessa os diretórios no pool e imprime progresso e vazão
+
+    Returns:
+        Dicionário com a contagem de cada status
+    """
+    counts = {'ok': 0, 'skipped': 0, 'empty': 0, 'error': 0}
+    total = len(directories)
+    processed_audio = 0.0
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(params,)) as pool:
+        futures = {pool.submit(reprocess_directory, directory, params, force): directory
+                   for directory in directories}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                directory = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': 'error', 'elapsed': 0.0, 'audio_seconds': 0.0, 'errors': [str(e)]}
+
+                counts[result['status']] += 1
+                if result['status'] == 'ok':
+                    processed_audio += result['audio_seconds']
+
+                elapsed = time.time() - start
+                rate = done / elapsed if elapsed > 0 else 0.0
+                eta = (total - done) / rate if rate > 0 else 0.0
+                detail = f" {', '.join(result['errors'])}" if result['errors'] else ''
+                print(f"[{done}/{total}] {os.path.basename(directory)}: {result['status']}{detail} "
+                      f"({result['elapsed']:.1f}s) | {rate:.2f} dir/s, "
+                      f"{processed_audio / elapsed if elapsed > 0 else 0.0:.1f}x tempo real, "
+                      f"ETA {format_eta(eta)}", flush=True)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"\nInterrompido: {counts['ok']} diretório(s) concluído(s). "
+                  f"Execute novamente para continuar de onde parou.")
+            raise
+
+    elapsed = time.time() - start
+    print(f"\nConcluído em {elapsed:.1f}s: {counts['ok']} reprocessado(s), {counts['skipped']} já atualizado(s), "
+          f"{counts['empty']} sem stems, {counts['error']} com erro")
+    if elapsed > 0 and processed_audio > 0:
+        print(f"Vazão: {counts['ok'] / elapsed:.2f} dir/s, {processed_audio / 60:.1f} min de áudio "
+              f"({processed_audio / elapsed:.1f}x tempo real)")
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenera acordes e waveforms de todos os uploads processados')
+    parser.add_argument('--multitrack', action='store_true',
+                        help='Inclui a biblioteca public/assets/multitrack')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processos em paralelo (padrão: número de núcleos)')
+    parser.add_argument('--stem', default='auto', choices=['auto', 'vocals', 'drums', 'bass', 'other', 'all'],
+                        help="Stem usado nos acordes (auto = prioridade do processamento, all = combinado)")
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=list(ANALYSIS_PROFILES),
+                        help=f"Perfil da análise de acordes (padrão: {DEFAULT_PROFILE}; fast para bibliotecas grandes)")
+    parser.add_argument('--no-chords', action='store_true', help='Não regenera chords.json')
+    parser.add_argument('--no-waveforms', action='store_true', help='Não regenera os waveforms')
+    parser.add_argument('--force', action='store_true', help='Ignora os carimbos e reprocessa tudo')
+    parser.add_argument('directories', nargs='*',
+                        help='Diretórios específicos (padrão: todos os uploads processados)')
+    args = parser.parse_args()
+
+    if args.no_chords and args.no_waveforms:
+        parser.error('nada a fazer: --no-chords e --no-waveforms ao mesmo tempo')
+
+    directories = args.directories or find_directories(args.multitrack)
+    if not directories:
+        print("Nenhum diretório para reprocessar")
+        return 0
+
+    params = build_params(args)
+    print(f"Reprocessando {len(directories)} diretório(s) com {args.workers} processo(s)")
+
+    try:
+        counts = run_batch(directories, params, max(1, args.workers), args.force)
+    except KeyboardInterrupt:
+        return 130
+
+    return 1 if counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bench Fixtures - Áudio sintético determinístico e separador falso para benchmarks
+
+Os arquivos são gerados offline (sem rede e sem modelo) a partir de uma
+progressão de acordes fixa, então a mesma duração sempre produz o mesmo
+áudio. O StubSeparator substitui o Spleeter com um custo previsível.
+"""
+
+import os
+import time
+import numpy as np
+import soundfile as sf
+from typing import Dict, List, Optional, Tuple
+
+
+SAMPLE_RATE = 44100
+
+# Progressão usada nos fixtures: (nome, fundamental MIDI, intervalos)
+PROGRESSION = [
+    ('C', 48, [0, 4, 7]),
+    ('G', 43, [0, 4, 7]),
+    ('Am', 45, [0, 3, 7]),
+    ('F', 41, [0, 4, 7]),
+]
+
+# Duração de cada acorde da progressão (segundos)
+CHORD_SECONDS = 2.0
+
+# Harmônicos somados na onda dente de serra (limitada em banda)
+SAW_HARMONICS = 8
+
+# Fade nas bordas de cada acorde, evita cliques ao repetir o ciclo (segundos)
+FADE_SECONDS = 0.01
+
+
+def _midi_to_hz(note: int) -> float:
+    return 440.0 * 2.0 ** ((note - 69) / 12.0)
+
+
+def _voice(freq: float, t: np.ndarray, waveform: str) -> np.ndarray:
+    """Uma nota: senoide ou dente de serra (soma de harmônicos 1/k)"""
+    if waveform == 'sine':
+        return np.sin(2 * np.pi * freq * t)
+
+    y = np.zeros_like(t)
+    for k in range(1, SAW_HARMONICS + 1):
+        if freq * k >= SAMPLE_RATE / 2:
+            break
+        y += np.sin(2 * np.pi * freq * k * t) / k
+    return y * (2 / np.pi)
+
+
+def _chord_segment(root: int, intervals: List[int], waveform: str, sr: int) -> np.ndarray:
+    """Um acorde estéreo: baixo (fundamental uma oitava abaixo) à esquerda e tríade à direita"""
+    t = np.arange(int(CHORD_SECONDS * sr)) / sr
+
+    bass = _voice(_midi_to_hz(root - 12), t, waveform)
+    triad = sum(_voice(_midi_to_hz(root + 12 + interval), t, waveform) for interval in intervals) / len(intervals)
+
+    fade = np.ones_like(t)
+    n_fade = int(FADE_SECONDS * sr)
+    fade[:n_fade] = np.linspace(0.0, 1.0, n_fade)
+    fade[-n_fade:] = np.linspace(1.0, 0.0, n_fade)
+
+    left = 0.6 * bass + 0.4 * triad
+    right = 0.3 * bass + 0.7 * triad
+    return (np.stack([left, right], axis=1) * fade[:, np.newaxis] * 0.5).astype(np.float32)
+
+
+def synth_progression(duration: float, waveform: str = 'sine', sr: int = SAMPLE_RATE,
+                      seed: int = 0) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Gera a progressão de acordes com a duração pedida
+
+    Um ciclo da progressão é sintetizado uma vez e repetido, então gerar
+    20 minutos custa pouco mais que gerar 8 segundos.
+
+    Args:
+        duration: Duração em segundos
+        waveform: 'sine' ou 'saw'
+        sr: Taxa de amostragem
+        seed: Semente do ruído de fundo
+
+    Returns:
+        Tupla (array (amostras, 2) float32, eventos esperados [{'time', 'chord'}])
+    """
+    if waveform not in ('sine', 'saw'):
+        raise ValueError(f"Forma de onda inválida: {waveform}")
+
+    cycle = np.concatenate([_chord_segment(root, intervals, waveform, sr)
+                            for _, root, intervals in PROGRESSION])
+    n_samples = int(duration * sr)
+    repeats = -(-n_samples // len(cycle))
+    y = np.tile(cycle, (repeats, 1))[:n_samples]
+
+    # Ruído baixo: evita trechos digitalmente idênticos (e silêncio absoluto)
+    rng = np.random.RandomState(seed)
+    y += (rng.standard_normal(y.shape) * 1e-3).astype(np.float32)
+
+    events = []
+    n_chords = int(np.ceil(duration / CHORD_SECONDS))
+    for i in range(n_chords):
+        events.append({'time': i * CHORD_SECONDS, 'chord': PROGRESSION[i % len(PROGRESSION)][0]})
+
+    return y, events
+
+
+def expected_chord_at(t: float) -> str:
+    """Acorde da progressão dos fixtures no instante t"""
+    return PROGRESSION[int(t // CHORD_SECONDS) % len(PROGRESSION)][0]
+
+
+def chord_accuracy(events: List[Dict], duration: float, step: float = 0.1) -> float:
+    """
+    Fração do tempo em que o acorde detectado é o da progressão
+
+    O acorde detectado em t é o do último evento com time <= t (o mesmo que
+    o player mostra); instantes antes do primeiro evento contam como erro.
+
+    Args:
+        events: Eventos detectados [{'time', 'chord'}] em ordem
+        duration: Duração do fixture em segundos
+        step: Intervalo entre os instantes comparados
+
+    Returns:
+        Acurácia entre 0.0 e 1.0
+    """
+    instants = np.arange(0.0, duration, step)
+    if len(instants) == 0:
+        return 0.0
+
+    times = np.array([event['time'] for event in events])
+    indices = np.searchsorted(times, instants, side='right') - 1
+    hits = sum(1 for t, i in zip(instants, indices) if i >= 0 and events[i]['chord'] == expected_chord_at(t))
+    return hits / len(instants)
+
+
+def fixture_path(directory: str, duration: float, waveform: str = 'sine', sr: int = SAMPLE_RATE) -> str:
+    """
+    Caminho do fixture WAV (gerado na primeira chamada e reaproveitado depois)
+
+    Args:
+        directory: Diretório dos fixtures
+        duration: Duração em segundos
+        waveform: 'sine' ou 'saw'
+        sr: Taxa de amostragem
+
+    Returns:
+        Caminho do arquivo WAV
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'progression_{waveform}_{int(duration)}s_{sr}.wav')
+
+    if not os.path.exists(path):
+        y, _ = synth_progression(duration, waveform, sr)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        sf.write(tmp_path, y, sr, subtype='PCM_16', format='WAV')
+        os.replace(tmp_path, path)
+
+    return path
+
+
+class StubSeparator:
+    """
+    Substituto do spleeter Separator para benchmarks e testes de carga
+
+    Gera quatro "stems" determinísticos a partir do sinal (passa-baixa por
+    média móvel para o baixo, o resto dividido entre os demais) e pode
+    simular o tempo do modelo com uma espera proporcional à duração.
+    """
+
+    def __init__(self, seconds_per_minute: float = 0.0, fixed_delay: float = 0.0,
+                 sample_rate: int = SAMPLE_RATE):
+        """
+        Args:
+            seconds_per_minute: Espera simulada por minuto de áudio
+            fixed_delay: Espera fixa por chamada (segundos)
+            sample_rate: Taxa de amostragem dos sinais recebidos
+        """
+        self.seconds_per_minute = seconds_per_minute
+        self.fixed_delay = fixed_delay
+        self.sample_rate = sample_rate
+
+    def separate(self, waveform: np.ndarray, audio_descriptor: Optional[str] = None) -> Dict[str, np.ndarray]:
+        waveform = np.asarray(waveform, dtype=np.float32)
+
+        delay = self.fixed_delay + self.seconds_per_minute * len(waveform) / self.sample_rate / 60.0
+        if delay > 0:
+            time.sleep(delay)
+
+        # Média móvel de ~5 ms (cumsum): mantém graves, remove agudos
+        width = max(1, self.sample_rate // 200)
+        padded = np.concatenate([np.zeros((width, waveform.shape[1]), dtype=np.float64),
+                                 waveform.astype(np.float64)])
+        cumulative = np.cumsum(padded, axis=0)
+        low = ((cumulative[width:] - cumulative[:-width]) / width).astype(np.float32)
+        high = waveform - low
+
+        return {
+            'vocals': high * 0.3,
+            'drums': high * 0.1,
+            'bass': low,
+            'other': high * 0.6
+        }
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark do pipeline de áudio com fixtures sintéticos
+
+Mede cada etapa (extração de acordes, detecção, waveform, MP3), o fluxo
+completo de process_audio (com separador falso), o tempo de inicialização
+dos scripts e a regeneração de acordes em áudios sintéticos de várias
+durações. Cada medição roda em um processo novo, para que o pico de
+memória (RSS) seja o da etapa. Os resultados são acrescentados a um
+histórico JSON e duas execuções podem ser comparadas para achar regressões.
+
+Uso:
+    python3 benchmark.py run [--durations 30,120,300,1200] [--stages chords,mp3] [--compare]
+    python3 benchmark.py compare [--baseline -2] [--current -1] [--threshold 0.15]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import functools
+import multiprocessing
+
+from bench_fixtures import StubSeparator, chord_accuracy, fixture_path
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Local padrão do histórico e dos fixtures gerados
+DEFAULT_HISTORY = os.path.join(BASE_DIR, 'bench', 'history.json')
+DEFAULT_FIXTURES_DIR = os.path.join(BASE_DIR, 'bench', 'fixtures')
+
+# Durações padrão dos fixtures (segundos): de 30 s a 20 min
+DEFAULT_DURATIONS = [30, 120, 300, 1200]
+
+# Variação máxima aceita antes de marcar regressão (fração do valor de referência)
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_RSS_THRESHOLD = 0.20
+
+# Diferenças menores que isso (segundos) são consideradas ruído
+MIN_WALL_DELTA = 0.05
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Pico de memória residente (MB) do processo ou dos filhos já finalizados"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _load_analysis_signal(fixture, profile=None):
+    import librosa
+    from chord_analyzer import ChordAnalyzer
+
+    analyzer = ChordAnalyzer.from_profile(profile)
+    y, sr = librosa.load(fixture, sr=analyzer.sample_rate)
+    return analyzer, y, sr
+
+
+def prepare_chords(fixture, workdir, profile=None):
+    """ChordAnalyzer._extract_chords (chromagram + detecção) sobre o sinal já carregado"""
+    analyzer, y, sr = _load_analysis_signal(fixture, profile)
+    return lambda: analyzer._extract_chords(y, sr)
+
+
+def prepare_detect(fixture, workdir):
+    """ChordAnalyzer._detect_chord em cada segmento de um chromagram já calculado"""
+    analyzer, y, sr = _load_analysis_signal(fixture)
+    _, segments = analyzer._segment_chroma(analyzer.compute_chroma(y, sr), sr)
+    return lambda: [analyzer._detect_chord(segment) for segment in segments.T]
+
+
+def _load_stem(fixture):
+    """Fixture decodificado como um stem do Spleeter (float32, amostras x canais)"""
+    import soundfile as sf
+    y, _ = sf.read(fixture, dtype='float32', always_2d=True)
+    return y
+
+
+def _main_rendition():
+    """Rendition principal (MP3) de ENCODE_RENDITIONS"""
+    from process_audio import get_renditions
+    from stem_encoder import MAIN_RENDITION
+    return [rendition for rendition in get_renditions() if rendition['name'] == MAIN_RENDITION]
+
+
+def prepare_waveform(fixture, workdir):
+    """render_waveform como no pós-processamento: picos, PNG, peaks.json e pirâmide de um stem já decodificado"""
+    from process_audio import SAMPLE_RATE, render_waveform, waveform_outputs
+
+    y = _load_stem(fixture)
+    image, peaks_file, pyramid_file = waveform_outputs(workdir, 'other')
+    return lambda: render_waveform(y, SAMPLE_RATE, image, '#4CAF50', peaks_file, pyramid_file)
+
+
+def prepare_mp3(fixture, workdir):
+    """encode_stems: um stem só na rendition principal (MP3)"""
+    from process_audio import encode_stems
+
+    prediction = {'other': _load_stem(fixture)}
+    renditions = _main_rendition()
+    return lambda: encode_stems(prediction, workdir, renditions)
+
+
+def prepare_encode(fixture, workdir):
+    """encode_stems: 4 stems em todas as renditions de ENCODE_RENDITIONS com um único ffmpeg"""
+    from process_audio import STEMS, encode_stems, get_renditions
+
+    y = _load_stem(fixture)
+    prediction = {stem: y for stem in STEMS}
+    renditions = get_renditions()
+    return lambda: encode_stems(prediction, workdir, renditions)
+
+
+def prepare_features(fixture, workdir):
+    """FeatureExtractor.extract (uma STFT: chroma, RMS, onsets, batidas) sobre o sinal já carregado"""
+    from feature_extractor import FeatureExtractor
+
+    analyzer, y, sr = _load_analysis_signal(fixture)
+    extractor = FeatureExtractor(analyzer)
+    # Primeira chamada compila as funções numba do beat tracking (fora da medida)
+    extractor.extract(y[:sr * 5], sr)
+    return lambda: extractor.extract(y, sr)
+
+
+def prepare_process_audio(fixture, workdir):
+    """process_audio completo com StubSeparator, banco e DATA_DIR temporários"""
+    db_path = os.path.join(workdir, 'uploads.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE uploads (id INTEGER PRIMARY KEY, processing_status TEXT, processed_path TEXT)')
+    conn.execute("INSERT INTO uploads (id, processing_status) VALUES (1, 'queued')")
+    conn.commit()
+    conn.close()
+
+    # Definidas antes do import: o load_dotenv não sobrescreve variáveis existentes
+    os.environ['DATA_DIR'] = workdir
+    os.environ['DB_PATH'] = db_path
+    os.environ['PROCESSING_CACHE'] = 'false'
+
+    from process_audio import process_audio
+    separator = StubSeparator()
+    return lambda: process_audio(fixture, 1, separator)
+
+
+# Módulos importados pelos pontos de entrada (worker, regeneração, diagnóstico)
+STARTUP_MODULES = 'process_audio, chord_analyzer, regenerate_chords'
+
+
+def prepare_startup(fixture, workdir):
+    """Interpretador novo importando os módulos dos pontos de entrada (não depende da duração)"""
+    command = [sys.executable, '-c', f'import {STARTUP_MODULES}']
+    return lambda: subprocess.run(command, cwd=BASE_DIR, check=True, stdout=subprocess.DEVNULL)
+
+
+def prepare_regenerate(fixture, workdir):
+    """regenerate_chords.py em processo novo com o chromagram já salvo (latência do endpoint)"""
+    from process_audio import encode_stems
+    encode_stems({'other': _load_stem(fixture)}, workdir, _main_rendition())
+
+    command = [sys.executable, os.path.join(BASE_DIR, 'regenerate_chords.py'), workdir, 'other']
+    # Primeira execução calcula e salva o chromagram; a medida reaproveita
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+STAGES = {
+    'chords': prepare_chords,
+    'chords_fast': functools.partial(prepare_chords, profile='fast'),
+    'chords_accurate': functools.partial(prepare_chords, profile='accurate'),
+    'detect': prepare_detect,
+    'waveform': prepare_waveform,
+    'mp3': prepare_mp3,
+    'encode': prepare_encode,
+    'features': prepare_features,
+    'process_audio': prepare_process_audio,
+    'startup': prepare_startup,
+    'regenerate': prepare_regenerate,
+}
+
+
+# Etapas cujo resultado (eventos) é comparado com a progressão do fixture
+CHORD_STAGES = ('chords', 'chords_fast', 'chords_accurate')
+
+
+def _quiet_child():
+    """Descarta o stdout (logs do pipeline) no processo de medição"""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+
+def measure_stage(stage, fixture, workdir):
+    """
+    Executa uma etapa e mede tempo, CPU e memória (roda no processo filho)
+
+    A preparação (carregar o sinal, criar o analyzer...) fica fora do tempo
+    medido, mas entra no pico de memória, que é o do processo inteiro.
+    O cache de PCM fica no diretório temporário da medida, inclusive para os
+    subprocessos (regenerate, startup), que herdam o ambiente: load_pcm não
+    escreve em ./data/cache/pcm do repositório e cada medida começa sem cache.
+    """
+    os.environ['PCM_CACHE_DIR'] = os.path.join(workdir, 'pcm')
+    run = STAGES[stage](fixture, workdir)
+
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+
+    result = run()
+
+    wall = time.perf_counter() - wall_start
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (time.process_time() - cpu_start +
+           (children_end.ru_utime - children_start.ru_utime) +
+           (children_end.ru_stime - children_start.ru_stime))
+
+    if result is False:
+        raise RuntimeError(f"Etapa {stage} falhou")
+
+    measurement = {
+        'wall': round(wall, 6),
+        'cpu': round(cpu, 4),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'children_peak_rss_mb': round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+    }
+    if stage in CHORD_STAGES:
+        import soundfile as sf
+        measurement['accuracy'] = round(chord_accuracy(result, sf.info(fixture).duration), 4)
+    return measurement
+
+
+def run_measurement(stage, fixture, verbose=False):
+    """Mede uma etapa em um processo novo (spawn) com diretório de trabalho próprio"""
+    workdir = tempfile.mkdtemp(prefix=f'bench_{stage}_')
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Pool(1, initializer=None if verbose else _quiet_child) as pool:
+            return pool.apply(measure_stage, (stage, fixture, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'runs': []}
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_benchmarks(durations, stages, waveform='sine', repeat=1, fixtures_dir=DEFAULT_FIXTURES_DIR,
+                   label=None, verbose=False):
+    """
+    Executa as etapas em todas as durações
+
+    Com repeat > 1 fica o menor tempo e o maior pico de memória das repetições.
+
+    Returns:
+        Dicionário da execução (formato do histórico)
+    """
+    results = {}
+
+    for duration in durations:
+        print(f"Gerando fixture de {duration}s ({waveform})...")
+        fixture = fixture_path(fixtures_dir, duration, waveform)
+
+        for stage in stages:
+            samples = [run_measurement(stage, fixture, verbose) for _ in range(repeat)]
+            best = min(samples, key=lambda sample: sample['wall'])
+            best['peak_rss_mb'] = max(sample['peak_rss_mb'] for sample in samples)
+            best['audio_seconds'] = duration
+            results[f'{stage}@{duration}s'] = best
+
+            accuracy = f"  acurácia {best['accuracy']:.1%}" if 'accuracy' in best else ''
+            print(f"  {stage:<16} {duration:>5}s  wall {best['wall']:9.3f}s  cpu {best['cpu']:8.2f}s  "
+                  f"rss {best['peak_rss_mb']:7.0f} MB  ({duration / best['wall']:.1f}x tempo real){accuracy}")
+
+        print_profile_costs(results, duration)
+
+    return {
+        'id': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': label,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': {'node': platform.node(), 'cpus': os.cpu_count(), 'platform': platform.platform()},
+        'waveform': waveform,
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def print_profile_costs(results, duration):
+    """Custo de cada perfil de análise relativo ao padrão ('chords') na mesma duração"""
+    base = results.get(f'chords@{duration}s')
+    if not base or base['wall'] <= 0:
+        return
+
+    for stage in CHORD_STAGES[1:]:
+        result = results.get(f'{stage}@{duration}s')
+        if result:
+            print(f"    {stage} custa {result['wall'] / base['wall']:.2f}x o perfil padrão "
+                  f"(acurácia {result['accuracy']:.1%} vs {base['accuracy']:.1%})")
+
+
+def find_run(history, ref):
+    """Localiza uma execução por índice (ex: -1), id ou label"""
+    runs = history['runs']
+    try:
+        return runs[int(ref)]
+    except (ValueError, IndexError):
+        pass
+
+    for run in reversed(runs):
+        if ref in (run.get('id'), run.get('label')):
+            return run
+    return None
+
+
+def compare_runs(baseline, current, threshold=DEFAULT_THRESHOLD, rss_threshold=DEFAULT_RSS_THRESHOLD):
+    """
+    Compara duas execuções e imprime a diferença de cada medição
+
+    Returns:
+        Lista de medições com regressão (tempo ou memória)
+    """
+    regressions = []
+    print(f"Referência: {baseline['id']} ({baseline.get('label') or baseline.get('commit') or '-'})")
+    print(f"Atual:      {current['id']} ({current.get('label') or current.get('commit') or '-'})")
+    print(f"{'medição':<24} {'ref (s)':>9} {'atual (s)':>10} {'tempo':>8} {'rss':>8}")
+
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if not base:
+            print(f"{key:<24} {'-':>9} {result['wall']:>10.2f}    (nova)")
+            continue
+
+        wall_change = (result['wall'] - base['wall']) / base['wall'] if base['wall'] > 0 else 0.0
+        rss_change = ((result['peak_rss_mb'] - base['peak_rss_mb']) / base['peak_rss_mb']
+                      if base['peak_rss_mb'] > 0 else 0.0)
+
+        flags = []
+        if wall_change > threshold and result['wall'] - base['wall'] > MIN_WALL_DELTA:
+            flags.append('REGRESSÃO (tempo)')
+        if rss_change > rss_threshold:
+            flags.append('REGRESSÃO (memória)')
+        if flags:
+            regressions.append(key)
+        elif wall_change < -threshold and base['wall'] - result['wall'] > MIN_WALL_DELTA:
+            flags.append('melhora')
+
+        print(f"{key:<24} {base['wall']:>9.2f} {result['wall']:>10.2f} {wall_change:>+8.0%} "
+              f"{rss_change:>+8.0%}  {' '.join(flags)}")
+
+    if regressions:
+        print(f"\n✗ {len(regressions)} regressão(ões): {', '.join(regressions)}")
+    else:
+        print("\n✓ Nenhuma regressão")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline de áudio')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='Arquivo JSON do histórico')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Executa os benchmarks e salva no histórico')
+    run_parser.add_argument('--durations', default=','.join(str(d) for d in DEFAULT_DURATIONS),
+                            help='Durações dos fixtures em segundos (separadas por vírgula)')
+    run_parser.add_argument('--stages', default=','.join(STAGES),
+                            help=f"Etapas (separadas por vírgula): {', '.join(STAGES)}")
+    run_parser.add_argument('--waveform', default='sine', choices=['sine', 'saw'])
+    run_parser.add_argument('--repeat', type=int, default=1, help='Repetições de cada medição')
+    run_parser.add_argument('--label', help='Nome da execução no histórico')
+    run_parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES_DIR)
+    run_parser.add_argument('--compare', action='store_true', help='Compara com a execução anterior')
+    run_parser.add_argument('--verbose', action='store_true', help='Mostra os logs das etapas')
+
+    for subparser in (run_parser, subparsers.add_parser('compare', help='Compara duas execuções do histórico')):
+        subparser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                               help='Aumento de tempo tolerado (fração, padrão 0.15)')
+        subparser.add_argument('--rss-threshold', type=float, default=DEFAULT_RSS_THRESHOLD,
+                               help='Aumento de memória tolerado (fração, padrão 0.20)')
+    compare_parser = subparsers.choices['compare']
+    compare_parser.add_argument('--baseline', default='-2', help='Execução de referência (índice, id ou label)')
+    compare_parser.add_argument('--current', default='-1', help='Execução comparada (índice, id ou label)')
+
+    args = parser.parse_args()
+    history = load_history(args.history)
+
+    if args.command == 'run':
+        stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+        unknown = [stage for stage in stages if stage not in STAGES]
+        if unknown:
+            parser.error(f"etapa(s) desconhecida(s): {', '.join(unknown)}")
+        durations = [int(d) for d in args.durations.split(',') if d.strip()]
+
+        run = run_benchmarks(durations, stages, args.waveform, max(1, args.repeat),
+                             args.fixtures_dir, args.label, args.verbose)
+        history['runs'].append(run)
+        save_history(args.history, history)
+        print(f"\nResultados salvos em {args.history} ({run['id']})")
+
+        if args.compare and len(history['runs']) > 1:
+            print()
+            regressions = compare_runs(history['runs'][-2], run, args.threshold, args.rss_threshold)
+            return 1 if regressions else 0
+        return 0
+
+    baseline = find_run(history, args.baseline)
+    current = find_run(history, args.current)
+    if not baseline or not current:
+        print(f"Execução não encontrada no histórico {args.history}")
+        return 2
+
+    return 1 if compare_runs(baseline, current, args.threshold, args.rss_threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,10 +5,79 @@ Chord Analyzer Module - Extrai acordes e notas de arquivos de áudio usando Libr
 Integrado ao MusicLearningHelper para sincronização com TrackSwitch player
 """
 
-import librosa
-import numpy as np
+import os
 import json
-from typing import Dict, List, Tuple, Optional
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from typing import Dict, Iterator, List, Sequence, Tuple, Optional, Union
+
+from chord_timeline import PartialTimelineWriter, write_timeline
+
+
+# Subdiretório (dentro do diretório do upload) com os chromagrams salvos
+FEATURES_DIR = 'features'
+
+# Perfis de análise: tipo de chromagram, taxa de amostragem e resolução temporal.
+# 'fast' troca precisão por velocidade (regeneração em lote, prévias): chroma
+# STFT a 11 kHz com frames de 46 ms; 'standard' é o comportamento original
+# (CQT, 23 ms); 'accurate' usa CQT com frames de 12 ms. O hop precisa manter
+# os segmentos de ~2 s: com hop 1024 a 11 kHz eles ficam com 1,95 s e escorregam
+# em relação ao compasso
+ANALYSIS_PROFILES = {
+    'fast': {'chroma_type': 'stft', 'sample_rate': 11025, 'hop_length': 512, 'frame_size': 2048},
+    'standard': {'chroma_type': 'cqt', 'sample_rate': 22050, 'hop_length': 512, 'frame_size': 2048},
+    'accurate': {'chroma_type': 'cqt', 'sample_rate': 22050, 'hop_length': 256, 'frame_size': 2048},
+}
+DEFAULT_PROFILE = 'standard'
+
+
+# Resoluções extras da linha do tempo, calculadas junto com os eventos
+# principais: (janela, passo) em segundos. Um passo menor que a janela gera
+# janelas deslizantes (sobrepostas), centradas em cada passo
+TIMELINE_RESOLUTIONS = ((0.5, 0.5), (1.0, 1.0), (2.0, 2.0))
+
+
+def frame_times(n_frames: int, sr: int, hop_length: int) -> np.ndarray:
+    """Tempo (segundos) do início de cada frame"""
+    return np.arange(n_frames) * hop_length / float(sr)
+
+
+def prefix_sums(chroma: np.ndarray) -> np.ndarray:
+    """
+    Somas acumuladas do chromagram ao longo dos frames
+
+    Returns:
+        Matriz (12, frames + 1) float64; a soma dos frames [a, b) é
+        prefix[:, b] - prefix[:, a]
+    """
+    prefix = np.zeros((chroma.shape[0], chroma.shape[1] + 1))
+    np.cumsum(chroma, axis=1, dtype=np.float64, out=prefix[:, 1:])
+    return prefix
+
+
+def window_means(prefix: np.ndarray, window_frames: int, hop_frames: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Média do chromagram em janelas de qualquer tamanho e passo, em O(frames)
+
+    Os passos começam a cada hop_frames e a janela fica centrada no passo
+    (cortada nas bordas). Com janela igual ao passo, são segmentos
+    consecutivos sem sobreposição.
+
+    Args:
+        prefix: Somas acumuladas (ver prefix_sums)
+        window_frames: Tamanho da janela em frames (>= hop_frames)
+        hop_frames: Passo em frames
+
+    Returns:
+        Tupla (frame inicial de cada passo, matriz (12, passos))
+    """
+    n_frames = prefix.shape[1] - 1
+    starts = np.arange(0, n_frames, hop_frames)
+    offset = (hop_frames - window_frames) // 2
+    lo = np.clip(starts + offset, 0, n_frames)
+    hi = np.clip(starts + offset + window_frames, 0, n_frames)
+    return starts, (prefix[:, hi] - prefix[:, lo]) / (hi - lo)
 
 
 class ChordAnalyzer:
@@ -34,45 +103,243 @@ class ChordAnalyzer:
         'sus4': [0, 5, 7],            # Suspenso 4ª
     }
 
-    def __init__(self, hop_length: int = 512, frame_size: int = 2048):
+    # Confiança mínima para registrar um evento de acorde
+    MIN_CONFIDENCE = 0.3
+
+    # Pesos da análise combinada (stem='all'): 'root' indica quanto o stem
+    # contribui para a escolha da fundamental e 'quality' para o tipo do acorde
+    FUSION_WEIGHTS = {
+        'bass': {'root': 1.0, 'quality': 0.2},
+        'other': {'root': 0.4, 'quality': 1.0},
+        'vocals': {'root': 0.1, 'quality': 0.5},
+    }
+
+    # Peso da fundamental (vinda principalmente do baixo) na escolha do acorde
+    ROOT_EMPHASIS = 0.25
+
+    def __init__(self, hop_length: int = 512, frame_size: int = 2048,
+                 segment_duration: float = 2.0, chroma_type: str = 'cqt',
+                 sample_rate: int = 22050, profile: Optional[str] = None,
+                 resolutions: Optional[Sequence[Tuple[float, float]]] = None):
         """
         Inicializa o analisador de acordes
 
         Args:
             hop_length: Tamanho do salto entre frames (afeta resolução temporal)
-            frame_size: Tamanho da janela de análise
+            frame_size: Tamanho da janela de análise (n_fft do chroma STFT)
+            segment_duration: Duração (segundos) de cada segmento avaliado
+            chroma_type: 'cqt' (mais preciso) ou 'stft' (mais rápido)
+            sample_rate: Taxa de amostragem padrão da análise
+            profile: Nome do perfil (registrado no resultado; ver from_profile)
+            resolutions: Linhas do tempo extras como (janela, passo) em segundos
+                         (None = TIMELINE_RESOLUTIONS; vazio desativa)
         """
+        if chroma_type not in ('cqt', 'stft'):
+            raise ValueError(f"Tipo de chromagram inválido: {chroma_type}")
+
+        resolutions = TIMELINE_RESOLUTIONS if resolutions is None else resolutions
+        resolutions = tuple((float(window), float(hop)) for window, hop in resolutions)
+        for window, hop in resolutions:
+            if not 0 < hop <= window:
+                raise ValueError(f"Resolução inválida: janela {window}s, passo {hop}s")
+
         self.hop_length = hop_length
         self.frame_size = frame_size
+        self.segment_duration = segment_duration
+        self.chroma_type = chroma_type
+        self.sample_rate = sample_rate
+        self.profile = profile
+        self.resolutions = resolutions
+
+        # Matriz de templates (12 fundamentais x N tipos) montada uma única vez
+        self._templates, self._template_names = self._build_template_matrix()
+        self._template_roots = np.tile(np.arange(12), len(self.CHORD_TEMPLATES))
+
+    @classmethod
+    def from_profile(cls, profile: Optional[str] = None, segment_duration: float = 2.0,
+                     resolutions: Optional[Sequence[Tuple[float, float]]] = None) -> 'ChordAnalyzer':
+        """
+        Cria um analisador a partir de um perfil de ANALYSIS_PROFILES
+
+        Args:
+            profile: 'fast', 'standard' ou 'accurate' (None = DEFAULT_PROFILE)
+            segment_duration: Duração (segundos) de cada segmento avaliado
+            resolutions: Linhas do tempo extras (ver __init__)
 
-    def analyze_audio_file(self, audio_path: str, sr: int = 22050) -> Dict:
+        Raises:
+            ValueError: Se o perfil não existir
+        """
+        profile = profile or DEFAULT_PROFILE
+        if profile not in ANALYSIS_PROFILES:
+            raise ValueError(f"Perfil de análise inválido: {profile} "
+                             f"(válidos: {', '.join(ANALYSIS_PROFILES)})")
+        return cls(segment_duration=segment_duration, profile=profile, resolutions=resolutions,
+                   **ANALYSIS_PROFILES[profile])
+
+    def _result_info(self, sr: int) -> Dict:
+        """Parâmetros da análise registrados junto dos eventos"""
+        return {
+            'sample_rate': sr,
+            'hop_length': self.hop_length,
+            'chroma_type': self.chroma_type,
+            'profile': self.profile
+        }
+
+    @classmethod
+    def _build_template_matrix(cls) -> Tuple[np.ndarray, List[str]]:
+        """
+        Monta a matriz com todos os templates de acordes em todas as fundamentais
+
+        Cada linha é centralizada e normalizada, de modo que o produto escalar
+        com um chroma também centralizado e normalizado é a correlação de Pearson.
+
+        Returns:
+            Tupla (matriz (12 * N, 12), nomes dos acordes de cada linha)
+        """
+        rows = []
+        names = []
+
+        for chord_type, intervals in cls.CHORD_TEMPLATES.items():
+            for root_idx in range(12):
+                template = np.zeros(12)
+                template[[(root_idx + interval) % 12 for interval in intervals]] = 1.0
+                rows.append(template)
+                names.append(cls._chord_name(cls.NOTE_NAMES[root_idx], chord_type))
+
+        templates = np.array(rows)
+        templates -= templates.mean(axis=1, keepdims=True)
+        templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+
+        return templates, names
+
+    @staticmethod
+    def _chord_name(root_note: str, chord_type: str) -> str:
+        """Constrói o nome do acorde a partir da fundamental e do tipo"""
+        if chord_type == 'major':
+            return root_note
+        if chord_type == 'minor':
+            return f"{root_note}m"
+        return f"{root_note}{chord_type}"
+
+    def analyze_audio_file(self, audio_path: str, sr: Optional[int] = None) -> Dict:
         """
         Analisa um arquivo de áudio e extrai acordes com timestamps
 
         Args:
             audio_path: Caminho para o arquivo de áudio
-            sr: Taxa de amostragem (sample rate)
+            sr: Taxa de amostragem (None = a do perfil)
 
         Returns:
             Dicionário com duração e lista de eventos de acordes
         """
         try:
-            # Carrega o arquivo de áudio
-            y, sr = librosa.load(audio_path, sr=sr)
+            # Carrega o arquivo de áudio (do cache de PCM quando já decodificado)
+            from pcm_cache import load_pcm
+            y, sr = load_pcm(audio_path, sr=sr or self.sample_rate)
+
+            return self._analyze(y, sr)
+
+        except Exception as e:
+            print(f"Erro ao analisar áudio: {str(e)}")
+            return {
+                'duration': 0.0,
+                'events': [],
+                'error': str(e)
+            }
 
-            # Calcula a duração total
-            duration = librosa.get_duration(y=y, sr=sr)
+    def stream_audio_file(self, audio_path: str, sr: Optional[int] = None, block_seconds: float = 30.0,
+                          partial_path: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Analisa um arquivo de áudio em blocos, produzindo cada evento assim que
+        o segmento correspondente é decidido
 
-            # Extrai acordes
-            events = self._extract_chords(y, sr)
+        O valor de retorno do gerador (StopIteration.value, ou o resultado de
+        'yield from') é o dicionário completo, igual ao de analyze_chroma.
 
+        Args:
+            audio_path: Caminho para o arquivo de áudio
+            sr: Taxa de amostragem da análise (None = a do perfil)
+            block_seconds: Duração de cada bloco decodificado
+            partial_path: Arquivo NDJSON onde os eventos são acrescentados (opcional)
+
+        Yields:
+            Eventos {'time', 'chord', 'confidence'} em ordem
+        """
+        stream = ChordStream(self, sr=sr, partial_path=partial_path)
+        try:
+            for block in iter_audio_blocks(audio_path, stream.sr, block_seconds):
+                yield from stream.push(block)
+            yield from stream.finish()
+        finally:
+            stream.close()
+        return stream.result()
+
+    def analyze_signal(self, y: np.ndarray, source_sr: int, sr: Optional[int] = None) -> Dict:
+        """
+        Analisa um sinal já decodificado (ex: stem separado em memória),
+        evitando decodificar novamente um arquivo do disco
+
+        Args:
+            y: Sinal de áudio mono (amostras,) ou multicanal (amostras, canais)
+            source_sr: Taxa de amostragem do sinal recebido
+            sr: Taxa de amostragem usada na análise (None = a do perfil)
+
+        Returns:
+            Dicionário com duração e lista de eventos de acordes
+        """
+        sr = sr or self.sample_rate
+        try:
+            return self._analyze(self._prepare_signal(y, source_sr, sr), sr)
+
+        except Exception as e:
+            print(f"Erro ao analisar áudio: {str(e)}")
             return {
-                'duration': float(duration),
-                'events': events,
-                'sample_rate': sr,
-                'hop_length': self.hop_length
+                'duration': 0.0,
+                'events': [],
+                'error': str(e)
             }
 
+    @staticmethod
+    def _prepare_signal(y: np.ndarray, source_sr: int, sr: int) -> np.ndarray:
+        """Converte o sinal para mono float32 na taxa de análise"""
+        y = np.asarray(y, dtype=np.float32)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+
+        if source_sr != sr:
+            import librosa
+            y = librosa.resample(y, orig_sr=source_sr, target_sr=sr)
+
+        return y
+
+    def analyze_stem(self, stem: str, source: Union[str, np.ndarray], sr: Optional[int] = None,
+                     source_sr: Optional[int] = None, store: Optional['ChromaStore'] = None,
+                     chroma: Optional[Tuple[np.ndarray, Optional[np.ndarray], float]] = None) -> Dict:
+        """
+        Analisa um stem reaproveitando o chromagram salvo em disco quando possível
+
+        Com um ChromaStore, o chromagram do stem é lido do disco (se foi
+        calculado antes com a mesma taxa de amostragem e hop_length) e apenas a
+        segmentação e a comparação com os templates são refeitas. Quando o
+        chromagram é calculado, ele é salvo para as próximas análises.
+
+        Args:
+            stem: Nome do stem ('vocals', 'drums', 'bass', 'other')
+            source: Caminho do arquivo do stem ou array já decodificado
+            sr: Taxa de amostragem usada na análise (None = a do perfil)
+            source_sr: Taxa de amostragem do array recebido (quando não é caminho)
+            store: ChromaStore do upload (None para não usar o cache de features)
+            chroma: Chromagram já calculado (chromagram, tempos ou None, duração),
+                    ex: pelo FeatureExtractor; dispensa o cálculo
+
+        Returns:
+            Dicionário com duração e lista de eventos de acordes
+        """
+        sr = sr or self.sample_rate
+        try:
+            chroma, times, duration = chroma or self.stem_chroma(stem, source, sr, source_sr, store)
+            return self.analyze_chroma(chroma, sr, duration, times)
+
         except Exception as e:
             print(f"Erro ao analisar áudio: {str(e)}")
             return {
@@ -81,6 +348,63 @@ class ChordAnalyzer:
                 'error': str(e)
             }
 
+    def stem_chroma(self, stem: str, source: Union[str, np.ndarray], sr: Optional[int] = None,
+                    source_sr: Optional[int] = None,
+                    store: Optional['ChromaStore'] = None) -> Tuple[np.ndarray, Optional[np.ndarray], float]:
+        """
+        Obtém o chromagram de um stem (do ChromaStore ou calculando)
+
+        Args:
+            stem: Nome do stem
+            source: Caminho do arquivo do stem ou array já decodificado
+            sr: Taxa de amostragem usada na análise (None = a do perfil)
+            source_sr: Taxa de amostragem do array recebido (quando não é caminho)
+            store: ChromaStore do upload (None para não usar o cache de features)
+
+        Returns:
+            Tupla (chromagram (12, frames), tempos dos frames ou None, duração)
+        """
+        sr = sr or self.sample_rate
+        source_path = source if isinstance(source, str) else None
+
+        # Arrays vêm de uma separação nova: o chromagram salvo não vale para eles
+        if store is not None and source_path:
+            cached = store.load(stem, sr, self.hop_length, source_path, kind=self.chroma_type)
+            if cached is not None:
+                print(f"Chromagram de '{stem}' reaproveitado de {store.directory}")
+                return cached
+
+        if source_path:
+            from pcm_cache import load_pcm
+            y, sr = load_pcm(source_path, sr=sr)
+        else:
+            y = self._prepare_signal(source, source_sr or sr, sr)
+
+        chroma = self.compute_chroma(y, sr)
+        duration = len(y) / sr
+
+        if store is not None:
+            store.save(stem, sr, self.hop_length, chroma, duration, source_path, kind=self.chroma_type)
+
+        return chroma, None, duration
+
+    def _analyze(self, y: np.ndarray, sr: int) -> Dict:
+        """
+        Extrai acordes de um sinal mono já na taxa de análise
+
+        Args:
+            y: Sinal de áudio mono
+            sr: Taxa de amostragem
+
+        Returns:
+            Dicionário com duração e lista de eventos de acordes
+        """
+        # Calcula a duração total
+        import librosa
+        duration = librosa.get_duration(y=y, sr=sr)
+
+        return self.analyze_chroma(self.compute_chroma(y, sr), sr, duration)
+
     def _extract_chords(self, y: np.ndarray, sr: int) -> List[Dict]:
         """
         Extrai acordes do sinal de áudio
@@ -92,100 +416,241 @@ class ChordAnalyzer:
         Returns:
             Lista de eventos de acordes com timestamps
         """
-        # Calcula o chromagram (representação das 12 notas cromáticas)
-        chroma = librosa.feature.chroma_cqt(
+        return self._events_from_chroma(self.compute_chroma(y, sr), sr)
+
+    def compute_chroma(self, y: np.ndarray, sr: int, tuning: Optional[float] = None) -> np.ndarray:
+        """
+        Calcula o chromagram (representação das 12 notas cromáticas)
+
+        Args:
+            y: Sinal de áudio mono
+            sr: Taxa de amostragem
+            tuning: Desvio de afinação (frações de semitom); None estima a partir do sinal
+
+        Returns:
+            Matriz (12, frames)
+        """
+        import librosa
+        if self.chroma_type == 'stft':
+            return librosa.feature.chroma_stft(
+                y=y,
+                sr=sr,
+                hop_length=self.hop_length,
+                n_fft=self.frame_size,
+                n_chroma=12,
+                tuning=tuning
+            )
+        return librosa.feature.chroma_cqt(
             y=y,
             sr=sr,
             hop_length=self.hop_length,
-            n_chroma=12
+            n_chroma=12,
+            tuning=tuning
         )
 
-        # Calcula o tempo de cada frame
-        times = librosa.frames_to_time(
-            np.arange(chroma.shape[1]),
-            sr=sr,
-            hop_length=self.hop_length
-        )
+    def analyze_chroma(self, chroma: np.ndarray, sr: int, duration: float,
+                       times: Optional[np.ndarray] = None) -> Dict:
+        """
+        Extrai acordes de um chromagram já calculado (ex: por ChromaStream ou ChromaStore)
 
-        # Agrupa frames em segmentos (~2 segundos)
-        frames_per_segment = int(2.0 * sr / self.hop_length)
+        Args:
+            chroma: Matriz (12, frames)
+            sr: Taxa de amostragem usada no chromagram
+            duration: Duração do áudio em segundos
+            times: Tempo de cada frame (None calcula a partir de hop_length)
 
-        events = []
-        current_chord = None
-        segment_start_time = 0.0
+        Returns:
+            Dicionário com duração, lista de eventos de acordes e as linhas do
+            tempo em outras resoluções ('resolutions')
+        """
+        events, resolutions = self._timeline_events(chroma, sr, times)
+        return dict({
+            'duration': float(duration),
+            'events': events,
+            'resolutions': resolutions
+        }, **self._result_info(sr))
+
+    def _events_from_chroma(self, chroma: np.ndarray, sr: int,
+                            times: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Converte um chromagram em eventos de acordes
+
+        Args:
+            chroma: Matriz (12, frames)
+            sr: Taxa de amostragem usada no chromagram
+            times: Tempo de cada frame (None calcula a partir de hop_length)
+
+        Returns:
+            Lista de eventos de acordes com timestamps
+        """
+        events, _ = self._timeline_events(chroma, sr, times, resolutions=())
+        return events
+
+    def _frames(self, seconds: float, sr: int) -> int:
+        """Quantidade de frames em um intervalo (mínimo 1)"""
+        return max(1, int(seconds * sr / self.hop_length))
 
-        for i in range(0, chroma.shape[1], frames_per_segment):
-            # Pega o segmento atual
-            end_idx = min(i + frames_per_segment, chroma.shape[1])
-            segment_chroma = chroma[:, i:end_idx]
+    def _timeline_events(self, chroma: np.ndarray, sr: int, times: Optional[np.ndarray] = None,
+                         root_chroma: Optional[np.ndarray] = None,
+                         resolutions: Optional[Sequence[Tuple[float, float]]] = None
+                         ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Eventos na resolução principal (segment_duration) e em outras resoluções
+
+        As somas acumuladas do chromagram são calculadas uma única vez: a média
+        de qualquer janela sai de uma subtração, então cada resolução extra
+        custa O(frames), e os segmentos de todas elas passam por um único
+        _detect_chords.
+
+        Args:
+            chroma: Matriz (12, frames)
+            sr: Taxa de amostragem usada no chromagram
+            times: Tempo de cada frame (None calcula a partir de hop_length)
+            root_chroma: Matriz (12, frames) com a evidência da fundamental (análise combinada)
+            resolutions: (janela, passo) em segundos (None = self.resolutions)
 
-            # Média do chromagram no segmento
-            avg_chroma = np.mean(segment_chroma, axis=1)
+        Returns:
+            Tupla (eventos principais, [{'window', 'hop', 'events'}, ...])
+        """
+        resolutions = self.resolutions if resolutions is None else resolutions
+        # Calcula o tempo de cada frame (mesmo resultado de librosa.frames_to_time)
+        if times is None:
+            times = frame_times(chroma.shape[1], sr, self.hop_length)
 
-            # Normaliza
-            if np.max(avg_chroma) > 0:
-                avg_chroma = avg_chroma / np.max(avg_chroma)
+        main = self._frames(self.segment_duration, sr)
+        grids = [(main, main)] + [(self._frames(window, sr), self._frames(hop, sr))
+                                  for window, hop in resolutions]
+        unique = list(dict.fromkeys(grids))
 
-            # Detecta acorde e confiança
-            chord, confidence = self._detect_chord(avg_chroma)
+        prefix = prefix_sums(chroma)
+        root_prefix = prefix_sums(root_chroma) if root_chroma is not None else None
+
+        # Segmentos de todas as resoluções empilhados para uma única detecção
+        segments = []
+        for window_frames, hop_frames in unique:
+            starts, means = window_means(prefix, window_frames, hop_frames)
+            roots = window_means(root_prefix, window_frames, hop_frames)[1] if root_prefix is not None else None
+            segments.append((starts, means, roots))
+
+        if chroma.shape[1] > 0:
+            chord_ids, confidences = self._detect_chords(
+                np.concatenate([means for _, means, _ in segments], axis=1).T,
+                np.concatenate([roots for _, _, roots in segments], axis=1).T if root_prefix is not None else None
+            )
+
+        timelines = {}
+        offset = 0
+        for grid, (starts, _, _) in zip(unique, segments):
+            end = offset + len(starts)
+            timelines[grid] = self._events_from_segments(starts, chord_ids[offset:end],
+                                                         confidences[offset:end], times) if len(starts) else []
+            offset = end
+
+        return timelines[grids[0]], [{'window': window, 'hop': hop, 'events': timelines[grid]}
+                                     for (window, hop), grid in zip(resolutions, grids[1:])]
+
+    def _segment_chroma(self, chroma: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Agrupa frames em segmentos (~2 segundos) e calcula a média de cada um
+
+        Returns:
+            Tupla (frame inicial de cada segmento, matriz (12, segmentos))
+        """
+        frames_per_segment = self._frames(self.segment_duration, sr)
+        return window_means(prefix_sums(chroma), frames_per_segment, frames_per_segment)
+
+    def _events_from_segments(self, starts: np.ndarray, chord_ids: np.ndarray,
+                              confidences: np.ndarray, times: np.ndarray,
+                              current_chord: Optional[str] = None) -> List[Dict]:
+        """
+        Converte os acordes detectados por segmento em eventos (apenas nas mudanças)
+
+        current_chord é o acorde em vigor antes do primeiro segmento (análise em blocos).
+        """
+        events = []
+
+        for i, chord_id, confidence in zip(starts, chord_ids, confidences):
+            # Segmentos sem conteúdo harmônico (ex: silêncio) não geram evento
+            if chord_id < 0:
+                continue
+
+            chord = self._template_names[chord_id]
 
             # Só adiciona se mudou de acorde ou é o primeiro
-            if chord != current_chord and confidence > 0.3:
+            if chord != current_chord and confidence > self.MIN_CONFIDENCE:
                 events.append({
                     'time': float(times[i]),
                     'chord': chord,
                     'confidence': float(confidence)
                 })
                 current_chord = chord
-                segment_start_time = times[i]
 
         return events
 
-    def _detect_chord(self, chroma: np.ndarray) -> Tuple[str, float]:
+    def _detect_chords(self, chromas: np.ndarray,
+                       root_salience: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Detecta o acorde mais provável a partir de um chromagram
+        Detecta o acorde mais provável de vários chromas de uma só vez
+
+        Todos os templates (em todas as fundamentais) são comparados com todos
+        os segmentos em um único produto de matrizes.
 
         Args:
-            chroma: Vetor de 12 dimensões com intensidade de cada nota
+            chromas: Matriz (segmentos, 12) com a intensidade de cada nota
+            root_salience: Matriz (segmentos, 12) com a evidência de cada
+                           fundamental (ex: chroma do baixo); favorece acordes
+                           cuja fundamental é a nota mais presente
 
         Returns:
-            Tupla (nome_do_acorde, confiança)
+            Tupla (índices dos acordes em self._template_names, confianças).
+            Segmentos sem variação (ex: silêncio) recebem índice -1.
         """
-        # Encontra a nota fundamental (nota mais forte)
-        root_idx = np.argmax(chroma)
-        root_note = self.NOTE_NAMES[root_idx]
+        # Centraliza e normaliza cada segmento (correlação de Pearson)
+        centered = chromas - chromas.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(centered, axis=1)
+        valid = norms > 1e-10
+        centered[valid] /= norms[valid, np.newaxis]
 
-        best_match = 'major'
-        best_score = 0.0
+        scores = centered @ self._templates.T
 
-        # Testa cada template de acorde
-        for chord_type, intervals in self.CHORD_TEMPLATES.items():
-            # Cria o template rotacionado para a nota fundamental
-            template = np.zeros(12)
-            for interval in intervals:
-                template[(root_idx + interval) % 12] = 1.0
+        if root_salience is None:
+            chord_ids = np.argmax(scores, axis=1)
+        else:
+            # Fundamental normalizada em [0, 1] por segmento, somada ao score de cada template
+            peaks = root_salience.max(axis=1, keepdims=True)
+            roots = np.divide(root_salience, peaks, out=np.zeros_like(root_salience), where=peaks > 1e-10)
+            combined = ((1.0 - self.ROOT_EMPHASIS) * scores +
+                        self.ROOT_EMPHASIS * roots[:, self._template_roots])
+            chord_ids = np.argmax(combined, axis=1)
 
-            # Calcula similaridade (correlação)
-            score = np.corrcoef(chroma, template)[0, 1]
+        best_scores = scores[np.arange(len(chord_ids)), chord_ids]
 
-            if score > best_score:
-                best_score = score
-                best_match = chord_type
+        # Confiança baseada no score (normalizado)
+        confidences = np.clip((best_scores + 1) / 2, 0.0, 1.0)
+        chord_ids[~valid] = -1
+        confidences[~valid] = 0.0
 
-        # Constrói nome do acorde
-        if best_match == 'major':
-            chord_name = root_note
-        elif best_match == 'minor':
-            chord_name = f"{root_note}m"
-        else:
-            chord_name = f"{root_note}{best_match}"
+        return chord_ids, confidences
 
-        # Confiança baseada no score (normalizado)
-        confidence = min(1.0, max(0.0, (best_score + 1) / 2))
+    def _detect_chord(self, chroma: np.ndarray) -> Tuple[str, float]:
+        """
+        Detecta o acorde mais provável a partir de um chromagram
 
-        return chord_name, confidence
+        Args:
+            chroma: Vetor de 12 dimensões com intensidade de cada nota
 
-    def analyze_stems(self, stems_paths: Dict[str, str], sr: int = 22050) -> Dict:
+        Returns:
+            Tupla (nome_do_acorde, confiança)
+        """
+        chord_ids, confidences = self._detect_chords(np.asarray(chroma, dtype=float)[np.newaxis, :])
+        if chord_ids[0] < 0:
+            return self.NOTE_NAMES[0], 0.0
+        return self._template_names[chord_ids[0]], float(confidences[0])
+
+    def analyze_stems(self, stems_paths: Dict[str, Union[str, np.ndarray]], sr: Optional[int] = None,
+                      source_sr: Optional[int] = None, store: Optional['ChromaStore'] = None,
+                      profile: Optional[str] = None,
+                      chromas: Optional[Dict[str, Tuple[np.ndarray, Optional[np.ndarray], float]]] = None) -> Dict:
         """
         Analisa múltiplos stems e combina os resultados
         Útil para análise mais precisa usando stems separados do Spleeter
@@ -193,17 +658,32 @@ class ChordAnalyzer:
         Args:
             stems_paths: Dicionário com tipo de stem e caminho do arquivo
                         Ex: {'vocals': 'path/vocals.mp3', 'other': 'path/other.mp3'}
-            sr: Taxa de amostragem
+                        Também aceita arrays já decodificados no lugar dos caminhos
+            sr: Taxa de amostragem (None = a do perfil)
+            source_sr: Taxa de amostragem dos arrays recebidos (quando não são caminhos)
+            store: ChromaStore para reaproveitar/salvar os chromagrams dos stems
+            profile: Perfil de análise ('fast', 'standard', 'accurate'); None usa o
+                     deste analisador
+            chromas: Chromagrams já calculados por stem (ver analyze_stem), na
+                     taxa e hop deste analisador
 
         Returns:
             Dicionário com acordes combinados
         """
+        if profile and profile != self.profile:
+            # Chromagrams recebidos são do perfil deste analisador: não servem para o outro
+            analyzer = ChordAnalyzer.from_profile(profile, self.segment_duration, self.resolutions)
+            return analyzer.analyze_stems(stems_paths, sr, source_sr, store)
+
+        chromas = chromas or {}
+
         # Prioriza o stem 'other' (harmonia) para detecção de acordes
         priority_order = ['other', 'bass', 'vocals', 'drums']
 
         for stem_type in priority_order:
             if stem_type in stems_paths:
-                result = self.analyze_audio_file(stems_paths[stem_type], sr)
+                result = self.analyze_stem(stem_type, stems_paths[stem_type], sr, source_sr, store,
+                                           chromas.get(stem_type))
                 if result.get('events'):
                     result['primary_stem'] = stem_type
                     return result
@@ -211,7 +691,8 @@ class ChordAnalyzer:
         # Fallback: analisa o primeiro stem disponível
         if stems_paths:
             first_stem = list(stems_paths.keys())[0]
-            result = self.analyze_audio_file(stems_paths[first_stem], sr)
+            result = self.analyze_stem(first_stem, stems_paths[first_stem], sr, source_sr, store,
+                                       chromas.get(first_stem))
             result['primary_stem'] = first_stem
             return result
 
@@ -221,10 +702,94 @@ class ChordAnalyzer:
             'error': 'Nenhum stem disponível'
         }
 
+    def analyze_fused(self, stems_paths: Dict[str, Union[str, np.ndarray]], sr: Optional[int] = None,
+                      source_sr: Optional[int] = None, store: Optional['ChromaStore'] = None,
+                      weights: Optional[Dict[str, Dict[str, float]]] = None,
+                      max_workers: Optional[int] = None,
+                      chromas: Optional[Dict[str, Tuple[np.ndarray, Optional[np.ndarray], float]]] = None) -> Dict:
+        """
+        Analisa os stems harmônicos em conjunto, gerando uma única linha do tempo
+
+        Os chromagrams dos stems são carregados/calculados em paralelo. Para
+        cada segmento, a soma ponderada pelo peso 'quality' define o tipo do
+        acorde e a soma ponderada pelo peso 'root' (principalmente o baixo)
+        reforça a fundamental. As linhas do tempo em outras resoluções saem
+        das mesmas somas (ver _timeline_events).
+
+        Args:
+            stems_paths: Dicionário com tipo de stem e caminho do arquivo (ou array)
+            sr: Taxa de amostragem (None = a do perfil)
+            source_sr: Taxa de amostragem dos arrays recebidos (quando não são caminhos)
+            store: ChromaStore para reaproveitar/salvar os chromagrams dos stems
+            weights: Pesos por stem ({'bass': {'root': 1.0, 'quality': 0.2}, ...});
+                     None usa FUSION_WEIGHTS. Stems sem peso são ignorados.
+            max_workers: Threads para carregar os stems (None = um por stem)
+            chromas: Chromagrams já calculados por stem (ver analyze_stem), na
+                     taxa e hop deste analisador; não são recalculados
+
+        Returns:
+            Dicionário com duração e lista de eventos de acordes
+        """
+        sr = sr or self.sample_rate
+        weights = weights or self.FUSION_WEIGHTS
+        sources = {stem: source for stem, source in stems_paths.items()
+                   if stem in weights and (weights[stem].get('root', 0) > 0 or
+                                           weights[stem].get('quality', 0) > 0)}
+
+        if not sources:
+            return self.analyze_stems(stems_paths, sr, source_sr, store, chromas=chromas)
+
+        # Decodificação e CQT de cada stem em paralelo (librosa/numpy liberam o GIL)
+        chromas = {stem: chroma for stem, chroma in (chromas or {}).items() if stem in sources}
+        pending = {stem: source for stem, source in sources.items()
+                   if stem not in chromas and source is not None}
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(pending), 1)) as pool:
+            futures = {stem: pool.submit(self.stem_chroma, stem, source, sr, source_sr, store)
+                       for stem, source in pending.items()}
+            for stem, future in futures.items():
+                try:
+                    chromas[stem] = future.result()
+                except Exception as e:
+                    print(f"Aviso: stem '{stem}' ignorado na análise combinada: {e}")
+
+        if not chromas:
+            return {
+                'duration': 0.0,
+                'events': [],
+                'error': 'Nenhum stem pôde ser analisado'
+            }
+
+        # Os stems vêm da mesma separação; diferenças de poucos frames vêm da decodificação
+        n_frames = min(chroma.shape[1] for chroma, _, _ in chromas.values())
+        duration = max(duration for _, _, duration in chromas.values())
+        times = frame_times(n_frames, sr, self.hop_length)
+
+        # A média de cada segmento é linear: ponderar os frames equivale a ponderar os segmentos
+        quality = np.zeros((12, n_frames))
+        root = np.zeros((12, n_frames))
+        for stem, (chroma, _, _) in chromas.items():
+            stem_weights = weights[stem]
+            quality += stem_weights.get('quality', 0) * chroma[:, :n_frames]
+            root += stem_weights.get('root', 0) * chroma[:, :n_frames]
+
+        events, resolutions = self._timeline_events(quality, sr, times, root)
+
+        return dict({
+            'duration': float(duration),
+            'events': events,
+            'resolutions': resolutions,
+            'primary_stem': 'all',
+            'fused_stems': sorted(chromas),
+            'fusion_weights': {stem: weights[stem] for stem in sorted(chromas)}
+        }, **self._result_info(sr))
+
     def save_to_json(self, chord_data: Dict, output_path: str) -> bool:
         """
         Salva os dados de acordes em arquivo JSON
 
+        A linha do tempo binária (mesmo nome, extensão .bin) é regravada junto,
+        para que as duas nunca fiquem diferentes.
+
         Args:
             chord_data: Dados de acordes retornados por analyze_audio_file
             output_path: Caminho do arquivo JSON de saída
@@ -235,25 +800,466 @@ class ChordAnalyzer:
         try:
             with open(output_path, 'w', encoding='utf-8') as f:
                 json.dump(chord_data, f, indent=2, ensure_ascii=False)
-            return True
         except Exception as e:
             print(f"Erro ao salvar JSON: {str(e)}")
             return False
 
+        # O JSON continua sendo o formato principal: falha no .bin é só um aviso
+        write_timeline(chord_data, os.path.splitext(output_path)[0] + '.bin')
+        return True
 
-def analyze_upload_stems(processed_dir: str, output_filename: str = 'chords.json') -> Optional[str]:
+
+class ChromaStream:
+    """
+    Calcula o chromagram em blocos, à medida que o áudio chega
+
+    Cada bloco é calculado com alguns segundos de contexto de cada lado (o
+    filtro CQT das notas graves é longo), de modo que o resultado é
+    praticamente igual ao chromagram do sinal inteiro, mas a memória usada
+    depende apenas do tamanho do bloco.
+    """
+
+    def __init__(self, analyzer: ChordAnalyzer, sr: Optional[int] = None, source_sr: Optional[int] = None,
+                 context_seconds: float = 2.0):
+        """
+        Args:
+            analyzer: ChordAnalyzer que define hop_length e o cálculo do chroma
+            sr: Taxa de amostragem da análise (None = a do perfil do analyzer)
+            source_sr: Taxa de amostragem dos blocos recebidos (padrão: sr)
+            context_seconds: Contexto usado antes e depois de cada bloco
+        """
+        self.analyzer = analyzer
+        self.hop = analyzer.hop_length
+        self.sr = sr or analyzer.sample_rate
+        self.source_sr = source_sr or self.sr
+        self.context = int(np.ceil(context_seconds * self.sr / self.hop)) * self.hop
+
+        self.total_samples = 0
+        self.tuning = None          # Afinação estimada no primeiro bloco e mantida
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0      # Índice absoluto da primeira amostra do buffer
+        self._next_frame = 0        # Próximo frame a ser emitido
+        self._frames = []           # Blocos de chroma já calculados
+
+    def push(self, y: np.ndarray) -> np.ndarray:
+        """
+        Adiciona um bloco de áudio e calcula os frames que já têm contexto suficiente
+
+        Args:
+            y: Bloco mono (amostras,) ou multicanal (amostras, canais)
+
+        Returns:
+            Novos frames de chroma (12, n)
+        """
+        y = np.asarray(y, dtype=np.float32)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+        if self.source_sr != self.sr:
+            import librosa
+            y = librosa.resample(y, orig_sr=self.source_sr, target_sr=self.sr)
+
+        self._buffer = np.concatenate([self._buffer, y])
+        self.total_samples += len(y)
+
+        return self._process(final=False)
+
+    def finish(self) -> np.ndarray:
+        """Calcula os frames restantes e retorna o chromagram completo (12, frames)"""
+        self._process(final=True)
+        if not self._frames:
+            return np.zeros((12, 0), dtype=np.float32)
+        return np.concatenate(self._frames, axis=1)
+
+    def _process(self, final: bool) -> np.ndarray:
+        """Calcula os frames cujo contexto já está no buffer"""
+        end = self._buffer_start + len(self._buffer)
+
+        if final:
+            # Mesma quantidade de frames que o chroma do sinal inteiro (center=True)
+            last_frame = self.total_samples // self.hop
+        else:
+            last_frame = (end - self.context) // self.hop
+
+        if last_frame < self._next_frame:
+            return np.zeros((12, 0), dtype=np.float32)
+
+        # Trecho do buffer com contexto antes e depois dos frames emitidos
+        seg_start = max(self._buffer_start, self._next_frame * self.hop - self.context)
+        seg_end = end if final else min(end, last_frame * self.hop + self.context)
+        segment = self._buffer[seg_start - self._buffer_start:seg_end - self._buffer_start]
+
+        # A afinação é estimada uma vez, para todos os blocos usarem a mesma
+        if self.tuning is None:
+            import librosa
+            self.tuning = float(librosa.estimate_tuning(y=segment, sr=self.sr, bins_per_octave=36))
+
+        chroma = self.analyzer.compute_chroma(segment, self.sr, self.tuning)
+        first = self._next_frame - seg_start // self.hop
+        frames = chroma[:, first:first + last_frame - self._next_frame + 1].astype(np.float32)
+
+        self._frames.append(frames)
+        self._next_frame += frames.shape[1]
+
+        # Descarta o que não será mais usado como contexto
+        keep_from = max(self._buffer_start, self._next_frame * self.hop - self.context)
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+
+        return frames
+
+
+class ChordStream:
+    """
+    Detecta acordes em blocos, à medida que o áudio chega
+
+    O chromagram é calculado pelo ChromaStream e cada segmento é decidido
+    assim que todos os seus frames existem, com o mesmo critério de
+    analyze_chroma: no fim, os eventos são os mesmos da análise do
+    chromagram completo. Os eventos podem ser gravados em um arquivo
+    parcial (NDJSON) para serem servidos antes do fim da análise.
+    """
+
+    def __init__(self, analyzer: ChordAnalyzer, sr: Optional[int] = None, source_sr: Optional[int] = None,
+                 partial_path: Optional[str] = None, metadata: Optional[Dict] = None):
+        """
+        Args:
+            analyzer: ChordAnalyzer usado no chroma e na detecção
+            sr: Taxa de amostragem da análise (None = a do perfil do analyzer)
+            source_sr: Taxa de amostragem dos blocos recebidos (padrão: sr)
+            partial_path: Arquivo NDJSON de eventos parciais (None para não gravar)
+            metadata: Campos extras da primeira linha do arquivo parcial (ex: primary_stem)
+        """
+        self.analyzer = analyzer
+        self.chroma_stream = ChromaStream(analyzer, sr=sr, source_sr=source_sr)
+        self.sr = self.chroma_stream.sr
+        self.hop = analyzer.hop_length
+        self.frames_per_segment = max(1, int(analyzer.segment_duration * self.sr / self.hop))
+
+        self.events: List[Dict] = []
+        self.chroma: Optional[np.ndarray] = None    # Chromagram completo, após finish()
+        self._frames_seen = 0
+        self._pending = np.zeros((12, 0), dtype=np.float32)
+        self._pending_start = 0     # Frame absoluto do início de _pending
+        self._current_chord = None
+
+        self.partial = None
+        if partial_path:
+            self.partial = PartialTimelineWriter(
+                partial_path, dict(metadata or {}, **analyzer._result_info(self.sr)))
+
+    @property
+    def duration(self) -> float:
+        """Duração (segundos) do áudio recebido até agora"""
+        return self.chroma_stream.total_samples / self.sr
+
+    def push(self, y: np.ndarray) -> List[Dict]:
+        """
+        Adiciona um bloco de áudio
+
+        Args:
+            y: Bloco mono (amostras,) ou multicanal (amostras, canais)
+
+        Returns:
+            Eventos decididos com este bloco
+        """
+        frames = self.chroma_stream.push(y)
+        self._frames_seen += frames.shape[1]
+        return self._decide(frames, final=False)
+
+    def finish(self) -> List[Dict]:
+        """Processa o restante do áudio (o último segmento pode ser mais curto)"""
+        self.chroma = self.chroma_stream.finish()
+        frames = self.chroma[:, self._frames_seen:]
+        self._frames_seen = self.chroma.shape[1]
+        return self._decide(frames, final=True)
+
+    def result(self) -> Dict:
+        """
+        Dicionário no formato de analyze_chroma com os eventos já decididos
+        (as outras resoluções só existem depois de finish())
+        """
+        result = {
+            'duration': float(self.duration),
+            'events': list(self.events)
+        }
+        if self.chroma is not None:
+            result['resolutions'] = self.analyzer._timeline_events(self.chroma, self.sr)[1]
+        return dict(result, **self.analyzer._result_info(self.sr))
+
+    def close(self, remove_partial: bool = False) -> None:
+        """Fecha o arquivo parcial; remove_partial=True o apaga (resultado final já salvo)"""
+        if self.partial is not None:
+            self.partial.close(remove=remove_partial)
+
+    def _decide(self, frames: np.ndarray, final: bool) -> List[Dict]:
+        """Detecta os acordes dos segmentos completos e guarda o restante para o próximo bloco"""
+        self._pending = np.concatenate([self._pending, frames], axis=1)
+        n_frames = self._pending.shape[1]
+        complete = n_frames if final else n_frames - n_frames % self.frames_per_segment
+
+        events = []
+        if complete > 0:
+            starts, segments = window_means(prefix_sums(self._pending[:, :complete]),
+                                            self.frames_per_segment, self.frames_per_segment)
+            chord_ids, confidences = self.analyzer._detect_chords(segments.T)
+
+            starts = starts + self._pending_start
+            times = frame_times(int(starts[-1]) + 1, self.sr, self.hop)
+            events = self.analyzer._events_from_segments(starts, chord_ids, confidences, times,
+                                                         self._current_chord)
+            if events:
+                self._current_chord = events[-1]['chord']
+
+            self._pending = self._pending[:, complete:]
+            self._pending_start += complete
+            self.events.extend(events)
+
+        if self.partial is not None and (events or complete > 0 or final):
+            analyzed = self.duration if final else self._pending_start * self.hop / self.sr
+            self.partial.add(events, analyzed)
+
+        return events
+
+
+def iter_audio_blocks(audio_path: str, sr: int = 22050, block_seconds: float = 30.0) -> Iterator[np.ndarray]:
+    """
+    Decodifica o arquivo (ffmpeg) em blocos mono float32 na taxa de análise,
+    sem carregar o áudio inteiro em memória
+
+    Args:
+        audio_path: Caminho do arquivo de áudio
+        sr: Taxa de amostragem de saída
+        block_seconds: Duração de cada bloco
+
+    Yields:
+        Blocos (amostras,) float32
+    """
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', audio_path,
+        '-map', '0:a:0', '-f', 'f32le', '-ac', '1', '-ar', str(sr), 'pipe:1'
+    ]
+    block_bytes = max(1, int(block_seconds * sr)) * 4
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        pending = b''
+        for data in iter(lambda: process.stdout.read(block_bytes), b''):
+            data = pending + data
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            yield np.frombuffer(data[:usable], dtype='<f4')
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou ao decodificar {audio_path}: {stderr}")
+
+
+def parse_resolutions(spec: Optional[str]) -> Optional[List[Tuple[float, float]]]:
+    """
+    Lê as resoluções extras da linha do tempo no formato 'janela[:passo],...'
+
+    Ex: '0.5,1,2' (segmentos consecutivos) ou '1,4:1' (janela de 4s a cada 1s).
+    'off' desativa as resoluções extras.
+
+    Args:
+        spec: Texto com as resoluções (ex: variável CHORD_RESOLUTIONS)
+
+    Returns:
+        Lista de (janela, passo) em segundos, ou None se o texto estiver
+        vazio ou inválido (usa TIMELINE_RESOLUTIONS)
+    """
+    if not spec or not spec.strip():
+        return None
+    if spec.strip().lower() == 'off':
+        return []
+
+    resolutions = []
+    try:
+        for item in spec.split(','):
+            window, _, hop = item.partition(':')
+            window = float(window)
+            hop = float(hop) if hop.strip() else window
+            if not 0 < hop <= window:
+                raise ValueError(item)
+            resolutions.append((window, hop))
+    except ValueError:
+        print(f"Aviso: resoluções da linha do tempo inválidas ({spec}), usando o padrão")
+        return None
+
+    return resolutions
+
+
+def parse_fusion_weights(spec: Optional[str]) -> Optional[Dict[str, Dict[str, float]]]:
+    """
+    Lê os pesos da análise combinada no formato 'stem=root:quality,...'
+
+    Ex: 'bass=1.0:0.2,other=0.4:1.0,vocals=0.1:0.5'
+
+    Args:
+        spec: Texto com os pesos (ex: variável CHORD_FUSION_WEIGHTS)
+
+    Returns:
+        Dicionário de pesos ou None se o texto estiver vazio ou inválido
+    """
+    if not spec or not spec.strip():
+        return None
+
+    weights = {}
+    try:
+        for item in spec.split(','):
+            stem, values = item.split('=')
+            root, quality = values.split(':')
+            weights[stem.strip()] = {'root': float(root), 'quality': float(quality)}
+    except ValueError:
+        print(f"Aviso: pesos de análise combinada inválidos ({spec}), usando o padrão")
+        return None
+
+    return weights
+
+
+class ChromaStore:
+    """
+    Chromagrams por stem salvos ao lado dos stems processados
+
+    Para cada stem são gravados em <diretório>/features/:
+        <stem>.<tipo>.sr<sr>.hop<hop>.npy        chromagram (12, frames) float32
+        <stem>.<tipo>.sr<sr>.hop<hop>.times.npy  tempo de cada frame (float64)
+        <stem>.<tipo>.sr<sr>.hop<hop>.json       duração e assinatura do stem
+
+    Os arrays são lidos com memory map, então reabrir um chromagram não
+    decodifica o áudio nem refaz a CQT. A assinatura (tamanho e mtime do MP3)
+    invalida o chromagram quando o stem é regravado.
+    """
+
+    def __init__(self, directory: str, kind: str = 'cqt'):
+        """
+        Args:
+            directory: Diretório do upload processado (ex: processed/upload_123/)
+            kind: Tipo de chromagram (faz parte da chave)
+        """
+        self.directory = directory
+        self.kind = kind
+        self.features_dir = os.path.join(directory, FEATURES_DIR)
+
+    def _base_path(self, stem: str, sr: int, hop_length: int, kind: Optional[str] = None) -> str:
+        return os.path.join(self.features_dir, f'{stem}.{kind or self.kind}.sr{sr}.hop{hop_length}')
+
+    @staticmethod
+    def _signature(source_path: Optional[str]) -> Optional[Dict]:
+        """Assinatura barata do arquivo de origem (tamanho + mtime)"""
+        if not source_path or not os.path.exists(source_path):
+            return None
+        stat = os.stat(source_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def load(self, stem: str, sr: int, hop_length: int, source_path: Optional[str] = None,
+             kind: Optional[str] = None) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        """
+        Lê o chromagram salvo de um stem
+
+        Args:
+            stem: Nome do stem
+            sr: Taxa de amostragem da análise
+            hop_length: Hop usado no chromagram
+            source_path: Arquivo do stem, para conferir a assinatura (opcional)
+            kind: Tipo de chromagram ('cqt', 'stft'); None usa o do store
+
+        Returns:
+            Tupla (chromagram (12, frames), tempos, duração) ou None se não houver
+            chromagram válido
+        """
+        base = self._base_path(stem, sr, hop_length, kind)
+
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            # Chromagram salvo a partir de outro arquivo (stem regravado)
+            signature = meta.get('source')
+            if signature and source_path and signature != self._signature(source_path):
+                return None
+
+            chroma = np.load(base + '.npy', mmap_mode='r')
+            times = np.load(base + '.times.npy', mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+        if chroma.ndim != 2 or chroma.shape[1] != len(times):
+            return None
+
+        return chroma, times, float(meta['duration'])
+
+    def save(self, stem: str, sr: int, hop_length: int, chroma: np.ndarray, duration: float,
+             source_path: Optional[str] = None, kind: Optional[str] = None) -> bool:
+        """
+        Salva o chromagram de um stem
+
+        Args:
+            stem: Nome do stem
+            sr: Taxa de amostragem da análise
+            hop_length: Hop usado no chromagram
+            chroma: Matriz (12, frames)
+            duration: Duração do áudio em segundos
+            source_path: Arquivo do stem de origem (None quando veio da memória)
+            kind: Tipo de chromagram ('cqt', 'stft'); None usa o do store
+
+        Returns:
+            True se os arquivos foram gravados
+        """
+        base = self._base_path(stem, sr, hop_length, kind)
+        chroma = np.asarray(chroma, dtype=np.float32)
+        meta = {
+            'stem': stem,
+            'kind': kind or self.kind,
+            'sample_rate': int(sr),
+            'hop_length': int(hop_length),
+            'frames': int(chroma.shape[1]),
+            'duration': float(duration),
+            'source': self._signature(source_path)
+        }
+
+        try:
+            os.makedirs(self.features_dir, exist_ok=True)
+
+            # Grava em temporários e substitui: um leitor nunca vê um arquivo pela metade
+            for suffix, array in (('.npy', chroma),
+                                  ('.times.npy', frame_times(chroma.shape[1], sr, hop_length))):
+                tmp_path = f'{base}{suffix}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_path, base + suffix)
+
+            # O JSON é gravado por último e marca o chromagram como completo
+            tmp_path = f'{base}.json.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, base + '.json')
+            return True
+
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar o chromagram de '{stem}': {e}")
+            return False
+
+
+def analyze_upload_stems(processed_dir: str, output_filename: str = 'chords.json',
+                         profile: Optional[str] = None) -> Optional[str]:
     """
     Função auxiliar para analisar stems de um upload processado
 
     Args:
         processed_dir: Diretório com os stems processados (ex: /processed/upload_123/)
         output_filename: Nome do arquivo JSON de saída
+        profile: Perfil de análise (None = DEFAULT_PROFILE)
 
     Returns:
         Caminho completo do arquivo JSON gerado ou None em caso de erro
     """
-    import os
-
     # Constrói caminhos dos stems
     stems_paths = {}
     for stem_type in ['vocals', 'drums', 'bass', 'other']:
@@ -265,9 +1271,9 @@ def analyze_upload_stems(processed_dir: str, output_filename: str = 'chords.json
         print(f"Nenhum stem encontrado em {processed_dir}")
         return None
 
-    # Analisa os stems
-    analyzer = ChordAnalyzer(hop_length=512, frame_size=2048)
-    chord_data = analyzer.analyze_stems(stems_paths)
+    # Analisa os stems (reaproveitando chromagrams já calculados)
+    analyzer = ChordAnalyzer.from_profile(profile)
+    chord_data = analyzer.analyze_stems(stems_paths, store=ChromaStore(processed_dir))
 
     # Salva o resultado
     output_path = os.path.join(processed_dir, output_filename)
@@ -281,17 +1287,18 @@ def analyze_upload_stems(processed_dir: str, output_filename: str = 'chords.json
 if __name__ == '__main__':
     """
     Permite execução standalone para testes:
-    python3 chord_analyzer.py /path/to/processed/upload_123/
+    python3 chord_analyzer.py /path/to/processed/upload_123/ [perfil]
     """
     import sys
 
     if len(sys.argv) < 2:
-        print("Uso: python3 chord_analyzer.py <diretório_processado>")
-        print("Exemplo: python3 chord_analyzer.py ./processed/upload_123/")
+        print("Uso: python3 chord_analyzer.py <diretório_processado> [perfil]")
+        print("Exemplo: python3 chord_analyzer.py ./processed/upload_123/ fast")
+        print(f"Perfis: {', '.join(ANALYSIS_PROFILES)} (padrão: {DEFAULT_PROFILE})")
         sys.exit(1)
 
     processed_dir = sys.argv[1]
-    result = analyze_upload_stems(processed_dir)
+    result = analyze_upload_stems(processed_dir, profile=sys.argv[2] if len(sys.argv) > 2 else None)
 
     if result:
         print(f"\n✓ Análise concluída com sucesso!")
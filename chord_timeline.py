@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chord Timeline - Linha do tempo de acordes em formato binário compacto
+Salvo como chords.bin ao lado do chords.json: um dicionário com os nomes dos
+acordes e colunas float32 (tempos), uint16 (id do acorde) e uint8
+(confiança). O leitor mapeia o arquivo em memória e responde "acorde no
+instante t" e "eventos em [t0, t1)" por busca binária.
+
+Layout (little-endian):
+    cabeçalho   '<4sHHIIf'  magic, versão, reservado, qtd. de nomes, qtd. de eventos, duração
+    nomes       para cada nome: uint8 tamanho + bytes UTF-8
+    (alinhamento em 4 bytes)
+    times       float32[eventos]   tempo de início de cada evento (ordenado)
+    chord_ids   uint16[eventos]    índice no dicionário de nomes
+    confidence  uint8[eventos]     confiança * 255
+"""
+
+import os
+import json
+import mmap
+import struct
+import numpy as np
+from typing import Dict, List, Optional
+
+
+MAGIC = b'CHTL'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIf')
+
+# Escala da confiança quantizada (0-255 representa 0.0-1.0)
+CONFIDENCE_SCALE = 255
+
+
+def _align(offset: int, alignment: int = 4) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def encode_timeline(chord_data: Dict) -> bytes:
+    """
+    Serializa os eventos de chord_data (formato do chords.json) no formato binário
+
+    Args:
+        chord_data: Dicionário com 'duration' e 'events' [{'time', 'chord', 'confidence'}]
+
+    Returns:
+        Conteúdo do arquivo
+    """
+    events = sorted(chord_data.get('events', []), key=lambda event: event['time'])
+
+    names: List[str] = []
+    name_ids: Dict[str, int] = {}
+    chord_ids = np.empty(len(events), dtype='<u2')
+    for i, event in enumerate(events):
+        chord = event['chord']
+        if chord not in name_ids:
+            name_ids[chord] = len(names)
+            names.append(chord)
+        chord_ids[i] = name_ids[chord]
+
+    if len(names) > np.iinfo(np.uint16).max:
+        raise ValueError(f"Muitos acordes distintos para o formato binário: {len(names)}")
+
+    times = np.array([event['time'] for event in events], dtype='<f4')
+    confidence = np.array([event.get('confidence', 0.0) for event in events], dtype=np.float64)
+    confidence = np.round(np.clip(confidence, 0.0, 1.0) * CONFIDENCE_SCALE).astype(np.uint8)
+
+    parts = [HEADER.pack(MAGIC, VERSION, 0, len(names), len(events), float(chord_data.get('duration', 0.0)))]
+    for name in names:
+        encoded = name.encode('utf-8')
+        if len(encoded) > 255:
+            raise ValueError(f"Nome de acorde longo demais: {name}")
+        parts.append(struct.pack('<B', len(encoded)) + encoded)
+
+    body = b''.join(parts)
+    body += b'\0' * (_align(len(body)) - len(body))
+    return body + times.tobytes() + chord_ids.tobytes() + confidence.tobytes()
+
+
+def write_timeline(chord_data: Dict, output_path: str) -> bool:
+    """
+    Salva a linha do tempo binária (escrita atômica)
+
+    Args:
+        chord_data: Dados de acordes (mesmo formato do chords.json)
+        output_path: Caminho do arquivo .bin
+
+    Returns:
+        True se salvou com sucesso, False caso contrário
+    """
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_timeline(chord_data))
+        os.replace(tmp_path, output_path)
+        return True
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Erro ao salvar linha do tempo binária: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+class ChordTimeline:
+    """
+    Leitor do chords.bin mapeado em memória
+
+    As colunas são views numpy sobre o mmap: abrir o arquivo não lê os
+    eventos e cada consulta toca apenas as páginas da busca binária.
+
+    Uso:
+        with ChordTimeline('processed/upload_1/chords.bin') as timeline:
+            timeline.chord_at(42.0)
+            timeline.events_between(30.0, 60.0)
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Caminho do arquivo .bin
+
+        Raises:
+            ValueError: Se o arquivo não estiver no formato esperado
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"Arquivo de acordes inválido: {path}")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self) -> None:
+        magic, version, _, n_names, n_events, duration = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Arquivo de acordes inválido ou de outra versão: {self.path}")
+
+        offset = HEADER.size
+        self.names: List[str] = []
+        for _ in range(n_names):
+            length = self._mmap[offset]
+            self.names.append(self._mmap[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+
+        offset = _align(offset)
+        if offset + n_events * 7 > len(self._mmap):
+            raise ValueError(f"Arquivo de acordes truncado: {self.path}")
+
+        self.duration = float(duration)
+        self.times = np.frombuffer(self._mmap, dtype='<f4', count=n_events, offset=offset)
+        offset += 4 * n_events
+        self.chord_ids = np.frombuffer(self._mmap, dtype='<u2', count=n_events, offset=offset)
+        offset += 2 * n_events
+        self.confidence = np.frombuffer(self._mmap, dtype=np.uint8, count=n_events, offset=offset)
+
+    def close(self) -> None:
+        """Fecha o arquivo (arrays obtidos de times/chord_ids/confidence não podem estar em uso)"""
+        # As views precisam ser liberadas antes do mmap
+        self.times = self.chord_ids = self.confidence = None
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _event(self, index: int) -> Dict:
+        return {
+            'time': round(float(self.times[index]), 6),
+            'chord': self.names[self.chord_ids[index]],
+            'confidence': round(float(self.confidence[index]) / CONFIDENCE_SCALE, 3)
+        }
+
+    def index_at(self, t: float) -> int:
+        """Índice do evento em vigor no instante t (-1 antes do primeiro evento)"""
+        # A consulta precisa ser float32: um float64 faria o numpy converter a coluna inteira
+        return int(np.searchsorted(self.times, np.float32(t), side='right')) - 1
+
+    def chord_at(self, t: float) -> Optional[Dict]:
+        """
+        Acorde em vigor no instante t
+
+        Returns:
+            Evento {'time', 'chord', 'confidence'} ou None (antes do primeiro
+            evento ou depois do fim da música)
+        """
+        if self.duration and t >= self.duration:
+            return None
+        index = self.index_at(t)
+        return self._event(index) if index >= 0 else None
+
+    def events_between(self, t0: float, t1: float) -> List[Dict]:
+        """Eventos que começam no intervalo [t0, t1)"""
+        start = int(np.searchsorted(self.times, np.float32(t0), side='left'))
+        end = int(np.searchsorted(self.times, np.float32(t1), side='left'))
+        return [self._event(i) for i in range(start, end)]
+
+    def to_dict(self) -> Dict:
+        """Mesmo formato de 'duration'/'events' do chords.json (confiança quantizada)"""
+        return {'duration': self.duration, 'events': [self._event(i) for i in range(len(self))]}
+
+
+def open_timeline(processed_dir: str) -> Optional[ChordTimeline]:
+    """
+    Abre o chords.bin de um upload, gerando-o a partir do chords.json se não
+    existir ou estiver desatualizado (ex: uploads processados antes do formato)
+
+    Args:
+        processed_dir: Diretório do upload processado
+
+    Returns:
+        ChordTimeline ou None se não houver acordes
+    """
+    bin_path = os.path.join(processed_dir, 'chords.bin')
+    json_path = os.path.join(processed_dir, 'chords.json')
+
+    if os.path.exists(json_path) and (not os.path.exists(bin_path) or
+                                      os.path.getmtime(bin_path) < os.path.getmtime(json_path)):
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                chord_data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler {json_path}: {e}")
+            return None
+        if not write_timeline(chord_data, bin_path):
+            return None
+
+    if not os.path.exists(bin_path):
+        return None
+    return ChordTimeline(bin_path)
+
+
+# Eventos parciais, gravados enquanto a análise ainda está em andamento
+PARTIAL_FILENAME = 'chords.partial.ndjson'
+
+
+class PartialTimelineWriter:
+    """
+    Acrescenta eventos a um arquivo NDJSON à medida que são decididos
+
+    Cada linha é um objeto JSON: a primeira com os metadados da análise,
+    depois eventos {'time', 'chord', 'confidence'} intercalados com linhas
+    {'analyzed': segundos} indicando até onde os acordes já são definitivos.
+    Cada linha é gravada inteira com flush, então um leitor concorrente vê no
+    máximo uma última linha incompleta (que deve ser ignorada).
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict] = None):
+        """
+        Args:
+            path: Caminho do arquivo (recriado vazio)
+            metadata: Campos da primeira linha (ex: sample_rate, primary_stem)
+        """
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write(dict(metadata or {}, partial=True))
+
+    def _write(self, entry: Dict) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def add(self, events: List[Dict], analyzed: float) -> None:
+        """Grava novos eventos e o instante até onde a análise já foi concluída"""
+        for event in events:
+            self._write(event)
+        self._write({'analyzed': round(float(analyzed), 3)})
+
+    def close(self, remove: bool = False) -> None:
+        """Fecha o arquivo; remove=True apaga (ex: depois de salvar o chords.json)"""
+        if not self._file.closed:
+            self._file.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_partial_timeline(path: str) -> Optional[Dict]:
+    """
+    Lê um arquivo de eventos parciais
+
+    Returns:
+        Dicionário no formato do chords.json, com 'partial': True e
+        'analyzed_until' (segundos), ou None se o arquivo não existir
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    chord_data = {'duration': 0.0, 'events': [], 'partial': True, 'analyzed_until': 0.0}
+    for i, line in enumerate(lines):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # Linha ainda sendo escrita
+            continue
+        if i == 0:
+            chord_data.update(entry)
+        elif 'chord' in entry:
+            chord_data['events'].append(entry)
+        elif 'analyzed' in entry:
+            chord_data['analyzed_until'] = entry['analyzed']
+
+    chord_data['duration'] = max(chord_data['duration'], chord_data['analyzed_until'])
+    return chord_data
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU Governor - Limites de threads e afinidade de CPU de cada job de processamento
+Sem limites, cada job usa todas as threads do TensorFlow e do BLAS: com
+vários jobs simultâneos os núcleos ficam sobrecarregados e a vazão total
+cai. No modo auto cada job recebe núcleos ÷ jobs simultâneos.
+
+Variáveis de ambiente:
+    CPU_GOVERNOR          auto (padrão), manual ou off
+    MAX_CONCURRENT_JOBS   jobs simultâneos (divide os núcleos no modo auto)
+    TF_INTRA_OP_THREADS   threads do TensorFlow dentro de cada operação
+    TF_INTER_OP_THREADS   operações do TensorFlow em paralelo
+    BLAS_THREADS          threads do BLAS/OpenMP (numpy, librosa)
+    CPU_AFFINITY          off (padrão), auto (núcleos exclusivos por worker) ou lista (ex: 0-3,8)
+"""
+
+import os
+from typing import Dict, List, Optional
+
+
+GOVERNOR_MODES = ('auto', 'manual', 'off')
+
+# Lidas pelas bibliotecas BLAS/OpenMP ao serem carregadas (valem também para
+# processos filhos, ex: STEM_POOL=process)
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# Lidas pelo TensorFlow ao criar os pools de threads (inclusive nas sessões do Spleeter)
+TF_INTRA_ENV_VAR = 'TF_NUM_INTRAOP_THREADS'
+TF_INTER_ENV_VAR = 'TF_NUM_INTEROP_THREADS'
+
+# Operações do grafo do Spleeter em paralelo (a U-Net é quase sequencial)
+MAX_AUTO_INTER_OP = 2
+
+# Limites aplicados neste processo (None antes de apply_limits)
+_applied: Optional[Dict] = None
+
+
+def available_cores() -> List[int]:
+    """Núcleos que este processo pode usar"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """
+    Converte uma lista de núcleos no formato do taskset ('0-3,8')
+
+    Raises:
+        ValueError: Se a lista for inválida
+    """
+    cores = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (int(value) for value in part.split('-', 1))
+            if first > last:
+                raise ValueError(f"Intervalo de núcleos inválido: {part}")
+            cores.update(range(first, last + 1))
+        else:
+            cores.add(int(part))
+    if not cores:
+        raise ValueError("Lista de núcleos vazia")
+    return sorted(cores)
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name, '').strip()
+    if not value:
+        return None
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Aviso: {name} inválida ({value}); ignorada")
+        return None
+
+
+def resolve_limits(slot: Optional[int] = None) -> Dict:
+    """
+    Calcula os limites do job a partir das variáveis de ambiente
+
+    Args:
+        slot: Posição do worker no pool (0..MAX_CONCURRENT_JOBS-1), usada por
+              CPU_AFFINITY=auto para dar núcleos exclusivos a cada worker
+
+    Returns:
+        Dicionário com mode, cores, jobs, intra_op, inter_op, blas e affinity
+        (None = padrão da biblioteca / sem afinidade)
+    """
+    mode = os.getenv('CPU_GOVERNOR', 'auto').strip().lower()
+    if mode not in GOVERNOR_MODES:
+        print(f"Aviso: CPU_GOVERNOR inválido ({mode}); usando auto")
+        mode = 'auto'
+
+    cores = available_cores()
+    jobs = _env_int('MAX_CONCURRENT_JOBS') or 1
+    limits = {'mode': mode, 'cores': len(cores), 'jobs': jobs,
+              'intra_op': None, 'inter_op': None, 'blas': None, 'affinity': None}
+    if mode == 'off':
+        return limits
+
+    affinity_spec = os.getenv('CPU_AFFINITY', 'off').strip().lower()
+    share = max(1, len(cores) // jobs)
+    if affinity_spec == 'auto':
+        # Fatias consecutivas: o worker 0 fica com os primeiros núcleos e assim por diante
+        if slot is not None and len(cores) >= jobs:
+            start = (slot % jobs) * share
+            limits['affinity'] = cores[start:start + share]
+    elif affinity_spec not in ('', 'off'):
+        try:
+            limits['affinity'] = [core for core in parse_cpu_list(affinity_spec) if core in cores] or None
+        except ValueError as e:
+            print(f"Aviso: CPU_AFFINITY inválida ({e}); ignorada")
+
+    if mode == 'auto':
+        if limits['affinity']:
+            share = len(limits['affinity'])
+        limits.update(intra_op=share, inter_op=min(MAX_AUTO_INTER_OP, share), blas=share)
+
+    # Valores explícitos valem nos dois modos (no manual, só eles são aplicados)
+    for key, name in (('intra_op', 'TF_INTRA_OP_THREADS'), ('inter_op', 'TF_INTER_OP_THREADS'),
+                      ('blas', 'BLAS_THREADS')):
+        value = _env_int(name)
+        if value is not None:
+            limits[key] = value
+
+    return limits
+
+
+def apply_limits(limits: Optional[Dict] = None) -> Dict:
+    """
+    Aplica os limites ao processo atual (antes de carregar o TensorFlow)
+
+    A afinidade vale para as threads e subprocessos criados depois (ex:
+    ffmpeg). O BLAS já carregado pelo numpy é limitado com threadpoolctl,
+    quando instalado; as variáveis de ambiente cobrem os processos filhos.
+
+    Args:
+        limits: Retorno de resolve_limits (None = calcula sem slot)
+
+    Returns:
+        Os limites aplicados
+    """
+    global _applied
+    limits = limits if limits is not None else resolve_limits()
+
+    if limits['affinity'] and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, limits['affinity'])
+        except OSError as e:
+            print(f"Aviso: não foi possível definir a afinidade de CPU: {e}")
+            limits['affinity'] = None
+
+    if limits['blas']:
+        for name in BLAS_ENV_VARS:
+            os.environ[name] = str(limits['blas'])
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=limits['blas'])
+        except ImportError:
+            pass
+
+    if limits['intra_op']:
+        os.environ[TF_INTRA_ENV_VAR] = str(limits['intra_op'])
+    if limits['inter_op']:
+        os.environ[TF_INTER_ENV_VAR] = str(limits['inter_op'])
+
+    _applied = limits
+    return limits
+
+
+def configure_tensorflow(limits: Optional[Dict] = None) -> None:
+    """
+    Define os pools de threads do TensorFlow (chamar antes de criar o Separator)
+
+    Só funciona antes de o runtime do TensorFlow ser inicializado; depois
+    disso continuam valendo as variáveis de ambiente de apply_limits.
+    """
+    limits = limits or _applied
+    if not limits or not (limits['intra_op'] or limits['inter_op']):
+        return
+
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+
+    try:
+        if limits['intra_op']:
+            tf.config.threading.set_intra_op_parallelism_threads(limits['intra_op'])
+        if limits['inter_op']:
+            tf.config.threading.set_inter_op_parallelism_threads(limits['inter_op'])
+    except RuntimeError as e:
+        print(f"Aviso: TensorFlow já inicializado, threads mantidas: {e}")
+
+
+def job_cpu_count() -> int:
+    """Núcleos disponíveis para o job (para dimensionar pools de threads)"""
+    if _applied and _applied['blas']:
+        return _applied['blas']
+    return len(available_cores())
+
+
+def describe_limits(limits: Dict) -> str:
+    """Resumo em uma linha (para o log)"""
+    if limits['mode'] == 'off':
+        return f"CPU: governor desativado ({limits['cores']} núcleos)"
+
+    def show(value):
+        return value if value else 'padrão'
+
+    affinity = limits['affinity']
+    if affinity:
+        contiguous = len(affinity) > 1 and affinity == list(range(affinity[0], affinity[-1] + 1))
+        affinity = f'{affinity[0]}-{affinity[-1]}' if contiguous else ','.join(str(core) for core in affinity)
+    return (f"CPU: {limits['mode']}, {limits['cores']} núcleos / {limits['jobs']} job(s) → "
+            f"TF intra {show(limits['intra_op'])}, inter {show(limits['inter_op'])}, "
+            f"BLAS {show(limits['blas'])}, afinidade {affinity or 'livre'}")
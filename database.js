@@ -28,8 +28,35 @@ const db = new sqlite3.Database(dbPath, (err) => {
     }
 });
 
+// Os workers Python gravam no mesmo arquivo: espera por locks em vez de
+// falhar com SQLITE_BUSY, e WAL deixa leituras e a escrita correrem juntas
+db.configure('busyTimeout', 5000);
+
+// Callbacks aguardando o fim da criação/migração das tabelas
+let isReady = false;
+const readyCallbacks = [];
+
+function markReady() {
+    isReady = true;
+    readyCallbacks.splice(0).forEach(callback => callback());
+}
+
+// Executa o callback quando as tabelas estiverem prontas para uso
+function whenReady(callback) {
+    if (isReady) {
+        return callback();
+    }
+    readyCallbacks.push(callback);
+}
+
 // Cria tabelas se não existirem
 db.serialize(() => {
+    db.run('PRAGMA journal_mode = WAL', (err) => {
+        if (err) {
+            logger.error('Erro ao ativar o modo WAL: ' + err.message);
+        }
+    });
+
     // Tabela de usuários
     db.run(`
         CREATE TABLE IF NOT EXISTS users (
@@ -64,6 +91,12 @@ db.serialize(() => {
             artist TEXT,
             song_name TEXT,
             user_id INTEGER,
+            queue_priority INTEGER DEFAULT 10,
+            estimated_duration REAL,
+            queued_at DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME,
+            attempts INTEGER DEFAULT 0,
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
     `, (err) => {
@@ -73,6 +106,63 @@ db.serialize(() => {
             logger.info('Tabela uploads verificada/criada com sucesso');
         }
     });
+
+    // Tabela com o perfil (tempo/CPU/memória por etapa) do último processamento de cada upload
+    // Gravada pelo process_audio.py (stage_profiler.py)
+    db.run(`
+        CREATE TABLE IF NOT EXISTS upload_profiles (
+            upload_id INTEGER PRIMARY KEY,
+            status TEXT,
+            input_duration REAL,
+            total_wall REAL,
+            total_cpu REAL,
+            peak_rss_mb REAL,
+            stages TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (upload_id) REFERENCES uploads(id) ON DELETE CASCADE
+        )
+    `, (err) => {
+        if (err) {
+            logger.error('Erro ao criar tabela upload_profiles: ' + err.message);
+        } else {
+            logger.info('Tabela upload_profiles verificada/criada com sucesso');
+        }
+    });
+
+    // Colunas da fila de processamento (para bancos criados antes da fila)
+    const queueColumns = {
+        queue_priority: 'INTEGER DEFAULT 10',
+        estimated_duration: 'REAL',
+        queued_at: 'DATETIME',
+        started_at: 'DATETIME',
+        finished_at: 'DATETIME',
+        attempts: 'INTEGER DEFAULT 0'
+    };
+
+    db.all('PRAGMA table_info(uploads)', (err, columns) => {
+        if (err) {
+            logger.error('Erro ao verificar estrutura da tabela uploads: ' + err.message);
+            return markReady();
+        }
+
+        const missing = Object.keys(queueColumns).filter(name => !columns.some(col => col.name === name));
+        if (missing.length === 0) {
+            return markReady();
+        }
+
+        db.serialize(() => {
+            missing.forEach(name => {
+                db.run(`ALTER TABLE uploads ADD COLUMN ${name} ${queueColumns[name]}`, (err) => {
+                    if (err) {
+                        logger.error(`Erro ao adicionar coluna ${name}: ` + err.message);
+                    } else {
+                        logger.info(`Coluna ${name} adicionada à tabela uploads`);
+                    }
+                });
+            });
+            db.run('SELECT 1', markReady);
+        });
+    });
 });
 
 // Funções auxiliares para manipular o banco de dados
@@ -218,6 +308,95 @@ const dbOperations = {
         db.run(sql, [status, processedPath, id], callback);
     },
 
+    // ========== OPERAÇÕES DA FILA DE PROCESSAMENTO ==========
+
+    // Colocar upload na fila de processamento
+    enqueueUpload: (id, priority, estimatedDuration, callback) => {
+        const sql = `
+            UPDATE uploads
+            SET processing_status = 'queued', queue_priority = ?, estimated_duration = ?,
+                queued_at = CURRENT_TIMESTAMP, started_at = NULL, finished_at = NULL, attempts = 0
+            WHERE id = ?
+        `;
+        db.run(sql, [priority, estimatedDuration, id], callback);
+    },
+
+    // Listar uploads na fila (maior prioridade e músicas mais curtas primeiro)
+    getQueuedUploads: (limit, callback) => {
+        const sql = `
+            SELECT id, file_path, queue_priority, estimated_duration, queued_at, attempts
+            FROM uploads
+            WHERE processing_status = 'queued'
+            ORDER BY queue_priority ASC, estimated_duration ASC, id ASC
+            LIMIT ?
+        `;
+        db.all(sql, [limit], callback);
+    },
+
+    // Marcar upload como em processamento (só se ainda estiver na fila) e contar a tentativa
+    markUploadStarted: (id, callback) => {
+        const sql = `
+            UPDATE uploads
+            SET processing_status = 'processing', started_at = CURRENT_TIMESTAMP,
+                attempts = COALESCE(attempts, 0) + 1
+            WHERE id = ? AND processing_status = 'queued'
+        `;
+        db.run(sql, [id], function(err) {
+            callback(err, this ? this.changes > 0 : false);
+        });
+    },
+
+    // Registrar o fim do processamento
+    markUploadFinished: (id, callback) => {
+        const sql = `UPDATE uploads SET finished_at = CURRENT_TIMESTAMP WHERE id = ?`;
+        db.run(sql, [id], callback);
+    },
+
+    // Devolver à fila um upload em processamento (ex.: worker finalizado durante o job)
+    // Mantém a prioridade e o contador de tentativas
+    requeueUpload: (id, callback) => {
+        const sql = `
+            UPDATE uploads
+            SET processing_status = 'queued', started_at = NULL
+            WHERE id = ? AND processing_status = 'processing'
+        `;
+        db.run(sql, [id], function(err) {
+            callback(err, this ? this.changes > 0 : false);
+        });
+    },
+
+    // Devolver à fila uploads que ficaram em 'processing' (ex.: queda do servidor)
+    requeueStaleUploads: (callback) => {
+        const sql = `
+            UPDATE uploads
+            SET processing_status = 'queued', started_at = NULL
+            WHERE processing_status = 'processing'
+        `;
+        db.run(sql, [], function(err) {
+            callback(err, this ? this.changes : 0);
+        });
+    },
+
+    // ========== PERFIL DE PROCESSAMENTO ==========
+
+    // Perfis mais recentes, com o nome do arquivo
+    getRecentProfiles: (limit, callback) => {
+        const sql = `
+            SELECT p.*, u.original_filename, u.artist, u.song_name
+            FROM upload_profiles p
+            LEFT JOIN uploads u ON u.id = p.upload_id
+            ORDER BY p.created_at DESC
+            LIMIT ?
+        `;
+        db.all(sql, [limit], callback);
+    },
+
+    // Perfil do último processamento de um upload
+    getUploadProfile: (id, callback) => {
+        const sql = `SELECT * FROM upload_profiles WHERE upload_id = ?`;
+        db.get(sql, [id], callback);
+    },
+
     // Deletar upload
     deleteUpload: (id, callback) => {
         const sql = `DELETE FROM uploads WHERE id = ?`;
@@ -227,5 +406,6 @@ const dbOperations = {
 
 module.exports = {
     db,
-    dbOperations
+    dbOperations,
+    whenReady
 };
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Feature Extractor - Features espectrais de cada stem em uma única passada
+Cada stem é decodificado uma vez e a STFT é calculada uma vez; chroma,
+envelope RMS, força de onset, onsets e tempo/batidas saem dessas mesmas
+representações e são salvos juntos em features/<stem>.features.*.npz
+"""
+
+import os
+import json
+from functools import cached_property
+from typing import Callable, Dict, Optional, Tuple, Union
+import numpy as np
+
+from chord_analyzer import ChordAnalyzer, ChromaStore, FEATURES_DIR, frame_times
+
+
+class SpectralFrames:
+    """
+    Representações espectrais de um sinal mono, calculadas sob demanda e
+    uma única vez (todas as features de um stem compartilham a mesma STFT)
+    """
+
+    def __init__(self, y: np.ndarray, sr: int, analyzer: ChordAnalyzer):
+        """
+        Args:
+            y: Sinal mono na taxa de análise
+            sr: Taxa de amostragem
+            analyzer: ChordAnalyzer que define hop, tamanho de frame e tipo de chroma
+        """
+        self.y = y
+        self.sr = sr
+        self.analyzer = analyzer
+        self.hop_length = analyzer.hop_length
+        self.n_fft = analyzer.frame_size
+
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        import librosa
+        return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @cached_property
+    def power(self) -> np.ndarray:
+        return self.magnitude ** 2
+
+    @cached_property
+    def mel_db(self) -> np.ndarray:
+        import librosa
+        mel = librosa.feature.melspectrogram(S=self.power, sr=self.sr)
+        return librosa.power_to_db(mel, ref=np.max)
+
+    @cached_property
+    def onset_envelope(self) -> np.ndarray:
+        import librosa
+        return librosa.onset.onset_strength(S=self.mel_db, sr=self.sr, hop_length=self.hop_length)
+
+
+def _chroma(frames: SpectralFrames) -> Dict[str, np.ndarray]:
+    import librosa
+    if frames.analyzer.chroma_type == 'stft':
+        # Mesmo resultado de ChordAnalyzer.compute_chroma, sem refazer a STFT
+        chroma = librosa.feature.chroma_stft(S=frames.power, sr=frames.sr, n_fft=frames.n_fft,
+                                             hop_length=frames.hop_length, n_chroma=12)
+    else:
+        chroma = frames.analyzer.compute_chroma(frames.y, frames.sr)
+    return {'chroma': chroma}
+
+
+def _rms(frames: SpectralFrames) -> Dict[str, np.ndarray]:
+    import librosa
+    return {'rms': librosa.feature.rms(S=frames.magnitude, frame_length=frames.n_fft)[0]}
+
+
+def _onsets(frames: SpectralFrames) -> Dict[str, np.ndarray]:
+    import librosa
+    onset_frames = librosa.onset.onset_detect(onset_envelope=frames.onset_envelope, sr=frames.sr,
+                                              hop_length=frames.hop_length, units='frames')
+    return {'onset_strength': frames.onset_envelope, 'onset_frames': onset_frames}
+
+
+def _beats(frames: SpectralFrames) -> Dict[str, np.ndarray]:
+    import librosa
+    tempo, beat_frames = librosa.beat.beat_track(onset_envelope=frames.onset_envelope, sr=frames.sr,
+                                                 hop_length=frames.hop_length, units='frames')
+    return {'tempo': np.atleast_1d(tempo).astype(np.float32), 'beat_frames': beat_frames}
+
+
+# Features de cada stem: nome -> função(SpectralFrames) -> arrays salvos.
+# Uma feature nova só precisa da própria conta sobre frames.magnitude,
+# frames.power, frames.mel_db ou frames.onset_envelope
+FEATURES: Dict[str, Callable[[SpectralFrames], Dict[str, np.ndarray]]] = {
+    'chroma': _chroma,
+    'rms': _rms,
+    'onsets': _onsets,
+    'beats': _beats,
+}
+
+
+class FeatureExtractor:
+    """
+    Extrai e salva as features de um stem
+
+    O chromagram também é gravado no ChromaStore do upload, então a análise
+    de acordes e a regeneração reaproveitam o que foi calculado aqui.
+
+    Uso:
+        extractor = FeatureExtractor(ChordAnalyzer.from_profile('standard'))
+        features = extractor.extract_stem('drums', stem_array, source_sr=44100,
+                                          store=ChromaStore(output_dir))
+        features['tempo'], features['beat_frames']
+    """
+
+    def __init__(self, analyzer: Optional[ChordAnalyzer] = None):
+        """
+        Args:
+            analyzer: Define taxa de amostragem, hop, frame e tipo de chroma
+                      (None = perfil padrão)
+        """
+        self.analyzer = analyzer or ChordAnalyzer.from_profile()
+
+    @property
+    def sample_rate(self) -> int:
+        return self.analyzer.sample_rate
+
+    def extract(self, y: np.ndarray, sr: int) -> Dict[str, np.ndarray]:
+        """
+        Calcula todas as features de um sinal mono já na taxa de análise
+
+        Returns:
+            Dicionário nome -> array (frames na grade de hop_length)
+        """
+        frames = SpectralFrames(y, sr, self.analyzer)
+        features = {}
+        for compute in FEATURES.values():
+            features.update(compute(frames))
+        return features
+
+    def extract_stem(self, stem: str, source: Union[str, np.ndarray], source_sr: Optional[int] = None,
+                     store: Optional[ChromaStore] = None) -> Dict[str, np.ndarray]:
+        """
+        Decodifica um stem uma vez, calcula as features e salva no diretório do upload
+
+        Args:
+            stem: Nome do stem
+            source: Caminho do arquivo do stem ou array já decodificado
+            source_sr: Taxa de amostragem do array recebido (quando não é caminho)
+            store: ChromaStore do upload (None para não salvar)
+
+        Returns:
+            Dicionário de features, com 'duration' (segundos)
+        """
+        sr = self.sample_rate
+        source_path = source if isinstance(source, str) else None
+        if source_path:
+            from pcm_cache import load_pcm
+            y, sr = load_pcm(source_path, sr=sr)
+        else:
+            y = ChordAnalyzer._prepare_signal(source, source_sr or sr, sr)
+
+        features = self.extract(y, sr)
+        duration = len(y) / sr
+
+        if store is not None:
+            store.save(stem, sr, self.analyzer.hop_length, features['chroma'], duration,
+                       source_path, kind=self.analyzer.chroma_type)
+            save_features(store.directory, stem, features, self._meta(stem, sr, duration))
+
+        features['duration'] = duration
+        return features
+
+    def _meta(self, stem: str, sr: int, duration: float) -> Dict:
+        return {
+            'stem': stem,
+            'sample_rate': int(sr),
+            'hop_length': int(self.analyzer.hop_length),
+            'frame_size': int(self.analyzer.frame_size),
+            'chroma_type': self.analyzer.chroma_type,
+            'duration': float(duration),
+            'features': sorted(FEATURES)
+        }
+
+
+def features_path(directory: str, stem: str, sr: int, hop_length: int, chroma_type: str) -> str:
+    """Arquivo de features de um stem (a chave inclui os parâmetros da grade de frames)"""
+    return os.path.join(directory, FEATURES_DIR, f'{stem}.features.{chroma_type}.sr{sr}.hop{hop_length}.npz')
+
+
+def save_features(directory: str, stem: str, features: Dict[str, np.ndarray], meta: Dict) -> bool:
+    """
+    Salva as features de um stem em um único .npz (escrita atômica)
+
+    Args:
+        directory: Diretório do upload processado
+        stem: Nome do stem
+        features: Dicionário nome -> array
+        meta: Parâmetros da extração (sample_rate, hop_length, chroma_type, duração...)
+
+    Returns:
+        True se salvou com sucesso, False caso contrário
+    """
+    path = features_path(directory, stem, meta['sample_rate'], meta['hop_length'], meta['chroma_type'])
+    arrays = {name: np.asarray(value) for name, value in features.items()}
+    arrays['times'] = frame_times(arrays['chroma'].shape[1], meta['sample_rate'], meta['hop_length'])
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"Aviso: não foi possível salvar as features de '{stem}': {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_features(directory: str, stem: str, analyzer: Optional[ChordAnalyzer] = None) -> Optional[Dict]:
+    """
+    Lê as features salvas de um stem
+
+    Args:
+        directory: Diretório do upload processado
+        stem: Nome do stem
+        analyzer: Define a grade de frames procurada (None = perfil padrão)
+
+    Returns:
+        Dicionário nome -> array, com 'meta' já decodificado, ou None se não houver
+    """
+    analyzer = analyzer or ChordAnalyzer.from_profile()
+    path = features_path(directory, stem, analyzer.sample_rate, analyzer.hop_length, analyzer.chroma_type)
+    try:
+        with np.load(path) as data:
+            features = {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+
+    features['meta'] = json.loads(str(features['meta']))
+    return features
+
+
+def extract_upload_features(processed_dir: str, profile: Optional[str] = None) -> Dict[str, Tuple[float, int]]:
+    """
+    Extrai as features dos stems (.mp3) de um upload já processado
+
+    Returns:
+        Dicionário stem -> (tempo em BPM, quantidade de batidas)
+    """
+    extractor = FeatureExtractor(ChordAnalyzer.from_profile(profile))
+    store = ChromaStore(processed_dir)
+    summary = {}
+    for stem in ['vocals', 'drums', 'bass', 'other']:
+        stem_path = os.path.join(processed_dir, f'{stem}.mp3')
+        if os.path.exists(stem_path):
+            features = extractor.extract_stem(stem, stem_path, store=store)
+            summary[stem] = (float(features['tempo'][0]), len(features['beat_frames']))
+    return summary
+
+
+if __name__ == '__main__':
+    """
+    Gera as features de um upload já processado:
+    python3 feature_extractor.py /path/to/processed/upload_123/ [perfil]
+    """
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Uso: python3 feature_extractor.py <diretório_processado> [perfil]")
+        sys.exit(1)
+
+    summary = extract_upload_features(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    if not summary:
+        print("Nenhum stem encontrado")
+        sys.exit(1)
+
+    for stem, (tempo, beats) in summary.items():
+        print(f"{stem}: {tempo:.1f} BPM, {beats} batidas")
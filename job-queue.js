@@ -0,0 +1,212 @@
+require('dotenv').config();
+const { execFile } = require('child_process');
+const { dbOperations, whenReady } = require('./database');
+const processingWorker = require('./processing-worker');
+const logger = require('./logger');
+
+// Quantidade máxima de jobs de separação rodando ao mesmo tempo
+const maxConcurrentJobs = Math.max(1, parseInt(process.env.MAX_CONCURRENT_JOBS, 10) || 1);
+
+// Orçamento de memória para os jobs em execução (MB)
+const memoryBudgetMb = parseInt(process.env.JOB_MEMORY_BUDGET_MB, 10) || 6144;
+
+// Estimativa de pico de memória de um job: base (modelo + TensorFlow) + custo por minuto de áudio
+const memoryBaseMb = parseInt(process.env.JOB_MEMORY_BASE_MB, 10) || 1500;
+const memoryPerMinuteMb = parseInt(process.env.JOB_MEMORY_PER_MINUTE_MB, 10) || 200;
+
+// Tentativas de um job cujo worker terminou durante o processamento (ex.: falta de memória);
+// cada nova tentativa retoma das etapas já concluídas (manifest.json)
+const maxJobAttempts = Math.max(1, parseInt(process.env.MAX_JOB_ATTEMPTS, 10) || 3);
+
+// Prioridades (menor = processado antes)
+const PRIORITY_ADMIN = 0;
+const PRIORITY_DEFAULT = 10;
+
+// Bitrate assumido quando não é possível ler a duração do arquivo (bits/s)
+const FALLBACK_BITRATE = 128000;
+
+// Jobs em execução: uploadId -> memória estimada (MB)
+const runningJobs = new Map();
+let pumping = false;
+let pumpAgain = false;
+
+// Estima a duração do áudio em segundos usando ffprobe (ou o tamanho do arquivo)
+function estimateDuration(filePath, fileSize, callback) {
+    const args = ['-v', 'error', '-show_entries', 'format=duration', '-of', 'default=nw=1:nk=1', filePath];
+
+    execFile('ffprobe', args, { timeout: 10000 }, (err, stdout) => {
+        const duration = parseFloat(stdout);
+        if (!err && duration > 0) {
+            return callback(duration);
+        }
+
+        const fallback = (fileSize * 8) / FALLBACK_BITRATE;
+        logger.warn(`ffprobe indisponível para ${filePath}, duração estimada pelo tamanho: ${fallback.toFixed(1)}s`);
+        callback(fallback);
+    });
+}
+
+// Estima o pico de memória (MB) de um job a partir da duração do áudio
+function estimateMemoryMb(durationSeconds) {
+    return memoryBaseMb + memoryPerMinuteMb * ((durationSeconds || 0) / 60);
+}
+
+// Memória estimada de todos os jobs em execução
+function memoryInUse() {
+    let total = 0;
+    runningJobs.forEach(memory => { total += memory; });
+    return total;
+}
+
+// Coloca um upload na fila de processamento
+function enqueue(uploadId, filePath, fileSize, options, callback) {
+    options = options || {};
+    callback = callback || (() => {});
+
+    const priority = options.isAdmin ? PRIORITY_ADMIN : PRIORITY_DEFAULT;
+
+    estimateDuration(filePath, fileSize, (duration) => {
+        dbOperations.enqueueUpload(uploadId, priority, duration, (err) => {
+            if (err) {
+                logger.error(`Erro ao enfileirar upload ${uploadId}: ${err.message}`);
+                return callback(err);
+            }
+
+            logger.info(`Upload ${uploadId} na fila (prioridade ${priority}, ~${duration.toFixed(0)}s de áudio)`);
+            callback(null);
+            pump();
+        });
+    });
+}
+
+// Inicia jobs da fila enquanto houver vaga e memória disponível
+function pump() {
+    if (pumping) {
+        pumpAgain = true;
+        return;
+    }
+
+    const slots = maxConcurrentJobs - runningJobs.size;
+    if (slots <= 0) {
+        return;
+    }
+
+    pumping = true;
+    pumpAgain = false;
+
+    dbOperations.getQueuedUploads(slots, (err, uploads) => {
+        if (err) {
+            logger.error('Erro ao ler fila de processamento: ' + err.message);
+            pumping = false;
+            return;
+        }
+
+        startNext(uploads || [], () => {
+            pumping = false;
+            if (pumpAgain) {
+                pump();
+            }
+        });
+    });
+}
+
+// Inicia os jobs em ordem, parando no primeiro que não couber no orçamento de memória
+function startNext(uploads, done) {
+    if (uploads.length === 0 || runningJobs.size >= maxConcurrentJobs) {
+        return done();
+    }
+
+    const upload = uploads[0];
+    const memory = estimateMemoryMb(upload.estimated_duration);
+
+    // Sempre admite um job quando nada está rodando, senão um arquivo grande nunca sairia da fila
+    if (runningJobs.size > 0 && memoryInUse() + memory > memoryBudgetMb) {
+        logger.info(`Upload ${upload.id} aguardando memória (~${memory.toFixed(0)}MB, ` +
+            `em uso ~${memoryInUse().toFixed(0)}MB de ${memoryBudgetMb}MB)`);
+        return done();
+    }
+
+    dbOperations.markUploadStarted(upload.id, (err, claimed) => {
+        if (err) {
+            logger.error(`Erro ao iniciar upload ${upload.id}: ${err.message}`);
+            return done();
+        }
+
+        if (claimed) {
+            runJob(upload, memory);
+        }
+        startNext(uploads.slice(1), done);
+    });
+}
+
+// Executa um job no worker e libera a vaga ao terminar
+function runJob(upload, memory) {
+    runningJobs.set(upload.id, memory);
+    logger.info(`Iniciando processamento do upload ${upload.id} ` +
+        `(${runningJobs.size}/${maxConcurrentJobs} jobs, ~${memoryInUse().toFixed(0)}MB)`);
+
+    // upload.attempts foi lido antes do markUploadStarted, que conta esta tentativa
+    const attempt = (upload.attempts || 0) + 1;
+
+    processingWorker.submitJob(upload.file_path, upload.id, (error) => {
+        runningJobs.delete(upload.id);
+
+        if (error && error.workerExited && attempt < maxJobAttempts) {
+            return requeueJob(upload.id, attempt, error);
+        }
+
+        if (error) {
+            logger.error(`Erro ao processar áudio do upload ${upload.id}: ${error.message}` +
+                (error.workerExited ? ` (tentativa ${attempt}/${maxJobAttempts})` : ''));
+            dbOperations.updateProcessingStatus(upload.id, 'error', null, () => {});
+        }
+
+        dbOperations.markUploadFinished(upload.id, () => pump());
+    });
+}
+
+// Devolve à fila um job interrompido pela saída do worker
+function requeueJob(uploadId, attempt, error) {
+    dbOperations.requeueUpload(uploadId, (err, requeued) => {
+        if (err) {
+            logger.error(`Erro ao recolocar upload ${uploadId} na fila: ${err.message}`);
+            dbOperations.updateProcessingStatus(uploadId, 'error', null, () => {});
+        } else if (requeued) {
+            logger.warn(`${error.message} (upload ${uploadId}, tentativa ${attempt}/${maxJobAttempts}); ` +
+                'upload voltou para a fila');
+        }
+        pump();
+    });
+}
+
+// Recoloca na fila jobs interrompidos e começa a processar a fila
+function start() {
+    whenReady(() => {
+        dbOperations.requeueStaleUploads((err, count) => {
+            if (err) {
+                logger.error('Erro ao recuperar jobs interrompidos: ' + err.message);
+            } else if (count > 0) {
+                logger.warn(`${count} upload(s) interrompido(s) voltaram para a fila`);
+            }
+            pump();
+        });
+    });
+}
+
+// Situação atual da fila (para diagnóstico)
+function getStatus() {
+    return {
+        maxConcurrentJobs,
+        maxJobAttempts,
+        memoryBudgetMb,
+        memoryInUseMb: Math.round(memoryInUse()),
+        running: Array.from(runningJobs.keys())
+    };
+}
+
+module.exports = {
+    enqueue,
+    start,
+    getStatus,
+    estimateMemoryMb
+};
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga do pipeline de processamento
+
+Envia N uploads sintéticos com uma taxa de chegada escolhida para workers
+persistentes (como os do processing-worker.js), cada um chamando o mesmo
+run_job do modo worker do process_audio. O separador pode ser o Spleeter
+ou o StubSeparator com uma espera configurável, para rodar sem modelo e
+sem TensorFlow. Cada chegada insere a linha do upload no banco, como o
+servidor, então os workers disputam o SQLite como em produção.
+
+Relata vazão, latência de ponta a ponta (chegada → resultado) p50/p95/p99,
+espera na fila, pico de memória dos workers e erros de bloqueio do SQLite.
+
+Uso:
+    python3 loadtest.py --uploads 50 --rate 10 --workers 2 --stub-delay 5
+    python3 loadtest.py --uploads 20 --rate 0 --durations 30,300 --separator spleeter
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import sqlite3
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+
+from bench_fixtures import StubSeparator, fixture_path
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES_DIR = os.path.join(BASE_DIR, 'bench', 'fixtures')
+
+ARRIVALS = ('poisson', 'uniform')
+SEPARATORS = ('stub', 'spleeter')
+
+PERCENTILES = (50, 95, 99)
+
+# Espera máxima por um resultado antes de considerar os workers travados (segundos)
+RESULT_TIMEOUT = 3600
+
+# Colunas de uploads usadas pelo pipeline (subconjunto da tabela criada pelo database.js)
+UPLOADS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        original_filename TEXT NOT NULL,
+        processing_status TEXT DEFAULT 'pending',
+        processed_path TEXT,
+        queued_at DATETIME
+    )
+'''
+
+
+def _peak_rss_mb():
+    """Pico de memória residente em MB (ru_maxrss é em KB no Linux e em bytes no macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def arrival_offsets(count, rate_per_minute, arrival='poisson', seed=0):
+    """
+    Instantes de chegada (segundos desde o início) de cada upload
+
+    Args:
+        count: Quantidade de uploads
+        rate_per_minute: Uploads por minuto (0 = todos de uma vez)
+        arrival: 'poisson' (intervalos exponenciais) ou 'uniform' (intervalo fixo)
+        seed: Semente dos intervalos aleatórios
+
+    Returns:
+        Lista crescente com count instantes
+    """
+    if rate_per_minute <= 0:
+        return [0.0] * count
+
+    interval = 60.0 / rate_per_minute
+    if arrival == 'uniform':
+        return [i * interval for i in range(count)]
+
+    gaps = np.random.RandomState(seed).exponential(interval, count)
+    gaps[0] = 0.0
+    return np.cumsum(gaps).tolist()
+
+
+def percentiles(values):
+    """p50/p95/p99 (None sem valores)"""
+    if not values:
+        return {f'p{p}': None for p in PERCENTILES}
+    return {f'p{p}': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+
+
+def create_database(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(UPLOADS_TABLE_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def job_peak_rss_mb(upload_id):
+    """
+    Picos de memória do job gravados pelo pipeline (upload_profiles)
+
+    O profiler reinicia o pico do processo a cada etapa, então ru_maxrss no
+    fim do job só cobre a última etapa; ele é usado apenas quando o pico do
+    job não pôde ser medido.
+
+    Returns:
+        Tupla (pico do worker, pico do ffmpeg ou None). O pico do ffmpeg é o
+        VmHWM do próprio subprocesso lido pelo MultiEncoder; RUSAGE_CHILDREN
+        não serve porque, com fork+exec, informa o RSS do worker no fork.
+    """
+    import process_audio
+
+    try:
+        conn = sqlite3.connect(process_audio.get_db_path(), timeout=30)
+        try:
+            row = conn.execute('SELECT peak_rss_mb, stages FROM upload_profiles WHERE upload_id = ?',
+                               (upload_id,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        row = None
+    if not row:
+        return _peak_rss_mb(), None
+
+    ffmpeg_peaks = []
+    try:
+        tasks = json.loads(row[1] or '{}').get('tasks') or []
+        ffmpeg_peaks = [task['ffmpeg_peak_rss_mb'] for task in tasks
+                        if task.get('ffmpeg_peak_rss_mb') is not None]
+    except (ValueError, AttributeError):
+        pass
+    peak = row[0] if row[0] is not None else _peak_rss_mb()
+    return peak, max(ffmpeg_peaks, default=None)
+
+
+def worker_main(slot, options, jobs, results):
+    """
+    Processo worker: carrega separador e analyzer uma vez e processa jobs até receber None
+
+    Cada resultado leva os tempos do job, os erros de bloqueio do SQLite
+    durante o job e os picos de memória do job e do ffmpeg (ver job_peak_rss_mb).
+    """
+    os.environ['PROCESSING_WORKER_SLOT'] = str(slot)
+    if not options['verbose']:
+        # Logs do pipeline descartados (o progresso é mostrado pelo processo principal)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+
+    import process_audio
+    from pipeline_db import lock_error_count
+
+    try:
+        process_audio.apply_cpu_limits()
+        if options['separator'] == 'spleeter':
+            separator = process_audio.load_separator()
+            process_audio.warm_up_separator(separator)
+        else:
+            separator = StubSeparator(options['stub_seconds_per_minute'], options['stub_delay'])
+        analyzer = process_audio.create_chord_analyzer()
+    except Exception as e:
+        results.put({'event': 'fatal', 'slot': slot, 'error': str(e)})
+        return
+    results.put({'event': 'ready', 'slot': slot, 'pid': os.getpid()})
+
+    for job in iter(jobs.get, None):
+        lock_errors = lock_error_count()
+        started = time.time()
+        try:
+            result = process_audio.run_job(job, separator, analyzer)
+        except Exception as e:
+            result = {'upload_id': job['upload_id'], 'success': False, 'error': str(e)}
+        peak, ffmpeg_peak = job_peak_rss_mb(job['upload_id'])
+        results.put(dict(result, event='result', slot=slot, started=started, finished=time.time(),
+                         lock_errors=lock_error_count() - lock_errors, peak_rss_mb=round(peak, 1),
+                         ffmpeg_peak_rss_mb=round(ffmpeg_peak, 1) if ffmpeg_peak is not None else None))
+
+
+def submit_uploads(db_path, uploads, offsets, started, jobs, submitted, server_errors):
+    """
+    Simula o servidor: na hora de cada chegada insere o upload no banco e envia o job
+
+    submitted recebe upload_id -> instante da chegada; server_errors[0]
+    conta os erros de bloqueio nas inserções.
+    """
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        for (index, audio_path), offset in zip(uploads, offsets):
+            delay = started + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            arrived = time.time()
+            while True:
+                try:
+                    with conn:
+                        cursor = conn.execute(
+                            "INSERT INTO uploads (original_filename, processing_status, queued_at) "
+                            "VALUES (?, 'queued', CURRENT_TIMESTAMP)", (os.path.basename(audio_path),))
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e).lower() and 'busy' not in str(e).lower():
+                        raise
+                    server_errors[0] += 1
+
+            upload_id = cursor.lastrowid
+            submitted[upload_id] = (index, arrived)
+            jobs.put({'audio_path': audio_path, 'upload_id': upload_id})
+    finally:
+        conn.close()
+
+
+def run_load_test(options):
+    """
+    Executa o teste de carga
+
+    Args:
+        options: Dicionário com uploads, rate, arrival, workers, durations,
+                 waveform, separator, stub_delay, stub_seconds_per_minute,
+                 seed, fixtures_dir, workdir, cache e verbose
+
+    Returns:
+        Dicionário com o relatório
+    """
+    workdir = options['workdir'] or tempfile.mkdtemp(prefix='loadtest_')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'uploads.db')
+    create_database(db_path)
+
+    # Herdadas pelos workers (spawn); o load_dotenv não sobrescreve variáveis existentes
+    os.environ['DATA_DIR'] = workdir
+    os.environ['DB_PATH'] = db_path
+    os.environ['MAX_CONCURRENT_JOBS'] = str(options['workers'])
+    if not options['cache']:
+        os.environ['PROCESSING_CACHE'] = 'false'
+
+    fixtures = [fixture_path(options['fixtures_dir'], duration, options['waveform'])
+                for duration in options['durations']]
+    uploads = [(i, fixtures[i % len(fixtures)]) for i in range(options['uploads'])]
+    offsets = arrival_offsets(options['uploads'], options['rate'], options['arrival'], options['seed'])
+
+    context = multiprocessing.get_context('spawn')
+    jobs = context.Queue()
+    results = context.Queue()
+    workers = [context.Process(target=worker_main, args=(slot, options, jobs, results), daemon=True)
+               for slot in range(options['workers'])]
+    for worker in workers:
+        worker.start()
+
+    # Inicialização dos workers (modelo) fora das medidas, como no servidor
+    print(f"Iniciando {len(workers)} worker(s) ({options['separator']})...")
+    init_started = time.time()
+    for _ in workers:
+        message = results.get()
+        if message['event'] == 'fatal':
+            for worker in workers:
+                worker.terminate()
+            raise RuntimeError(f"Worker {message['slot']} não inicializou: {message['error']}")
+    print(f"Workers prontos em {time.time() - init_started:.1f}s")
+
+    submitted = {}
+    server_errors = [0]
+    finished = []
+    started = time.time()
+    submitter = threading.Thread(target=submit_uploads,
+                                 args=(db_path, uploads, offsets, started, jobs, submitted, server_errors),
+                                 daemon=True)
+    submitter.start()
+
+    try:
+        while len(finished) < len(uploads):
+            try:
+                message = results.get(timeout=RESULT_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"Nenhum resultado em {RESULT_TIMEOUT}s; "
+                                   f"{len(finished)}/{len(uploads)} uploads concluídos")
+            index, arrived = submitted[message['upload_id']]
+            message.update(index=index, arrived=arrived, latency=message['finished'] - arrived,
+                           wait=message['started'] - arrived, service=message['finished'] - message['started'])
+            finished.append(message)
+            print(f"[{len(finished)}/{len(uploads)}] upload {message['upload_id']}: "
+                  f"{'ok' if message['success'] else 'erro'} em {message['latency']:.1f}s "
+                  f"(fila {message['wait']:.1f}s, worker {message['slot']})")
+    finally:
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+
+    report = build_report(options, finished, started, server_errors[0])
+    report['statuses'] = count_statuses(db_path)
+    if not options['workdir'] and not options['keep']:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        report['workdir'] = workdir
+    return report
+
+
+def count_statuses(db_path):
+    """Quantidade de uploads por processing_status no fim do teste"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return dict(conn.execute('SELECT processing_status, COUNT(*) FROM uploads GROUP BY processing_status'))
+    finally:
+        conn.close()
+
+
+def build_report(options, finished, started, server_lock_errors):
+    """Agrega os resultados dos jobs"""
+    succeeded = [job for job in finished if job['success']]
+    elapsed = max((job['finished'] for job in finished), default=started) - started
+
+    # Pico por worker: o maior pico entre os jobs de cada um. O pico do ffmpeg
+    # é informado à parte e não entra no total: ele existe só durante a
+    # codificação, que não coincide necessariamente com o pico do worker
+    peaks = {}
+    for job in finished:
+        peaks[job['slot']] = max(peaks.get(job['slot'], 0.0), job['peak_rss_mb'])
+    ffmpeg_peaks = [job['ffmpeg_peak_rss_mb'] for job in finished if job.get('ffmpeg_peak_rss_mb') is not None]
+
+    return {
+        'config': {key: options[key] for key in ('uploads', 'rate', 'arrival', 'workers', 'durations',
+                                                 'separator', 'stub_delay', 'stub_seconds_per_minute')},
+        'cpu_count': os.cpu_count(),
+        'completed': len(succeeded),
+        'failed': len(finished) - len(succeeded),
+        'elapsed': round(elapsed, 3),
+        'throughput_per_hour': round(len(succeeded) / elapsed * 3600, 1) if elapsed > 0 else None,
+        'latency': percentiles([job['latency'] for job in succeeded]),
+        'wait': percentiles([job['wait'] for job in succeeded]),
+        'service': percentiles([job['service'] for job in succeeded]),
+        'peak_rss_mb': max(peaks.values(), default=0.0),
+        'ffmpeg_peak_rss_mb': max(ffmpeg_peaks, default=None),
+        'total_peak_rss_mb': round(sum(peaks.values()), 1),
+        'lock_errors': {'workers': sum(job['lock_errors'] for job in finished), 'server': server_lock_errors}
+    }
+
+
+def print_report(report):
+    config = report['config']
+
+    def show(values):
+        return ' | '.join(f"{name} {value:.2f}s" if value is not None else f"{name} -"
+                          for name, value in values.items())
+
+    print()
+    print(f"Uploads: {report['completed']} concluídos, {report['failed']} com erro "
+          f"({config['workers']} worker(s), {config['rate']}/min {config['arrival']}, "
+          f"separador {config['separator']}, {report['cpu_count']} CPUs)")
+    print(f"Tempo total: {report['elapsed']:.1f}s")
+    if report['throughput_per_hour'] is not None:
+        print(f"Vazão: {report['throughput_per_hour']:.1f} uploads/hora")
+    print(f"Latência (chegada → resultado): {show(report['latency'])}")
+    print(f"Espera na fila:                 {show(report['wait'])}")
+    print(f"Processamento:                  {show(report['service'])}")
+    print(f"Pico de memória: {report['peak_rss_mb']:.1f} MB por worker, "
+          f"até {report['total_peak_rss_mb']:.1f} MB somando os workers")
+    if report['ffmpeg_peak_rss_mb'] is not None:
+        print(f"Pico do ffmpeg: {report['ffmpeg_peak_rss_mb']:.1f} MB por codificação "
+              f"(à parte; não incluído no total)")
+    print(f"Erros de bloqueio do SQLite: {report['lock_errors']['workers']} nos workers, "
+          f"{report['lock_errors']['server']} nas inserções")
+    print(f"Status no banco: {', '.join(f'{status}={count}' for status, count in report['statuses'].items())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do pipeline de processamento')
+    parser.add_argument('--uploads', type=int, default=20, help='Quantidade de uploads (padrão: 20)')
+    parser.add_argument('--rate', type=float, default=6.0,
+                        help='Chegadas por minuto (0 = todos de uma vez; padrão: 6)')
+    parser.add_argument('--arrival', default='poisson', choices=ARRIVALS)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MAX_CONCURRENT_JOBS') or 1),
+                        help='Workers simultâneos (padrão: MAX_CONCURRENT_JOBS ou 1)')
+    parser.add_argument('--durations', default='30',
+                        help='Durações dos áudios em segundos, alternadas entre os uploads (ex: 30,300)')
+    parser.add_argument('--waveform', default='sine', choices=['sine', 'saw'])
+    parser.add_argument('--separator', default='stub', choices=SEPARATORS)
+    parser.add_argument('--stub-delay', type=float, default=0.0,
+                        help='Espera fixa do separador falso por upload (segundos)')
+    parser.add_argument('--stub-seconds-per-minute', type=float, default=0.0,
+                        help='Espera do separador falso por minuto de áudio (segundos)')
+    parser.add_argument('--seed', type=int, default=0, help='Semente das chegadas poisson')
+    parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument('--workdir', help='DATA_DIR e banco do teste (padrão: diretório temporário removido no fim)')
+    parser.add_argument('--keep', action='store_true', help='Mantém o diretório temporário')
+    parser.add_argument('--cache', action='store_true',
+                        help='Mantém o cache de processamento (uploads repetidos viram acertos)')
+    parser.add_argument('--output', help='Salva o relatório em JSON')
+    parser.add_argument('--verbose', action='store_true', help='Mostra os logs dos workers')
+    args = parser.parse_args()
+
+    if args.uploads < 1 or args.workers < 1:
+        parser.error('--uploads e --workers precisam ser maiores que zero')
+    durations = [float(d) for d in args.durations.split(',') if d.strip()]
+    if not durations:
+        parser.error('informe ao menos uma duração')
+
+    options = dict(vars(args), durations=durations)
+    try:
+        report = run_load_test(options)
+    except RuntimeError as e:
+        print(f"ERRO: {e}")
+        return 1
+
+    print_report(report)
+    if args.output:
+        tmp_path = f'{args.output}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, args.output)
+        print(f"\nRelatório salvo em {args.output}")
+
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
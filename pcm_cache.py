@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PCM Cache - Stems decodificados guardados como .npy para leitura com memory map
+Regenerar acordes ou waveforms de um upload processado decodificava os MP3
+de novo (ffmpeg + reamostragem) a cada vez. Com o cache, a primeira
+decodificação de um arquivo em uma taxa de amostragem é salva e as
+seguintes mapeiam o array direto do disco, sem cópia.
+
+As entradas são removidas por tamanho (LRU), como no cache de
+processamento: músicas usadas com frequência continuam rápidas e as
+demais voltam a ser decodificadas.
+
+Variáveis de ambiente:
+    PCM_CACHE          true (padrão) ou false
+    PCM_CACHE_MAX_MB   tamanho máximo em MB (padrão: 2048)
+    PCM_CACHE_DTYPE    float32 (padrão, leitura sem cópia) ou int16 (metade do espaço)
+    PCM_CACHE_DIR      diretório do cache (padrão: DATA_DIR/cache/pcm)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+from typing import Optional, Tuple
+
+
+# Versão do formato; mudar invalida todas as entradas antigas
+CACHE_VERSION = 1
+
+DTYPES = ('float32', 'int16')
+
+# Escala das amostras guardadas como int16
+INT16_SCALE = 32767
+
+# Caches por processo (um por configuração), criados sob demanda
+_caches = {}
+
+
+def source_signature(path: str) -> dict:
+    """Assinatura barata do arquivo de origem (caminho, tamanho e mtime)"""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _decode(path: str, sr: Optional[int], mono: bool) -> Tuple[np.ndarray, int]:
+    import librosa
+    return librosa.load(path, sr=sr, mono=mono)
+
+
+class PCMCache:
+    """
+    Cache de áudio decodificado
+
+    Cada entrada é um .npy com o sinal na taxa pedida; um índice SQLite
+    (WAL) guarda taxa de amostragem, tamanho e último uso, e as entradas
+    menos usadas são removidas quando o total passa de max_bytes. A
+    chave inclui tamanho e mtime do arquivo, então um stem regravado
+    nunca devolve o áudio antigo.
+
+    Uso:
+        cache = PCMCache('data/cache/pcm', 2048 * 1024 * 1024)
+        y, sr = cache.load('processed/upload_1/other.mp3', sr=22050)
+    """
+
+    def __init__(self, root: str, max_bytes: int, dtype: str = 'float32'):
+        """
+        Args:
+            root: Diretório do cache
+            max_bytes: Tamanho máximo; as entradas menos usadas são removidas
+            dtype: 'float32' (memory map sem cópia) ou 'int16' (metade do espaço,
+                   convertido para float32 na leitura)
+
+        Raises:
+            ValueError: Se o dtype não for suportado
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Tipo de amostra inválido: {dtype} (válidos: {', '.join(DTYPES)})")
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        os.makedirs(root, exist_ok=True)
+
+        with self._index() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    sample_rate INTEGER NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+
+    @contextmanager
+    def _index(self):
+        """Transação no índice (uma conexão por operação: o cache é usado de threads e processos)"""
+        conn = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, path: str, sr: Optional[int], mono: bool) -> str:
+        payload = json.dumps({'version': CACHE_VERSION, 'source': source_signature(path),
+                              'sr': sr, 'mono': mono, 'dtype': self.dtype}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.npy')
+
+    def get(self, path: str, sr: Optional[int] = None, mono: bool = True) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Lê um arquivo do cache
+
+        Args:
+            path: Arquivo de áudio de origem
+            sr: Taxa de amostragem pedida (None = a original do arquivo)
+            mono: Sinal mono (como em librosa.load)
+
+        Returns:
+            Tupla (sinal float32 somente leitura, taxa de amostragem) ou None se não estiver no cache
+        """
+        key = self._key(path, sr, mono)
+        with self._index() as conn:
+            row = conn.execute('SELECT sample_rate FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+
+        try:
+            y = np.load(self._entry_path(key), mmap_mode='r')
+        except (OSError, ValueError):
+            # Removida por outro processo entre o índice e a leitura
+            with self._index() as conn:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+
+        if y.dtype == np.int16:
+            y = y.astype(np.float32) / INT16_SCALE
+        return y, row[0]
+
+    def put(self, path: str, sr: Optional[int], mono: bool, y: np.ndarray, sample_rate: int) -> bool:
+        """
+        Salva um sinal decodificado (escrita atômica) e aplica o limite de tamanho
+
+        Args:
+            path: Arquivo de áudio de origem
+            sr: Taxa de amostragem pedida (parte da chave; None = original)
+            mono: Sinal mono (parte da chave)
+            y: Sinal decodificado
+            sample_rate: Taxa de amostragem do sinal
+
+        Returns:
+            True se a entrada foi gravada
+        """
+        key = self._key(path, sr, mono)
+        entry_path = self._entry_path(key)
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+
+        if self.dtype == 'int16':
+            data = (np.clip(y, -1.0, 1.0) * INT16_SCALE).astype(np.int16)
+        else:
+            data = np.asarray(y, dtype=np.float32)
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print(f"Aviso: falha ao salvar no cache de PCM: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        now = time.time()
+        with self._index() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, source, sample_rate, size_bytes, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, os.path.abspath(path), int(sample_rate), os.path.getsize(entry_path), now, now)
+            )
+
+        self.evict()
+        return True
+
+    def load(self, path: str, sr: Optional[int] = None, mono: bool = True) -> Tuple[np.ndarray, int]:
+        """
+        Mesmo contrato de librosa.load: lê do cache ou decodifica e salva
+
+        Returns:
+            Tupla (sinal float32, taxa de amostragem); o sinal vindo do cache é
+            somente leitura (memory map)
+        """
+        cached = self.get(path, sr, mono)
+        if cached is not None:
+            return cached
+
+        y, sample_rate = _decode(path, sr, mono)
+        self.put(path, sr, mono, y, sample_rate)
+        return y, sample_rate
+
+    def evict(self) -> int:
+        """
+        Remove as entradas menos usadas até o cache caber em max_bytes
+
+        Returns:
+            Quantidade de entradas removidas
+        """
+        with self._index() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            removed = []
+            for key, size in conn.execute('SELECT key, size_bytes FROM entries ORDER BY last_used ASC'):
+                if total <= self.max_bytes:
+                    break
+                removed.append(key)
+                total -= size
+
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in removed])
+
+        # Leitores com o arquivo mapeado continuam lendo normalmente após a remoção
+        for key in removed:
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+        return len(removed)
+
+
+def default_cache() -> Optional[PCMCache]:
+    """
+    Cache configurado pelas variáveis de ambiente
+
+    Returns:
+        PCMCache ou None se PCM_CACHE=false ou se o diretório não puder ser usado
+    """
+    if os.getenv('PCM_CACHE', 'true').lower() == 'false':
+        return None
+
+    root = os.getenv('PCM_CACHE_DIR')
+    if not root:
+        data_dir = os.getenv('DATA_DIR', './data')
+        if not os.path.isabs(data_dir):
+            data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), data_dir)
+        root = os.path.join(data_dir, 'cache', 'pcm')
+
+    max_bytes = int(float(os.getenv('PCM_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+    dtype = os.getenv('PCM_CACHE_DTYPE', 'float32')
+
+    config = (root, max_bytes, dtype)
+    if config not in _caches:
+        try:
+            _caches[config] = PCMCache(root, max_bytes, dtype)
+        except (OSError, sqlite3.Error, ValueError) as e:
+            print(f"Aviso: cache de PCM indisponível: {e}")
+            _caches[config] = None
+    return _caches[config]
+
+
+def load_pcm(path: str, sr: Optional[int] = None, mono: bool = True) -> Tuple[np.ndarray, int]:
+    """
+    Decodifica um arquivo de áudio passando pelo cache de PCM, quando ativo
+
+    Substitui librosa.load(path, sr=sr, mono=mono) na leitura de stems.
+    O sinal devolvido pode ser somente leitura (memory map).
+
+    Args:
+        path: Arquivo de áudio
+        sr: Taxa de amostragem (None = a original do arquivo)
+        mono: Converte para mono
+
+    Returns:
+        Tupla (sinal float32, taxa de amostragem)
+    """
+    cache = default_cache()
+    if cache is None:
+        return _decode(path, sr, mono)
+
+    try:
+        return cache.load(path, sr, mono)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Aviso: cache de PCM indisponível ({e}); decodificando {os.path.basename(path)}")
+        return _decode(path, sr, mono)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Peak Pyramid - Picos min/max de um stem em vários níveis de zoom
+Salvo como <stem>.peaks.bin ao lado do PNG: o nível 0 tem uma coluna a cada
+BASE_SAMPLES_PER_PIXEL amostras e cada nível seguinte junta duas colunas do
+anterior. Qualquer trecho de qualquer nível é lido direto do arquivo (mmap
+no Python, requisição HTTP Range no player), sem decodificar o áudio.
+
+Layout (little-endian):
+    cabeçalho   '<4sHHIQ'  magic, versão, qtd. de níveis, taxa de amostragem, total de amostras
+    níveis      '<IIQ'     para cada nível: amostras por coluna, qtd. de colunas, offset dos dados
+    dados       int16[colunas, 2] por nível: pares (min, max) * 32767
+"""
+
+import os
+import mmap
+import struct
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+
+MAGIC = b'PKPY'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIQ')
+LEVEL = struct.Struct('<IIQ')
+
+# Amostras por coluna do nível mais detalhado (~5.8 ms a 44.1 kHz)
+BASE_SAMPLES_PER_PIXEL = 256
+
+# Níveis são gerados até a largura cair abaixo disso (ou até MAX_LEVELS)
+MIN_COLUMNS = 512
+MAX_LEVELS = 16
+
+# Escala dos picos quantizados (int16)
+PEAK_SCALE = 32767
+
+
+def _downsample(level: np.ndarray) -> np.ndarray:
+    """Junta pares de colunas (min dos mínimos, max dos máximos)"""
+    starts = np.arange(0, len(level), 2)
+    return np.stack([np.minimum.reduceat(level[:, 0], starts),
+                     np.maximum.reduceat(level[:, 1], starts)], axis=1)
+
+
+class PyramidBuilder:
+    """
+    Monta a pirâmide recebendo o sinal em blocos (a separação em janelas
+    não mantém o stem inteiro em memória)
+
+    Uso:
+        builder = PyramidBuilder(44100)
+        builder.add(bloco)
+        builder.write('processed/upload_1/vocals.peaks.bin')
+    """
+
+    def __init__(self, sample_rate: int, samples_per_pixel: int = BASE_SAMPLES_PER_PIXEL):
+        """
+        Args:
+            sample_rate: Taxa de amostragem do sinal
+            samples_per_pixel: Amostras por coluna do nível 0
+        """
+        self.sample_rate = int(sample_rate)
+        self.samples_per_pixel = int(samples_per_pixel)
+        self.samples_seen = 0
+        self._columns: List[np.ndarray] = []
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    def add(self, y: np.ndarray) -> None:
+        """Adiciona um bloco mono (amostras,)"""
+        y = np.asarray(y, dtype=np.float32)
+        self.samples_seen += len(y)
+        if len(self._rest):
+            y = np.concatenate([self._rest, y])
+
+        full = len(y) // self.samples_per_pixel * self.samples_per_pixel
+        if full:
+            frames = y[:full].reshape(-1, self.samples_per_pixel)
+            self._columns.append(np.stack([frames.min(axis=1), frames.max(axis=1)], axis=1))
+        self._rest = y[full:].copy()
+
+    def levels(self) -> List[Tuple[int, np.ndarray]]:
+        """
+        Níveis da pirâmide
+
+        Returns:
+            Lista de (amostras por coluna, array (colunas, 2) float32 com min/max)
+        """
+        columns = list(self._columns)
+        if len(self._rest):
+            columns.append(np.array([[self._rest.min(), self._rest.max()]], dtype=np.float32))
+        base = np.concatenate(columns) if columns else np.zeros((0, 2), dtype=np.float32)
+
+        levels = [(self.samples_per_pixel, base)]
+        while len(levels) < MAX_LEVELS and len(levels[-1][1]) > MIN_COLUMNS:
+            spp, level = levels[-1]
+            levels.append((spp * 2, _downsample(level)))
+        return levels
+
+    def encode(self) -> bytes:
+        """Conteúdo do arquivo .peaks.bin"""
+        levels = self.levels()
+
+        offset = HEADER.size + LEVEL.size * len(levels)
+        table = []
+        data = []
+        for spp, level in levels:
+            table.append(LEVEL.pack(spp, len(level), offset))
+            quantized = np.round(np.clip(level, -1.0, 1.0) * PEAK_SCALE).astype('<i2')
+            data.append(quantized.tobytes())
+            offset += quantized.nbytes
+
+        header = HEADER.pack(MAGIC, VERSION, len(levels), self.sample_rate, self.samples_seen)
+        return header + b''.join(table) + b''.join(data)
+
+    def write(self, output_path: str) -> bool:
+        """
+        Salva a pirâmide (escrita atômica)
+
+        Returns:
+            True se salvou com sucesso, False caso contrário
+        """
+        tmp_path = f'{output_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.encode())
+            os.replace(tmp_path, output_path)
+            return True
+        except OSError as e:
+            print(f"Erro ao salvar pirâmide de picos: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+
+def write_pyramid(y: np.ndarray, sample_rate: int, output_path: str) -> bool:
+    """
+    Gera o .peaks.bin de um sinal mono já decodificado
+
+    Args:
+        y: Sinal mono (amostras,)
+        sample_rate: Taxa de amostragem
+        output_path: Caminho do arquivo de saída
+
+    Returns:
+        True se salvou com sucesso, False caso contrário
+    """
+    builder = PyramidBuilder(sample_rate)
+    builder.add(y)
+    return builder.write(output_path)
+
+
+class PeakPyramid:
+    """
+    Leitor do .peaks.bin mapeado em memória
+
+    Abrir o arquivo lê apenas o cabeçalho e a tabela de níveis; cada
+    consulta copia só as colunas do trecho pedido.
+
+    Uso:
+        with PeakPyramid('processed/upload_1/vocals.peaks.bin') as pyramid:
+            peaks = pyramid.peaks_for_width(30.0, 60.0, 800)
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Caminho do arquivo .peaks.bin
+
+        Raises:
+            ValueError: Se o arquivo não estiver no formato esperado
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size < HEADER.size:
+                raise ValueError(f"Arquivo de picos inválido: {path}")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self) -> None:
+        magic, version, n_levels, sample_rate, total_samples = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Arquivo de picos inválido ou de outra versão: {self.path}")
+
+        self.sample_rate = sample_rate
+        self.total_samples = total_samples
+        self.levels: List[Dict] = []
+        for i in range(n_levels):
+            spp, columns, offset = LEVEL.unpack_from(self._mmap, HEADER.size + i * LEVEL.size)
+            if offset + columns * 4 > len(self._mmap):
+                raise ValueError(f"Arquivo de picos truncado: {self.path}")
+            self.levels.append({'samples_per_pixel': spp, 'columns': columns, 'offset': offset})
+
+    @property
+    def duration(self) -> float:
+        return self.total_samples / self.sample_rate if self.sample_rate else 0.0
+
+    def close(self) -> None:
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def level_for(self, samples_per_pixel: float) -> int:
+        """
+        Nível mais grosso que ainda tem pelo menos uma coluna por pixel
+
+        Args:
+            samples_per_pixel: Amostras do áudio por pixel da tela
+
+        Returns:
+            Índice do nível (0 se o zoom pedir mais detalhe que o nível 0)
+        """
+        chosen = 0
+        for i, level in enumerate(self.levels):
+            if level['samples_per_pixel'] <= samples_per_pixel:
+                chosen = i
+        return chosen
+
+    def peaks(self, t0: float, t1: float, level: int = 0) -> Dict:
+        """
+        Picos das colunas que cobrem o intervalo [t0, t1) em um nível
+
+        Args:
+            t0: Início em segundos
+            t1: Fim em segundos
+            level: Índice do nível
+
+        Returns:
+            Dicionário com 'samples_per_pixel', 'start' (tempo da primeira
+            coluna, em segundos) e arrays float32 'min' e 'max'
+        """
+        info = self.levels[level]
+        spp = info['samples_per_pixel']
+        first = min(max(0, int(t0 * self.sample_rate) // spp), info['columns'])
+        last = min(info['columns'], max(first, -(-int(np.ceil(t1 * self.sample_rate)) // spp)))
+
+        data = np.frombuffer(self._mmap, dtype='<i2', count=(last - first) * 2,
+                             offset=info['offset'] + first * 4).reshape(-1, 2)
+        values = data.astype(np.float32) / PEAK_SCALE
+        return {
+            'samples_per_pixel': spp,
+            'start': first * spp / self.sample_rate,
+            'min': values[:, 0],
+            'max': values[:, 1]
+        }
+
+    def peaks_for_width(self, t0: float, t1: float, pixels: int) -> Dict:
+        """Picos de [t0, t1) no nível adequado para desenhar em 'pixels' colunas"""
+        samples_per_pixel = (t1 - t0) * self.sample_rate / max(1, pixels)
+        return self.peaks(t0, t1, self.level_for(samples_per_pixel))
+
+
+def open_pyramid(processed_dir: str, stem: str) -> Optional[PeakPyramid]:
+    """
+    Abre a pirâmide de picos de um stem
+
+    Returns:
+        PeakPyramid ou None se o upload foi processado antes do formato
+    """
+    path = os.path.join(processed_dir, f'{stem}.peaks.bin')
+    if not os.path.exists(path):
+        return None
+    return PeakPyramid(path)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline DB - Gravações do pipeline Python no banco SQLite (uploads.db)
+
+O servidor Node grava no mesmo arquivo. Cada job usa uma única conexão em
+modo WAL com busy_timeout, e as gravações são feitas em transações curtas
+(BEGIN IMMEDIATE), repetidas com backoff quando o banco está bloqueado.
+Status, processed_path e o perfil de execução do fim do job vão para o
+banco em uma única transação.
+"""
+
+import json
+import time
+import random
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+# Tabela com o último perfil de cada upload (também criada pelo database.js)
+# peak_rss_mb é o pico do job (NULL se o pico não pode ser reiniciado; o pico
+# da vida do processo fica no JSON de stages, em lifetime_peak_rss_mb)
+PROFILE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS upload_profiles (
+        upload_id INTEGER PRIMARY KEY,
+        status TEXT,
+        input_duration REAL,
+        total_wall REAL,
+        total_cpu REAL,
+        peak_rss_mb REAL,
+        stages TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (upload_id) REFERENCES uploads(id) ON DELETE CASCADE
+    )
+'''
+
+# Espera do próprio SQLite por um lock antes de desistir de uma tentativa (ms)
+BUSY_TIMEOUT_MS = 5000
+
+# Tentativas de uma gravação intermediária (ex: 'processing') e da gravação final
+UPDATE_ATTEMPTS = 3
+FINAL_ATTEMPTS = 8
+
+# Backoff entre tentativas: base * 2^tentativa (com jitter), limitado a BACKOFF_MAX
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 5.0
+
+# Erros de bloqueio ('database is locked'/'busy') no processo, somados entre jobs
+_lock_errors = 0
+_lock_errors_guard = threading.Lock()
+
+
+def lock_error_count() -> int:
+    """Total de erros de bloqueio do SQLite neste processo"""
+    return _lock_errors
+
+
+def _count_lock_error() -> None:
+    global _lock_errors
+    with _lock_errors_guard:
+        _lock_errors += 1
+
+
+def is_lock_error(error: Exception) -> bool:
+    """Erro transitório de concorrência (vale tentar de novo)"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class JobDatabase:
+    """
+    Conexão de um job com o banco de uploads
+
+    As alterações são acumuladas com update() e gravadas juntas; se o banco
+    continuar bloqueado depois das tentativas, elas ficam pendentes e vão
+    na próxima gravação (o job não para esperando o banco). finish() grava
+    o status final, o caminho e o perfil com mais tentativas.
+
+    Uso:
+        db = JobDatabase(get_db_path(), upload_id)
+        db.update(status='processing')
+        ...
+        db.finish('completed', '/processed/upload_1', profile)
+        db.close()
+    """
+
+    def __init__(self, db_path: str, upload_id, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        """
+        Args:
+            db_path: Caminho do uploads.db
+            upload_id: ID do upload
+            busy_timeout_ms: Espera do SQLite por um lock em cada tentativa
+        """
+        self.db_path = db_path
+        self.upload_id = upload_id
+        self.busy_timeout_ms = busy_timeout_ms
+        self.lock_errors = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Autocommit: as transações são abertas explicitamente em _write
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+            try:
+                # Persistente no arquivo: leitores (Node) não bloqueiam o escritor
+                conn.execute('PRAGMA journal_mode = WAL')
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                self._record_lock_error()
+            self._conn = conn
+        return self._conn
+
+    def _record_lock_error(self) -> None:
+        self.lock_errors += 1
+        _count_lock_error()
+
+    def _write(self, statements: List[Tuple[str, tuple]], attempts: int) -> bool:
+        """Executa as instruções em uma transação, repetindo com backoff em caso de bloqueio"""
+        for attempt in range(attempts):
+            try:
+                conn = self._connection()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                return True
+            except sqlite3.Error as e:
+                if not is_lock_error(e):
+                    print(f"Erro ao atualizar banco de dados: {e}")
+                    return False
+
+                self._record_lock_error()
+                if attempt + 1 < attempts:
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    print(f"Banco bloqueado ({e}); nova tentativa em {delay:.2f}s")
+                    time.sleep(delay)
+
+        print(f"Aviso: banco bloqueado após {attempts} tentativas; gravação adiada")
+        return False
+
+    def _statements(self, profile: Optional[Dict] = None) -> List[Tuple[str, tuple]]:
+        statements = []
+        if self._pending:
+            columns = ', '.join(f'{column} = ?' for column in self._pending)
+            statements.append((f'UPDATE uploads SET {columns} WHERE id = ?',
+                               tuple(self._pending.values()) + (self.upload_id,)))
+        if profile is not None:
+            statements.append((PROFILE_TABLE_SQL, ()))
+            statements.append((
+                '''INSERT OR REPLACE INTO upload_profiles
+                   (upload_id, status, input_duration, total_wall, total_cpu, peak_rss_mb, stages)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (int(self.upload_id), profile.get('status'), profile.get('input_duration'),
+                 profile.get('total_wall'), profile.get('total_cpu'), profile.get('peak_rss_mb'),
+                 json.dumps({'stages': profile.get('stages', []), 'tasks': profile.get('tasks', []),
+                             'lifetime_peak_rss_mb': profile.get('lifetime_peak_rss_mb')}))
+            ))
+        return statements
+
+    def update(self, status: Optional[str] = None, processed_path: Optional[str] = None,
+               flush: bool = True) -> bool:
+        """
+        Registra alterações do upload e tenta gravá-las
+
+        Args:
+            status: Novo processing_status
+            processed_path: Novo processed_path
+            flush: Grava agora (False apenas acumula para a próxima gravação)
+
+        Returns:
+            True se não há alterações pendentes depois da chamada
+        """
+        if status is not None:
+            self._pending['processing_status'] = status
+        if processed_path is not None:
+            self._pending['processed_path'] = processed_path
+
+        if not flush or not self._pending:
+            return not self._pending
+
+        if self._write(self._statements(), UPDATE_ATTEMPTS):
+            self._pending.clear()
+            print(f"Status atualizado para: {status or '(sem mudança)'}")
+        return not self._pending
+
+    def finish(self, status: str, processed_path: Optional[str] = None,
+               profile: Optional[Dict] = None) -> bool:
+        """
+        Grava o status final, o caminho e o perfil do job em uma única transação
+
+        Returns:
+            True se a gravação foi concluída
+        """
+        self.update(status, processed_path, flush=False)
+        written = self._write(self._statements(profile), FINAL_ATTEMPTS)
+        if written:
+            self._pending.clear()
+            print(f"Status atualizado para: {status}")
+        else:
+            print(f"ERRO: não foi possível gravar o status '{status}' do upload {self.upload_id}")
+        return written
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def update_upload_status(db_path: str, upload_id, status: str, processed_path: Optional[str] = None) -> bool:
+    """Atualiza o status de um upload fora de um job (conexão própria, mesmas tentativas)"""
+    db = JobDatabase(db_path, upload_id)
+    try:
+        return db.finish(status, processed_path)
+    finally:
+        db.close()
@@ -7,74 +7,866 @@ Separa a música em 4 faixas: vocals, drums, bass, other
 import sys
 import os
 import json
-import sqlite3
+import hashlib
+import time
 from pathlib import Path
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use backend sem display
-import matplotlib.pyplot as plt
-import librosa
-import soundfile as sf
-from pydub import AudioSegment
 from dotenv import load_dotenv
 
+# librosa e spleeter são importados nas funções que os usam: o
+# worker e os scripts que só importam funções auxiliares iniciam rápido
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
-def convert_wav_to_mp3(wav_file, mp3_file, bitrate='192k'):
-    """Converte arquivo WAV para MP3"""
+# Taxa de amostragem usada pelo Spleeter
+SAMPLE_RATE = 44100
+
+# Modelo do Spleeter (faz parte do fingerprint da etapa de separação)
+SEPARATOR_MODEL = 'spleeter:4stems'
+
+# Stems gerados pelo modelo spleeter:4stems e suas cores no waveform
+STEMS = ['vocals', 'drums', 'bass', 'other']
+STEM_COLORS = {
+    'vocals': '#FF6B6B',    # Vermelho
+    'drums': '#4ECDC4',     # Ciano
+    'bass': '#FFD93D',      # Amarelo
+    'other': '#6C5CE7'      # Roxo
+}
+
+def load_audio(audio_path, sample_rate=SAMPLE_RATE):
+    """
+    Decodifica o arquivo de áudio para um array (amostras, canais) float32
+    usando o mesmo adaptador de áudio do Spleeter (ou o ffmpeg direto, em
+    estéreo, quando o Spleeter/TensorFlow não está instalado: benchmarks e
+    testes de carga com separador falso)
+    """
     try:
-        print(f"Convertendo {os.path.basename(wav_file)} para MP3...")
+        from spleeter.audio.adapter import AudioAdapter
+    except ImportError:
+        return decode_with_ffmpeg(audio_path, sample_rate)
 
-        # Carrega o arquivo WAV
-        audio = AudioSegment.from_wav(wav_file)
+    waveform, _ = AudioAdapter.default().load(audio_path, sample_rate=sample_rate)
+    return waveform
 
-        # Exporta como MP3
-        audio.export(mp3_file, format='mp3', bitrate=bitrate)
+def decode_with_ffmpeg(audio_path, sample_rate=SAMPLE_RATE, channels=2):
+    """Decodifica o arquivo com o ffmpeg para um array (amostras, canais) float32"""
+    import subprocess
 
-        print(f"MP3 salvo em: {mp3_file}")
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', audio_path,
+               '-map', '0:a:0', '-f', 'f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou ao decodificar {audio_path}: "
+                           f"{result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype='<f4').reshape(-1, channels)
+
+def to_mono(samples):
+    """Converte um array (amostras, canais) em mono"""
+    if samples.ndim > 1:
+        return samples.mean(axis=1)
+    return samples
+
+def render_waveform(samples, sr, output_image, color='#4CAF50', peaks_file=None, pyramid_file=None):
+    """
+    Gera imagem da forma de onda a partir de um array de áudio já decodificado
+
+    O sinal é reduzido a picos min/max/RMS por coluna e o PNG é escrito
+    diretamente (ver waveform_renderer.py). Se peaks_file for informado,
+    os picos também são salvos em JSON para o player; pyramid_file recebe
+    os picos em vários níveis de zoom (ver peak_pyramid.py).
+    """
+    try:
+        import waveform_renderer
+
+        mono = to_mono(samples)
+        waveform_renderer.render_waveform(mono, sr, output_image, color, peaks_file)
+
+        if pyramid_file:
+            from peak_pyramid import write_pyramid
+            write_pyramid(mono, sr, pyramid_file)
+
+        print(f"Waveform salvo em: {output_image}")
         return True
     except Exception as e:
-        print(f"Erro ao converter para MP3: {e}")
+        print(f"Erro ao gerar waveform: {e}")
         return False
 
-def generate_waveform(audio_file, output_image, color='#4CAF50'):
-    """Gera imagem da forma de onda do áudio"""
+def get_stem_workers():
+    """Quantidade de workers do pós-processamento dos stems (STEM_WORKERS)"""
+    import cpu_governor
+
+    default = min(len(STEMS) + 1, cpu_governor.job_cpu_count())
+    try:
+        return max(1, int(os.getenv('STEM_WORKERS', default)))
+    except ValueError:
+        return default
+
+def create_stem_pool(workers):
+    """
+    Cria o pool do pós-processamento dos stems
+
+    STEM_POOL=thread (padrão) usa threads: os arrays são compartilhados sem
+    cópia e o trabalho pesado (numpy, ffmpeg) roda fora do GIL.
+    STEM_POOL=process usa processos 'spawn' (os arrays são copiados para
+    cada processo; evita fork de um processo com o TensorFlow carregado).
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    if os.getenv('STEM_POOL', 'thread') == 'process':
+        import multiprocessing
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return ThreadPoolExecutor(max_workers=workers)
+
+# Duração dos blocos enviados ao ffmpeg (limita a cópia intercalada dos stems)
+ENCODE_BLOCK_SECONDS = 10
+
+def get_renditions():
+    """Escada de renditions de ENCODE_RENDITIONS (ex: full:mp3:192k,preview:opus:64k)"""
+    from stem_encoder import DEFAULT_RENDITIONS, parse_renditions
+
     try:
-        print(f"Gerando waveform para: {os.path.basename(audio_file)}")
+        return parse_renditions(os.getenv('ENCODE_RENDITIONS'))
+    except ValueError as e:
+        print(f"Aviso: ENCODE_RENDITIONS inválida ({e}); usando {DEFAULT_RENDITIONS}")
+        return parse_renditions(DEFAULT_RENDITIONS)
 
-        # Carrega o áudio
-        y, sr = librosa.load(audio_file, sr=None, mono=True)
+def encode_stems(prediction, output_dir, renditions):
+    """
+    Codifica todos os stems em todas as renditions com um único ffmpeg,
+    enviando o PCM direto dos arrays em memória
 
-        # Configurações para imagem sem margens
-        width_px = 1200
-        height_px = 300
-        dpi = 100
+    Returns:
+        Tupla (stems_paths: stem -> MP3, sucesso, pico de memória do ffmpeg em MB ou None)
+    """
+    from stem_encoder import MAIN_RENDITION, MultiEncoder
 
-        # Cria figura com dimensões exatas em pixels
-        fig = plt.figure(figsize=(width_px/dpi, height_px/dpi), dpi=dpi, facecolor='none')
-        ax = fig.add_axes([0, 0, 1, 1])  # [left, bottom, width, height] - ocupa 100% da figura
-        ax.set_facecolor('none')
+    stems = [stem for stem in STEMS if prediction.get(stem) is not None]
+    print(f"Codificando {len(stems)} stems em {', '.join(r['name'] for r in renditions)}...")
 
-        # Plota a forma de onda
-        time = np.linspace(0, len(y) / sr, len(y))
-        ax.fill_between(time, y, alpha=0.6, color=color)
-        ax.plot(time, y, color=color, linewidth=0.5, alpha=0.8)
+    encoder = MultiEncoder(output_dir, stems, renditions, SAMPLE_RATE)
+    block = ENCODE_BLOCK_SECONDS * SAMPLE_RATE
+    try:
+        length = max(len(prediction[stem]) for stem in stems)
+        for start in range(0, length, block):
+            encoder.write({stem: prediction[stem][start:start + block] for stem in stems})
+    except Exception:
+        encoder.abort()
+        raise
 
-        # Remove eixos e define limites exatos
-        ax.set_xlim(0, len(y) / sr)
-        ax.set_ylim(-1, 1)
-        ax.axis('off')
+    if not encoder.close():
+        return {}, False, encoder.peak_rss_mb
+    return ({stem: outputs[MAIN_RENDITION] for stem, outputs in encoder.outputs.items()}, True,
+            encoder.peak_rss_mb)
 
-        # Salva imagem sem qualquer margem ou padding
-        plt.savefig(output_image, transparent=True, bbox_inches=None, pad_inches=0, dpi=dpi)
-        plt.close()
+def waveform_outputs(output_dir, stem):
+    """Arquivos do waveform de um stem: imagem, picos (JSON) e pirâmide de picos"""
+    return (os.path.join(output_dir, f'{stem}.png'),
+            os.path.join(output_dir, f'{stem}.peaks.json'),
+            os.path.join(output_dir, f'{stem}.peaks.bin'))
 
-        print(f"Waveform salvo em: {output_image}")
-        return True
+def postprocess_stem(stem, samples, output_dir, extractor=None, waveform=True):
+    """
+    Gera waveform e features espectrais de um stem (extractor=None pula as
+    features e waveform=False pula o waveform, já gerados antes)
+
+    Returns:
+        Tupla (stem, chromagram (chroma, None, duração) ou None, lista de erros,
+        tempos {'waveform'|'features': (wall, cpu da thread)})
+    """
+    errors = []
+    timings = {}
+    chroma = None
+
+    # Gera waveform
+    if waveform:
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        waveform_image, peaks_file, pyramid_file = waveform_outputs(output_dir, stem)
+        if not render_waveform(samples, SAMPLE_RATE, waveform_image, STEM_COLORS[stem], peaks_file, pyramid_file):
+            errors.append('waveform')
+        timings['waveform'] = (time.perf_counter() - started, time.thread_time() - cpu_started)
+
+    # Chroma, RMS, onsets e batidas a partir de uma única STFT (features/)
+    if extractor is not None:
+        from chord_analyzer import ChromaStore
+
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            features = extractor.extract_stem(stem, samples, SAMPLE_RATE, ChromaStore(output_dir))
+            chroma = (features['chroma'], None, features['duration'])
+        except Exception as e:
+            print(f"Erro ao extrair features de '{stem}': {e}")
+            errors.append('features')
+        timings['features'] = (time.perf_counter() - started, time.thread_time() - cpu_started)
+
+    return stem, chroma, errors, timings
+
+def get_chord_fusion():
+    """
+    Pesos da análise combinada dos stems nos novos uploads (CHORD_FUSION=true)
+
+    Returns:
+        Pesos por stem (CHORD_FUSION_WEIGHTS ou os padrão do ChordAnalyzer) ou
+        None para usar só o stem de maior prioridade com acordes (padrão)
+    """
+    if os.getenv('CHORD_FUSION', 'false').lower() != 'true':
+        return None
+
+    from chord_analyzer import ChordAnalyzer, parse_fusion_weights
+    return parse_fusion_weights(os.getenv('CHORD_FUSION_WEIGHTS')) or ChordAnalyzer.FUSION_WEIGHTS
+
+def analyze_chords(analyzer, stems, output_dir, chromas=None):
+    """
+    Analisa os acordes a partir dos stems em memória e salva chords.json
+
+    Com CHORD_FUSION=true os stems harmônicos são combinados em uma única
+    linha do tempo (ver ChordAnalyzer.analyze_fused).
+    """
+    from chord_analyzer import ChromaStore
+
+    # O chromagram calculado fica salvo para a regeneração de acordes;
+    # os já calculados pela extração de features não são refeitos
+    store = ChromaStore(output_dir)
+    fusion_weights = get_chord_fusion()
+    if fusion_weights:
+        chord_data = analyzer.analyze_fused(stems, source_sr=SAMPLE_RATE, store=store,
+                                            weights=fusion_weights, chromas=chromas)
+    else:
+        chord_data = analyzer.analyze_stems(stems, source_sr=SAMPLE_RATE, store=store, chromas=chromas)
+
+    chords_file = os.path.join(output_dir, 'chords.json')
+    analyzer.save_to_json(chord_data, chords_file)
+    print(f"Acordes salvos em: {chords_file}")
+    print(f"Total de eventos detectados: {len(chord_data.get('events', []))}")
+
+    return chords_file
+
+# Duração dos blocos do stem de harmonia enviados aos acordes parciais
+PARTIAL_CHORDS_BLOCK_SECONDS = 10
+
+def stream_partial_chords(analyzer, samples, output_dir, stop):
+    """
+    Acordes parciais do stem de harmonia ('other') durante o pós-processamento
+
+    O stem já separado é enviado ao ChordStream em blocos: os eventos de
+    cada bloco vão para chords.partial.ndjson, servido pela API enquanto o
+    job está em 'processing', antes de o chords.json final existir.
+
+    Args:
+        analyzer: ChordAnalyzer do processamento
+        samples: Stem 'other' (amostras, canais) em SAMPLE_RATE
+        output_dir: Diretório de saída
+        stop: threading.Event; interrompe o envio (acordes finais já salvos)
+
+    Returns:
+        ChordStream (o chamador remove o arquivo parcial com close)
+    """
+    from chord_analyzer import ChordStream
+    from chord_timeline import PARTIAL_FILENAME
+
+    stream = ChordStream(analyzer, source_sr=SAMPLE_RATE,
+                         partial_path=os.path.join(output_dir, PARTIAL_FILENAME),
+                         metadata={'primary_stem': 'other', 'duration': len(samples) / SAMPLE_RATE})
+    block = PARTIAL_CHORDS_BLOCK_SECONDS * SAMPLE_RATE
+    try:
+        for start in range(0, len(samples), block):
+            if stop.is_set():
+                break
+            stream.push(samples[start:start + block])
     except Exception as e:
-        print(f"Erro ao gerar waveform: {e}")
-        return False
+        print(f"Aviso: acordes parciais interrompidos: {e}")
+    return stream
+
+def timed_call(function, *args):
+    """Executa function(*args) e retorna (resultado, wall, cpu da thread)"""
+    started, cpu_started = time.perf_counter(), time.thread_time()
+    result = function(*args)
+    return result, time.perf_counter() - started, time.thread_time() - cpu_started
+
+def pooled_call(function, *args):
+    """
+    timed_call para o pool dos stems: inclui o PID e o pico de memória (VmHWM)
+    do processo que executou a tarefa, usados pelo profiler com STEM_POOL=process
+
+    Returns:
+        Tupla (resultado, wall, cpu da thread, (pid, pico em MB ou None))
+    """
+    from stage_profiler import hwm_rss_mb
+
+    result, wall, cpu = timed_call(function, *args)
+    return result, wall, cpu, (os.getpid(), hwm_rss_mb())
+
+def postprocess_stems(prediction, output_dir, analyzer, profiler=None, manifest=None):
+    """
+    Pós-processa os stems separados em paralelo: a codificação de todos os
+    stems (um único ffmpeg) e, ao mesmo tempo, waveform + features de cada
+    stem; os acordes saem dos chromagrams calculados nas features
+
+    Com um manifest (ver stage_fingerprints), só as etapas pendentes são
+    executadas e cada etapa concluída é registrada assim que termina.
+    Com os acordes pendentes, o stem 'other' alimenta os acordes parciais
+    (stream_partial_chords) até o chords.json final ser salvo.
+
+    Args:
+        prediction: Dicionário stem -> array (amostras, canais); pode ser None
+                    quando só os acordes estão pendentes
+        output_dir: Diretório de saída
+        analyzer: ChordAnalyzer usado na análise de acordes (define a grade das features)
+        profiler: StageProfiler que recebe o tempo de cada tarefa (opcional)
+        manifest: StageManifest do upload (None = executa todas as etapas)
+
+    Returns:
+        Tupla (stems_paths: stem -> MP3, stem_errors: stem -> lista de erros)
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from stage_manifest import StageManifest
+
+    manifest = manifest or StageManifest(output_dir, None)
+
+    # Acordes parciais em uma thread própria (o pool pode ser de processos),
+    # enquanto features e codificação ainda rodam
+    partial_stop = threading.Event()
+    partial_pool = partial_future = None
+    if not manifest.is_done('chords') and prediction is not None and prediction.get('other') is not None:
+        partial_pool = ThreadPoolExecutor(max_workers=1)
+        partial_future = partial_pool.submit(stream_partial_chords, analyzer, prediction['other'],
+                                             output_dir, partial_stop)
+
+    try:
+        return _postprocess_stems(prediction, output_dir, analyzer, profiler, manifest)
+    finally:
+        if partial_future is not None:
+            partial_stop.set()
+            try:
+                partial_future.result().close(remove_partial=True)
+            except Exception as e:
+                print(f"Aviso: falha ao encerrar os acordes parciais: {e}")
+            partial_pool.shutdown()
+
+def _postprocess_stems(prediction, output_dir, analyzer, profiler, manifest):
+    """Corpo de postprocess_stems (waveform, features, codificação e acordes)"""
+    from feature_extractor import FeatureExtractor, features_path, load_features
+    from stem_encoder import rendition_filename
+
+    renditions = get_renditions()
+    stems = [stem for stem in STEMS if prediction is None or prediction.get(stem) is not None]
+
+    stems_paths = {stem: os.path.join(output_dir, f'{stem}.mp3') for stem in stems}
+    stem_errors = {}
+    chromas = {}
+    extractor = FeatureExtractor(analyzer)
+
+    # Etapas pendentes de cada stem: (waveform, features)
+    stem_tasks = {stem: (not manifest.is_done(f'waveform:{stem}'), not manifest.is_done(f'features:{stem}'))
+                  for stem in stems}
+
+    with create_stem_pool(get_stem_workers()) as pool:
+        encode_future = None
+        if not manifest.is_done('encode'):
+            encode_future = pool.submit(pooled_call, encode_stems, prediction, output_dir, renditions)
+        stem_futures = {
+            pool.submit(pooled_call, postprocess_stem, stem, prediction[stem], output_dir,
+                        extractor if features else None, waveform): stem
+            for stem, (waveform, features) in stem_tasks.items() if waveform or features
+        }
+
+        for future, stem in stem_futures.items():
+            waveform, features = stem_tasks[stem]
+            try:
+                (_, chroma, errors, timings), _, _, process_peak = future.result()
+            except Exception as e:
+                chroma, errors, timings, process_peak = None, [str(e)], {}, None
+                waveform = False
+
+            if profiler:
+                if process_peak:
+                    profiler.add_process_peak(*process_peak)
+                for task, (wall, cpu) in timings.items():
+                    profiler.add(f'{task}:{stem}', wall, cpu)
+
+            if waveform and 'waveform' not in errors:
+                manifest.complete(f'waveform:{stem}', waveform_outputs(output_dir, stem))
+            if features and chroma is not None:
+                manifest.complete(f'features:{stem}', [features_path(
+                    output_dir, stem, analyzer.sample_rate, analyzer.hop_length, analyzer.chroma_type)])
+
+            if chroma is not None:
+                chromas[stem] = chroma
+            if errors:
+                stem_errors[stem] = errors
+
+        if encode_future is not None:
+            try:
+                (stems_paths, encoded, ffmpeg_peak), wall, cpu, process_peak = encode_future.result()
+                if profiler:
+                    profiler.add('encode', wall, cpu, ffmpeg_peak_rss_mb=ffmpeg_peak)
+                    profiler.add_process_peak(*process_peak)
+            except Exception as e:
+                print(f"Erro ao codificar os stems: {e}")
+                encoded = False
+            if encoded:
+                manifest.complete('encode', [os.path.join(output_dir, rendition_filename(stem, rendition))
+                                             for stem in stems for rendition in renditions])
+            else:
+                for stem in stems:
+                    stem_errors.setdefault(stem, []).append('mp3')
+
+    if manifest.is_done('chords'):
+        return stems_paths, stem_errors
+
+    # Chromagrams de features extraídas em um processamento anterior
+    for stem in stems:
+        if stem not in chromas and manifest.is_done(f'features:{stem}'):
+            saved = load_features(output_dir, stem, analyzer)
+            if saved is not None:
+                chromas[stem] = (saved['chroma'], saved['times'], saved['meta']['duration'])
+
+    # Não falha o processamento se análise de acordes falhar
+    try:
+        _, wall, cpu = timed_call(analyze_chords, analyzer, prediction or dict.fromkeys(chromas),
+                                  output_dir, chromas)
+        if profiler:
+            profiler.add('chords', wall, cpu)
+        if set(chromas) == set(stems):
+            manifest.complete('chords', [os.path.join(output_dir, 'chords.json')])
+    except Exception as e:
+        print(f"Aviso: Não foi possível analisar acordes: {e}")
+
+    return stems_paths, stem_errors
+
+def get_chunk_seconds():
+    """
+    Duração máxima (segundos) de cada janela de separação (MAX_CHUNK_SECONDS)
+    0 desativa a separação em janelas
+    """
+    try:
+        return max(0.0, float(os.getenv('MAX_CHUNK_SECONDS', 120)))
+    except ValueError:
+        return 120.0
+
+def get_chunk_threshold_seconds():
+    """
+    Duração (segundos) a partir da qual o arquivo é separado em janelas
+    (CHUNK_THRESHOLD_SECONDS, padrão: 600)
+
+    Só gravações longas (ex: shows) usam as janelas: músicas comuns passam
+    pelo pós-processamento paralelo com as features de cada stem.
+    """
+    try:
+        return max(0.0, float(os.getenv('CHUNK_THRESHOLD_SECONDS', 600)))
+    except ValueError:
+        return 600.0
+
+def get_chunk_overlap_seconds():
+    """Sobreposição (segundos) entre janelas consecutivas (CHUNK_OVERLAP_SECONDS)"""
+    try:
+        return max(0.0, float(os.getenv('CHUNK_OVERLAP_SECONDS', 2)))
+    except ValueError:
+        return 2.0
+
+def probe_duration(audio_path):
+    """Duração do arquivo em segundos (via ffprobe); 0.0 se não for possível obter"""
+    try:
+        import ffmpeg
+        return float(ffmpeg.probe(audio_path)['format']['duration'])
+    except Exception as e:
+        print(f"Aviso: não foi possível obter a duração de {audio_path}: {e}")
+        return 0.0
+
+def iter_separated_chunks(audio_path, separator, chunk_seconds, overlap_seconds):
+    """
+    Separa o arquivo em janelas sobrepostas e gera os stems de cada trecho
+
+    Cada janela é decodificada e separada isoladamente; a sobreposição entre
+    janelas vizinhas é unida com cross-fade linear. Os trechos gerados são
+    consecutivos e sem sobreposição, prontos para serem concatenados.
+
+    Yields:
+        Dicionário stem -> array (amostras, canais) float32
+    """
+    from spleeter.audio.adapter import AudioAdapter
+
+    adapter = AudioAdapter.default()
+    chunk_samples = int(chunk_seconds * SAMPLE_RATE)
+    overlap = min(int(overlap_seconds * SAMPLE_RATE), chunk_samples // 2)
+    step_seconds = (chunk_samples - overlap) / SAMPLE_RATE
+
+    tail = None
+    offset = 0.0
+    while True:
+        waveform, _ = adapter.load(audio_path, offset=offset, duration=chunk_seconds,
+                                   sample_rate=SAMPLE_RATE)
+        if len(waveform) == 0:
+            break
+
+        is_last = len(waveform) < chunk_samples
+        stems = separator.separate(waveform)
+        del waveform
+
+        chunk = {}
+        new_tail = {}
+        for stem, samples in stems.items():
+            # Cross-fade com o final da janela anterior
+            if tail is not None and stem in tail:
+                n = min(len(tail[stem]), len(samples))
+                ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)[:, np.newaxis]
+                head = tail[stem][:n] * (1.0 - ramp) + samples[:n] * ramp
+                samples = np.concatenate([head, samples[n:]])
+
+            # O final desta janela espera a próxima para o cross-fade
+            if is_last or overlap == 0 or len(samples) <= overlap:
+                chunk[stem] = samples
+            else:
+                chunk[stem] = samples[:-overlap]
+                new_tail[stem] = samples[-overlap:]
+
+        tail = new_tail or None
+        yield chunk
+
+        if is_last:
+            tail = None
+            break
+        offset += step_seconds
+
+    # Arquivo terminou exatamente no fim de uma janela
+    if tail:
+        yield tail
+
+def process_chunked(audio_path, output_dir, separator, analyzer, duration, chunk_seconds,
+                    profiler=None, manifest=None):
+    """
+    Separação em janelas com memória limitada: cada trecho separado é enviado
+    diretamente ao encoder (um ffmpeg para todos os stems e renditions), ao
+    cálculo dos picos do waveform e ao chromagram, sem manter os stems
+    inteiros em memória
+
+    Com um manifest (ver stage_fingerprints), cada janela separada é salva
+    em stems/ e separação, codificação, waveform de cada stem e acordes são
+    etapas próprias: uma nova execução relê as janelas salvas (sem o
+    Spleeter) e alimenta só as etapas pendentes.
+
+    Com profiler, o tempo de cada tarefa é somado entre as janelas
+    (decodificação + separação ou leitura das janelas, envio ao encoder,
+    picos e chromagram).
+
+    Returns:
+        Tupla (stems_paths: stem -> MP3, stem_errors: stem -> lista de erros)
+    """
+    from stage_manifest import StageManifest, iter_chunk_arrays, remove_stem_arrays, save_chunk_arrays
+    from stem_encoder import MAIN_RENDITION, MultiEncoder, rendition_filename
+    from waveform_renderer import PeakAccumulator, write_waveform
+    from peak_pyramid import PyramidBuilder
+    from chord_analyzer import ChordStream, ChromaStore
+    from chord_timeline import PARTIAL_FILENAME
+
+    manifest = manifest or StageManifest(output_dir, None)
+    renditions = get_renditions()
+
+    # Stem usado nos acordes em tempo real (harmonia); os eventos de cada
+    # janela vão para o arquivo parcial, servido pela API antes do fim do job
+    chord_stem = 'other'
+
+    separated = manifest.is_done('separate')
+    encode = not manifest.is_done('encode')
+    waveform_stems = [stem for stem in STEMS if not manifest.is_done(f'waveform:{stem}')]
+    chords = not manifest.is_done('chords')
+
+    if separated:
+        # Só os stems usados pelas etapas pendentes são lidos de cada janela
+        needed = set(STEMS if encode else waveform_stems) | ({chord_stem} if chords else set())
+        chunks = iter_chunk_arrays(output_dir, [stem for stem in STEMS if stem in needed])
+        read_task = 'load_stems'
+    else:
+        # Janelas de uma execução anterior incompleta não são reaproveitadas
+        remove_stem_arrays(output_dir)
+        chunks = iter_separated_chunks(audio_path, separator, chunk_seconds, get_chunk_overlap_seconds())
+        read_task = 'separation'
+
+    expected_samples = int(duration * SAMPLE_RATE)
+    encoder = MultiEncoder(output_dir, STEMS, renditions, SAMPLE_RATE) if encode else None
+    accumulators = {stem: PeakAccumulator(expected_samples) for stem in waveform_stems}
+    pyramids = {stem: PyramidBuilder(SAMPLE_RATE) for stem in waveform_stems}
+    chord_stream = None
+    if chords:
+        chord_stream = ChordStream(analyzer, source_sr=SAMPLE_RATE,
+                                   partial_path=os.path.join(output_dir, PARTIAL_FILENAME),
+                                   metadata={'primary_stem': chord_stem, 'duration': duration})
+    # Só as tarefas executadas entram no perfil
+    timings = {read_task: 0.0}
+    if not separated and manifest.enabled:
+        timings['save_stems'] = 0.0
+    if encoder is not None:
+        timings['encode'] = 0.0
+    if waveform_stems:
+        timings['waveform'] = 0.0
+    if chord_stream is not None:
+        timings['chroma'] = 0.0
+    window_paths = []
+    windows = 0
+    samples_seen = 0
+
+    try:
+        clock = time.perf_counter()
+        for i, chunk in enumerate(chunks):
+            timings[read_task] += time.perf_counter() - clock
+            windows = i + 1
+
+            # Janela em disco (int16): uma falha adiante não refaz a separação
+            if not separated and manifest.enabled:
+                started = time.perf_counter()
+                window_paths.extend(save_chunk_arrays(output_dir, i, chunk))
+                timings['save_stems'] += time.perf_counter() - started
+
+            if encoder is not None:
+                started = time.perf_counter()
+                encoder.write(chunk)
+                timings['encode'] += time.perf_counter() - started
+
+            for stem in waveform_stems:
+                if stem not in chunk:
+                    continue
+                started = time.perf_counter()
+                mono = to_mono(chunk[stem])
+                accumulators[stem].add(mono)
+                pyramids[stem].add(mono)
+                timings['waveform'] += time.perf_counter() - started
+
+            if chord_stream is not None and chord_stem in chunk:
+                started = time.perf_counter()
+                chord_stream.push(chunk[chord_stem])
+                timings['chroma'] += time.perf_counter() - started
+
+            samples_seen += len(next(iter(chunk.values()), ()))
+            print(f"Janela {i + 1} {'relida' if separated else 'separada'} "
+                  f"({samples_seen / SAMPLE_RATE:.0f}s de {duration:.0f}s"
+                  f"{f', {len(chord_stream.events)} acordes' if chord_stream is not None else ''})")
+            clock = time.perf_counter()
+    except Exception:
+        if encoder is not None:
+            encoder.abort()
+        if chord_stream is not None:
+            chord_stream.close(remove_partial=True)
+        raise
+
+    if not separated:
+        manifest.complete('separate', window_paths)
+
+    stems_paths = {stem: os.path.join(output_dir, f'{stem}.mp3') for stem in STEMS}
+    stem_errors = {}
+
+    if encoder is not None:
+        started = time.perf_counter()
+        encoded = encoder.close()
+        timings['encode'] += time.perf_counter() - started
+
+        if encoded:
+            stems_paths = {stem: outputs[MAIN_RENDITION] for stem, outputs in encoder.outputs.items()}
+            for path in stems_paths.values():
+                print(f"MP3 salvo em: {path}")
+            manifest.complete('encode', [os.path.join(output_dir, rendition_filename(stem, rendition))
+                                         for stem in STEMS for rendition in renditions])
+        else:
+            for stem in STEMS:
+                stem_errors.setdefault(stem, []).append('mp3')
+
+    for stem in waveform_stems:
+        started = time.perf_counter()
+        try:
+            accumulator = accumulators[stem]
+            waveform_image, peaks_file, pyramid_file = waveform_outputs(output_dir, stem)
+            write_waveform(accumulator.peaks(), waveform_image, STEM_COLORS[stem], peaks_file,
+                           SAMPLE_RATE, accumulator.samples_seen)
+            pyramids[stem].write(pyramid_file)
+            manifest.complete(f'waveform:{stem}', waveform_outputs(output_dir, stem))
+        except Exception as e:
+            print(f"Erro ao gerar waveform: {e}")
+            stem_errors.setdefault(stem, []).append('waveform')
+        timings['waveform'] += time.perf_counter() - started
+
+    # Acordes a partir do chromagram calculado durante a separação
+    if chord_stream is not None:
+        started = time.perf_counter()
+        try:
+            store = ChromaStore(output_dir)
+            chord_stream.finish()
+            store.save(chord_stem, chord_stream.sr, analyzer.hop_length, chord_stream.chroma,
+                       chord_stream.duration, kind=analyzer.chroma_type)
+
+            chord_data = chord_stream.result()
+            chord_data['primary_stem'] = chord_stem
+
+            # CHORD_FUSION: combina o chromagram do stem de harmonia com os
+            # demais stems harmônicos, decodificados dos MP3
+            fusion_weights = get_chord_fusion()
+            if fusion_weights:
+                others = {stem: path for stem, path in stems_paths.items()
+                          if stem != chord_stem and stem in fusion_weights and os.path.exists(path)}
+                chord_data = analyzer.analyze_fused(
+                    {chord_stem: None, **others}, store=store, weights=fusion_weights,
+                    chromas={chord_stem: (chord_stream.chroma, None, chord_stream.duration)})
+
+            # Sem acordes no stem de harmonia: tenta os demais a partir dos MP3
+            if not chord_data['events']:
+                others = {stem: path for stem, path in stems_paths.items()
+                          if stem != chord_stem and os.path.exists(path)}
+                if others:
+                    chord_data = analyzer.analyze_stems(others, store=store)
+
+            chords_file = os.path.join(output_dir, 'chords.json')
+            if analyzer.save_to_json(chord_data, chords_file):
+                manifest.complete('chords', [chords_file])
+            print(f"Acordes salvos em: {chords_file}")
+            print(f"Total de eventos detectados: {len(chord_data.get('events', []))}")
+        except Exception as e:
+            print(f"Aviso: Não foi possível analisar acordes: {e}")
+        finally:
+            chord_stream.close(remove_partial=True)
+        timings['chroma'] += time.perf_counter() - started
+
+    if profiler:
+        for task, wall in timings.items():
+            extra = {'ffmpeg_peak_rss_mb': encoder.peak_rss_mb} if task == 'encode' else {}
+            profiler.add(task, wall, windows=windows, **extra)
+
+    return stems_paths, stem_errors
+
+def open_processing_cache(audio_path, params=None):
+    """
+    Abre o cache de resultados e calcula a chave do áudio
+
+    A chave é o hash do PCM mais o hash dos parâmetros do processamento
+    (processing_params): mudar perfil de análise, renditions, resoluções da
+    timeline ou o modo de separação (janelas, sem features) gera outra entrada.
+    Controlado por PROCESSING_CACHE (padrão: true) e PROCESSING_CACHE_MAX_MB.
+
+    Args:
+        audio_path: Arquivo de áudio original
+        params: Parâmetros do processamento (ver processing_params)
+
+    Returns:
+        Tupla (ProcessingCache, chave) ou (None, None) se desativado/indisponível
+    """
+    if os.getenv('PROCESSING_CACHE', 'true').lower() == 'false':
+        return None, None
+
+    try:
+        from processing_cache import ProcessingCache, audio_fingerprint
+
+        started = time.time()
+        key = audio_fingerprint(audio_path, SAMPLE_RATE)
+        if not key:
+            return None, None
+        print(f"Hash do áudio calculado em {time.time() - started:.2f}s")
+
+        if params is not None:
+            payload = json.dumps(params, sort_keys=True)
+            key = f'{key}-{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]}'
+
+        max_bytes = int(float(os.getenv('PROCESSING_CACHE_MAX_MB', 5120)) * 1024 * 1024)
+        cache = ProcessingCache(os.path.join(get_data_dir(), 'cache', 'processed'), max_bytes)
+        return cache, key
+    except Exception as e:
+        print(f"Aviso: cache de processamento indisponível: {e}")
+        return None, None
+
+def open_stage_manifest(audio_path, output_dir):
+    """
+    Abre o manifest de etapas do upload (STAGE_CHECKPOINTS, padrão: true)
+
+    Returns:
+        StageManifest (desativado se STAGE_CHECKPOINTS=false ou se a entrada
+        não puder ser lida)
+    """
+    from stage_manifest import StageManifest, file_fingerprint
+
+    if os.getenv('STAGE_CHECKPOINTS', 'true').lower() == 'false':
+        return StageManifest(output_dir, None)
+
+    try:
+        return StageManifest(output_dir, file_fingerprint(audio_path))
+    except OSError as e:
+        print(f"Aviso: checkpoints de etapas indisponíveis: {e}")
+        return StageManifest(output_dir, None)
+
+def processing_params(analyzer, chunk_seconds=None):
+    """
+    Parâmetros que mudam o resultado do processamento, por grupo
+
+    Base dos fingerprints das etapas (stage_fingerprints) e da chave do
+    cache de resultados (open_processing_cache).
+
+    Args:
+        analyzer: ChordAnalyzer do processamento
+        chunk_seconds: Duração das janelas (None = separação do arquivo inteiro)
+
+    Returns:
+        Dicionário grupo -> parâmetros (serializável em JSON)
+    """
+    from feature_extractor import FEATURES
+    from peak_pyramid import VERSION, BASE_SAMPLES_PER_PIXEL
+
+    separation = {'model': SEPARATOR_MODEL, 'sample_rate': SAMPLE_RATE}
+    if chunk_seconds:
+        separation.update(chunk_seconds=chunk_seconds, overlap_seconds=get_chunk_overlap_seconds())
+
+    return {
+        'separation': separation,
+        'renditions': get_renditions(),
+        'waveform': {'peak_pyramid': [VERSION, BASE_SAMPLES_PER_PIXEL]},
+        'colors': STEM_COLORS,
+        'analysis': {'profile': analyzer.profile, 'sample_rate': analyzer.sample_rate,
+                     'hop_length': analyzer.hop_length, 'frame_size': analyzer.frame_size,
+                     'chroma_type': analyzer.chroma_type, 'segment_duration': analyzer.segment_duration},
+        # Na separação em janelas não há features por stem e os acordes saem
+        # do chromagram do stem 'other' calculado janela a janela
+        'features': None if chunk_seconds else sorted(FEATURES),
+        'chord_stem': 'other' if chunk_seconds else None,
+        'fusion': get_chord_fusion(),
+        'resolutions': analyzer.resolutions
+    }
+
+def stage_fingerprints(manifest, params):
+    """
+    Fingerprints das etapas do processamento
+
+    Cada etapa depende dos parâmetros que mudam o seu resultado e do
+    fingerprint das etapas cuja saída consome.
+
+    Args:
+        manifest: StageManifest do upload
+        params: Parâmetros do processamento (ver processing_params)
+
+    Returns:
+        Dicionário etapa -> fingerprint
+    """
+    analysis = params['analysis']
+    separate = manifest.fingerprint(params['separation'])
+    fingerprints = {'separate': separate,
+                    'encode': manifest.fingerprint({'renditions': params['renditions']}, separate)}
+    for stem in STEMS:
+        fingerprints[f'waveform:{stem}'] = manifest.fingerprint(
+            {**params['waveform'], 'color': params['colors'][stem]}, separate)
+
+    chords = {**analysis, 'resolutions': params['resolutions']}
+    if params['fusion']:
+        chords['fusion'] = params['fusion']
+
+    if params['chord_stem']:
+        # Com a análise combinada, os demais stems são lidos dos MP3
+        depends = [separate, fingerprints['encode']] if params['fusion'] else [separate]
+        fingerprints['chords'] = manifest.fingerprint({**chords, 'stem': params['chord_stem']}, *depends)
+        return fingerprints
+
+    for stem in STEMS:
+        fingerprints[f'features:{stem}'] = manifest.fingerprint(
+            {**analysis, 'features': params['features']}, separate)
+    fingerprints['chords'] = manifest.fingerprint(chords, *(fingerprints[f'features:{stem}'] for stem in STEMS))
+    return fingerprints
+
+def keep_stem_arrays():
+    """KEEP_STEM_ARRAYS=true mantém stems/*.npy depois de um processamento completo"""
+    return os.getenv('KEEP_STEM_ARRAYS', 'false').lower() == 'true'
 
 def get_db_path():
     """Obtém o caminho do banco de dados a partir das variáveis de ambiente"""
@@ -97,32 +889,104 @@ def get_data_dir():
     return data_dir
 
 def update_db_status(upload_id, status, processed_path=None):
-    """Atualiza o status do processamento no banco de dados"""
-    db_path = get_db_path()
+    """Atualiza o status do processamento no banco de dados (fora de um job em andamento)"""
+    from pipeline_db import update_upload_status
 
+    return update_upload_status(get_db_path(), upload_id, status, processed_path)
+
+def create_chord_analyzer():
+    """ChordAnalyzer com o perfil de análise de CHORD_PROFILE (fast, standard, accurate)"""
+    from chord_analyzer import ChordAnalyzer, DEFAULT_PROFILE, parse_resolutions
+
+    resolutions = parse_resolutions(os.getenv('CHORD_RESOLUTIONS'))
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        if processed_path:
-            cursor.execute(
-                "UPDATE uploads SET processing_status = ?, processed_path = ? WHERE id = ?",
-                (status, processed_path, upload_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE uploads SET processing_status = ? WHERE id = ?",
-                (status, upload_id)
-            )
-
-        conn.commit()
-        conn.close()
-        print(f"Status atualizado para: {status}")
-    except Exception as e:
-        print(f"Erro ao atualizar banco de dados: {e}")
+        return ChordAnalyzer.from_profile(os.getenv('CHORD_PROFILE') or None, resolutions=resolutions)
+    except ValueError as e:
+        print(f"Aviso: {e}; usando o perfil {DEFAULT_PROFILE}")
+        return ChordAnalyzer.from_profile(DEFAULT_PROFILE, resolutions=resolutions)
+
+def apply_cpu_limits():
+    """
+    Aplica os limites de threads/afinidade do CPU governor a este processo
+
+    Chamado nos pontos de entrada (worker e linha de comando), antes de o
+    TensorFlow ser carregado. PROCESSING_WORKER_SLOT é a posição do worker
+    no pool do servidor (usada por CPU_AFFINITY=auto).
+    """
+    import cpu_governor
+
+    slot = os.getenv('PROCESSING_WORKER_SLOT', '').strip()
+    limits = cpu_governor.resolve_limits(int(slot) if slot.isdigit() else None)
+    print(cpu_governor.describe_limits(cpu_governor.apply_limits(limits)))
+    return limits
+
+def load_separator():
+    """Cria o Separator do Spleeter (4 stems: vocals, drums, bass, other)"""
+    import cpu_governor
+
+    cpu_governor.configure_tensorflow()
+    from spleeter.separator import Separator
+    return Separator(SEPARATOR_MODEL)
+
+def cprofile_requested(upload_id):
+    """CPROFILE_UPLOADS=12,15 (ou 'all') gera um dump do cProfile para esses uploads"""
+    requested = [item.strip() for item in os.getenv('CPROFILE_UPLOADS', '').split(',') if item.strip()]
+    return 'all' in requested or str(upload_id) in requested
+
+def process_audio_with_cprofile(audio_path, upload_id, separator=None, analyzer=None):
+    """
+    Executa process_audio sob o cProfile e salva profile.prof (para snakeviz/pstats)
+    e profile.txt (funções mais custosas) no diretório do upload
+
+    O cProfile mede apenas a thread principal; o pós-processamento paralelo
+    aparece como espera nos futures (ver as tarefas em profile.json).
+    """
+    import cProfile
+    import io
+    import pstats
+
+    profile = cProfile.Profile()
+    success = profile.runcall(process_audio, audio_path, upload_id, separator, analyzer, False)
+
+    output_dir = os.path.join(get_data_dir(), 'processed', f'upload_{upload_id}')
+    if os.path.isdir(output_dir):
+        profile.dump_stats(os.path.join(output_dir, 'profile.prof'))
+
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(40)
+        with open(os.path.join(output_dir, 'profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        print(f"cProfile salvo em: {os.path.join(output_dir, 'profile.prof')}")
+
+    return success
+
+def process_audio(audio_path, upload_id, separator=None, analyzer=None, cprofile=None):
+    """
+    Processa o áudio usando Spleeter
+
+    O tempo, a CPU e a memória de cada etapa são salvos em profile.json no
+    diretório de saída e na tabela upload_profiles.
+
+    Args:
+        audio_path: Caminho do arquivo de áudio enviado
+        upload_id: ID do upload no banco de dados
+        separator: Separator já carregado (modo worker); se None, cria um novo
+        analyzer: ChordAnalyzer já carregado (modo worker); se None, cria um novo
+        cprofile: Gera dump do cProfile (None = variável CPROFILE_UPLOADS)
+    """
+    if cprofile is None:
+        cprofile = cprofile_requested(upload_id)
+    if cprofile:
+        return process_audio_with_cprofile(audio_path, upload_id, separator, analyzer)
+
+    from stage_profiler import StageProfiler
+    from pipeline_db import JobDatabase
+
+    profiler = StageProfiler(upload_id)
+    # Uma conexão por job (WAL + busy_timeout), reaproveitada em todas as gravações
+    db = JobDatabase(get_db_path(), upload_id)
+    output_dir = None
 
-def process_audio(audio_path, upload_id):
-    """Processa o áudio usando Spleeter"""
     try:
         print(f"Iniciando processamento do arquivo: {audio_path}")
         print(f"Upload ID: {upload_id}")
@@ -141,16 +1005,7 @@ def process_audio(audio_path, upload_id):
         print("=" * 70)
 
         # Atualiza status para "processing"
-        update_db_status(upload_id, 'processing')
-
-        # Importa Spleeter
-        try:
-            from spleeter.separator import Separator
-        except ImportError:
-            print("ERRO: Spleeter não está instalado!")
-            print("Instale com: pip install spleeter")
-            update_db_status(upload_id, 'error')
-            return False
+        db.update(status='processing')
 
         # Cria diretório de saída
         output_dir = os.path.join(data_dir, 'processed', f'upload_{upload_id}')
@@ -159,84 +1014,134 @@ def process_audio(audio_path, upload_id):
         print(f"Diretório de saída: {output_dir}")
         print(f"Diretório de saída existe? {os.path.exists(output_dir)}")
 
-        # Configura o Spleeter para 4 stems (vocals, drums, bass, other)
-        separator = Separator('spleeter:4stems')
-
-        print("Separando faixas com Spleeter (4 stems)...")
-        print("Isso pode levar alguns minutos dependendo do tamanho do arquivo...")
-
-        # Processa o áudio
-        separator.separate_to_file(audio_path, output_dir)
-
-        # O Spleeter cria uma subpasta com o nome do arquivo
-        # Precisamos encontrar essa pasta e reorganizar os arquivos
-        audio_filename = os.path.splitext(os.path.basename(audio_path))[0]
-        spleeter_output = os.path.join(output_dir, audio_filename)
-
-        if os.path.exists(spleeter_output):
-            # Move os arquivos para o diretório principal
-            import shutil
-            for file in os.listdir(spleeter_output):
-                src = os.path.join(spleeter_output, file)
-                dst = os.path.join(output_dir, file)
-                shutil.move(src, dst)
-
-            # Remove a pasta vazia
-            os.rmdir(spleeter_output)
-
-        # Gera waveforms e converte para MP3
-        print("\nGerando waveforms e convertendo para MP3...")
-        stems = ['vocals', 'drums', 'bass', 'other']
-        colors = {
-            'vocals': '#FF6B6B',    # Vermelho
-            'drums': '#4ECDC4',     # Ciano
-            'bass': '#FFD93D',      # Amarelo
-            'other': '#6C5CE7'      # Roxo
-        }
+        # Duração do áudio (perfil e decisão de separar em janelas)
+        chunk_seconds = get_chunk_seconds()
+        duration = probe_duration(audio_path)
+        profiler.input_duration = duration
 
-        stems_paths = {}
-        for stem in stems:
-            wav_file = os.path.join(output_dir, f'{stem}.wav')
-            if os.path.exists(wav_file):
-                # Gera waveform
-                waveform_image = os.path.join(output_dir, f'{stem}.png')
-                generate_waveform(wav_file, waveform_image, colors[stem])
-
-                # Converte para MP3
-                mp3_file = os.path.join(output_dir, f'{stem}.mp3')
-                if convert_wav_to_mp3(wav_file, mp3_file):
-                    stems_paths[stem] = mp3_file
-                    # Remove o arquivo WAV após conversão bem-sucedida
-                    try:
-                        os.remove(wav_file)
-                        print(f"Arquivo WAV removido: {wav_file}")
-                    except Exception as e:
-                        print(f"Aviso: Não foi possível remover {wav_file}: {e}")
-
-        # Análise de acordes
-        print("\nAnalisando acordes...")
-        try:
-            from chord_analyzer import ChordAnalyzer
-            analyzer = ChordAnalyzer(hop_length=512, frame_size=2048)
-            chord_data = analyzer.analyze_stems(stems_paths)
+        if analyzer is None:
+            analyzer = create_chord_analyzer()
 
-            # Salva dados de acordes
-            chords_file = os.path.join(output_dir, 'chords.json')
-            analyzer.save_to_json(chord_data, chords_file)
-            print(f"Acordes salvos em: {chords_file}")
-            print(f"Total de eventos detectados: {len(chord_data.get('events', []))}")
-        except Exception as e:
-            print(f"Aviso: Não foi possível analisar acordes: {e}")
-            # Não falha o processamento se análise de acordes falhar
+        chunked = chunk_seconds > 0 and duration > max(chunk_seconds, get_chunk_threshold_seconds())
+        params = processing_params(analyzer, chunk_seconds if chunked else None)
+
+        # Mesmo áudio já processado antes, com os mesmos parâmetros? Reaproveita
+        # stems, waveforms e acordes
+        with profiler.stage('cache_lookup'):
+            cache, cache_key = open_processing_cache(audio_path, params)
+            restored = bool(cache and cache.restore(cache_key, output_dir))
+        if restored:
+            print(f"Resultado reaproveitado do cache ({cache_key[:12]}...)")
+            cache.close()
+            profile = profiler.save(output_dir, 'completed')
+            db.finish('completed', f'/processed/upload_{upload_id}', profile)
+            return True
+
+        # Etapas já concluídas por um processamento anterior deste upload
+        # (ex: job interrompido) são puladas; o manifest registra cada etapa
+        with profiler.stage('checkpoints'):
+            manifest = open_stage_manifest(audio_path, output_dir)
+            manifest.expect(stage_fingerprints(manifest, params))
+            resumed = [stage for stage in manifest.expected if manifest.is_done(stage)]
+
+            prediction = None
+            if chunked:
+                # Janelas salvas só são relidas se alguma etapa seguinte estiver pendente
+                needs_windows = bool(manifest.pending(stage for stage in manifest.expected
+                                                      if stage != 'separate'))
+                needs_separation = needs_windows and not manifest.is_done('separate')
+            else:
+                # Acordes pendentes não precisam dos stems: usam os chromagrams salvos
+                needs_stems = bool(manifest.pending(stage for stage in manifest.expected
+                                                    if stage not in ('separate', 'chords')))
+                if needs_stems and manifest.is_done('separate'):
+                    from stage_manifest import load_stem_arrays
+                    prediction = load_stem_arrays(output_dir, STEMS)
+                needs_separation = needs_stems and prediction is None
+        if resumed:
+            print(f"Etapas reaproveitadas do processamento anterior: {', '.join(resumed)}")
+            profiler.add('resumed', 0.0, stages=resumed)
+
+        # Importa Spleeter (apenas quando não recebemos um separator pronto)
+        if separator is None and needs_separation:
+            try:
+                with profiler.stage('load_model'):
+                    separator = load_separator()
+            except ImportError:
+                print("ERRO: Spleeter não está instalado!")
+                print("Instale com: pip install spleeter")
+                db.finish('error', profile=profiler.save(output_dir, 'error'))
+                return False
+
+        if needs_separation:
+            print("Separando faixas com Spleeter (4 stems)...")
+            print("Isso pode levar alguns minutos dependendo do tamanho do arquivo...")
+
+        # Arquivos longos são separados em janelas para limitar a memória
+        if chunked and not needs_windows:
+            stems_paths = {stem: os.path.join(output_dir, f'{stem}.mp3') for stem in STEMS}
+            stem_errors = {}
+        elif chunked:
+            if needs_separation:
+                print(f"Áudio longo ({duration:.0f}s): separando em janelas de {chunk_seconds:.0f}s...")
+            else:
+                print("Retomando a partir das janelas já separadas...")
+            with profiler.stage('chunked'):
+                stems_paths, stem_errors = process_chunked(
+                    audio_path, output_dir, separator, analyzer, duration, chunk_seconds, profiler, manifest)
+        else:
+            if needs_separation:
+                # Decodifica o arquivo uma única vez; daqui em diante tudo trabalha
+                # sobre os arrays em memória (sem WAVs intermediários em disco)
+                with profiler.stage('decode'):
+                    waveform = load_audio(audio_path)
+                if not profiler.input_duration:
+                    profiler.input_duration = len(waveform) / SAMPLE_RATE
+
+                with profiler.stage('separation'):
+                    prediction = separator.separate(waveform)
+                del waveform
+
+                # Stems em disco (int16): uma falha adiante não refaz a separação
+                if manifest.enabled:
+                    from stage_manifest import save_stem_arrays
+                    with profiler.stage('save_stems'):
+                        manifest.complete('separate', save_stem_arrays(output_dir, prediction))
+
+            # Gera waveforms, MP3 e acordes em paralelo a partir dos arrays
+            print("\nGerando waveforms, MP3 e acordes em paralelo...")
+            with profiler.stage('postprocess'):
+                stems_paths, stem_errors = postprocess_stems(prediction, output_dir, analyzer, profiler, manifest)
+
+        if stem_errors:
+            print(f"Aviso: stems com erro: {stem_errors}")
+
+        # Publica no cache apenas resultados completos
+        if cache:
+            with profiler.stage('cache_store'):
+                complete = (set(stems_paths) == set(STEMS) and not stem_errors and
+                            os.path.exists(os.path.join(output_dir, 'chords.json')))
+                if complete and cache.store(cache_key, output_dir):
+                    print(f"Resultado salvo no cache ({cache_key[:12]}...)")
+                cache.close()
+
+        # Os stems separados só servem para retomar um job incompleto
+        incomplete = manifest.enabled and manifest.pending(stage for stage in manifest.expected
+                                                           if stage != 'separate')
+        if not stem_errors and not incomplete and not keep_stem_arrays():
+            from stage_manifest import remove_stem_arrays
+            remove_stem_arrays(output_dir)
 
         # Caminho relativo para armazenar no banco
         processed_path = f'/processed/upload_{upload_id}'
 
         print("\nProcessamento concluído com sucesso!")
         print(f"Faixas e waveforms salvos em: {output_dir}")
+        print(f"Perfil: {profiler.summary()}")
+        profile = profiler.save(output_dir, 'completed')
 
-        # Atualiza status para "completed"
-        update_db_status(upload_id, 'completed', processed_path)
+        # Status "completed", caminho e perfil em uma única transação
+        db.finish('completed', processed_path, profile)
 
         return True
 
@@ -244,21 +1149,143 @@ def process_audio(audio_path, upload_id):
         print(f"ERRO durante o processamento: {e}")
         import traceback
         traceback.print_exc()
+        db.finish('error', profile=profiler.save(output_dir, 'error'))
+        return False
+
+    finally:
+        db.close()
+
+def warm_up_separator(separator):
+    """
+    Força o carregamento do modelo do Spleeter separando 1s de silêncio.
+    O TensorFlow só monta o grafo na primeira separação; fazendo isso no
+    início do worker, o primeiro upload real não paga esse custo.
+    """
+    silence = np.zeros((SAMPLE_RATE, 2), dtype=np.float32)
+    separator.separate(silence)
+
+def run_job(job, separator, analyzer):
+    """
+    Executa um job recebido pelo worker e retorna o resultado
+
+    Args:
+        job: Dicionário com 'audio_path', 'upload_id' e opcionalmente 'cprofile'
+        separator: Separator já carregado
+        analyzer: ChordAnalyzer já carregado
+
+    Returns:
+        Dicionário com o resultado do job
+    """
+    upload_id = job.get('upload_id')
+    audio_path = job.get('audio_path')
+    started = time.time()
+
+    if upload_id is None or not audio_path:
+        return {'upload_id': upload_id, 'success': False,
+                'error': 'Job inválido: informe audio_path e upload_id'}
+
+    if not os.path.exists(audio_path):
+        print(f"ERRO: Arquivo não encontrado: {audio_path}")
         update_db_status(upload_id, 'error')
+        return {'upload_id': upload_id, 'success': False,
+                'error': f'Arquivo não encontrado: {audio_path}'}
+
+    success = process_audio(audio_path, upload_id, separator, analyzer, job.get('cprofile'))
+
+    return {
+        'upload_id': upload_id,
+        'success': success,
+        'elapsed': round(time.time() - started, 3),
+        'error': None if success else 'Falha no processamento'
+    }
+
+def run_worker(input_stream=None, output_stream=None):
+    """
+    Modo worker: carrega o Spleeter e o ChordAnalyzer uma única vez e
+    processa jobs recebidos pela entrada padrão.
+
+    Protocolo (uma mensagem JSON por linha):
+        entrada: {"audio_path": "/caminho/musica.mp3", "upload_id": 12}
+                 {"command": "shutdown"}
+        saída:   {"event": "ready"}
+                 {"event": "result", "upload_id": 12, "success": true, ...}
+
+    Toda saída de log é desviada para stderr, de modo que stdout transporta
+    apenas as mensagens do protocolo.
+    """
+    input_stream = input_stream or sys.stdin
+
+    if output_stream is None:
+        # Reserva o stdout original para o protocolo e aponta o fd 1 para
+        # stderr: assim nem os prints nem subprocessos (ffmpeg, TensorFlow)
+        # conseguem corromper as mensagens enviadas ao servidor
+        sys.stdout.flush()
+        output_stream = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+        os.dup2(2, 1)
+
+    def send(message):
+        output_stream.write(json.dumps(message, ensure_ascii=False) + '\n')
+        output_stream.flush()
+
+    print("Iniciando worker de processamento de áudio...")
+    apply_cpu_limits()
+    started = time.time()
+    try:
+        separator = load_separator()
+        warm_up_separator(separator)
+        analyzer = create_chord_analyzer()
+    except Exception as e:
+        print(f"ERRO ao inicializar worker: {e}")
+        send({'event': 'fatal', 'error': str(e)})
         return False
+    print(f"Worker pronto em {time.time() - started:.1f}s")
+
+    send({'event': 'ready', 'pid': os.getpid()})
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            send({'event': 'result', 'upload_id': None, 'success': False,
+                  'error': f'JSON inválido: {e}'})
+            continue
+
+        if job.get('command') == 'shutdown':
+            break
+
+        try:
+            result = run_job(job, separator, analyzer)
+        except Exception as e:
+            result = {'upload_id': job.get('upload_id'), 'success': False,
+                      'error': str(e)}
+
+        sys.stdout.flush()
+        send({'event': 'result', **result})
+
+    return True
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Uso: python3 process_audio.py <caminho_audio> <upload_id>")
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        sys.exit(0 if run_worker() else 1)
+
+    args = [arg for arg in sys.argv[1:] if arg != '--cprofile']
+    if len(args) < 2:
+        print("Uso: python3 process_audio.py <caminho_audio> <upload_id> [--cprofile]")
+        print("     python3 process_audio.py --worker")
         sys.exit(1)
 
-    audio_path = sys.argv[1]
-    upload_id = sys.argv[2]
+    audio_path = args[0]
+    upload_id = args[1]
 
     if not os.path.exists(audio_path):
         print(f"ERRO: Arquivo não encontrado: {audio_path}")
         update_db_status(upload_id, 'error')
         sys.exit(1)
 
-    success = process_audio(audio_path, upload_id)
+    apply_cpu_limits()
+    success = process_audio(audio_path, upload_id, cprofile=True if '--cprofile' in sys.argv else None)
     sys.exit(0 if success else 1)
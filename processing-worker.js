@@ -0,0 +1,183 @@
+require('dotenv').config();
+const { spawn, exec } = require('child_process');
+const path = require('path');
+const readline = require('readline');
+const logger = require('./logger');
+
+// Script Python e ambiente virtual usados no processamento
+const pythonScript = path.join(__dirname, 'process_audio.py');
+const venvActivate = path.join(__dirname, 'venv', 'bin', 'activate');
+
+// PROCESSING_WORKER=false volta ao modo antigo (um processo Python por upload)
+const workerEnabled = process.env.PROCESSING_WORKER !== 'false';
+
+// Número de workers Python simultâneos (cada um com seu próprio modelo carregado)
+const poolSize = Math.max(1, parseInt(process.env.MAX_CONCURRENT_JOBS, 10) || 1);
+
+// Tempo de espera antes de reiniciar um worker que terminou inesperadamente
+const RESTART_DELAY_MS = 5000;
+
+// Estado dos workers persistentes
+const workers = [];         // [{ id, slot, child, ready, currentJob }]
+let restartTimer = null;
+let nextWorkerId = 1;
+const pendingJobs = [];     // Jobs aguardando envio a um worker
+
+// Inicia um processo Python em modo worker (modelo carregado uma única vez)
+function startWorker() {
+    if (!workerEnabled || workers.length >= poolSize) {
+        return;
+    }
+
+    // Posição no pool (menor livre): com CPU_AFFINITY=auto cada posição
+    // recebe núcleos exclusivos, inclusive quando um worker é reiniciado
+    let slot = 0;
+    while (workers.some((w) => w.slot === slot)) {
+        slot++;
+    }
+
+    const command = `source '${venvActivate}' && exec python3 '${pythonScript}' --worker`;
+    const worker = { id: nextWorkerId++, slot, child: null, ready: false, currentJob: null };
+    logger.info(`Iniciando worker de processamento #${worker.id} (slot ${slot}): ${command}`);
+
+    const child = spawn('bash', ['-c', command], {
+        stdio: ['pipe', 'pipe', 'pipe'],
+        env: { ...process.env, PROCESSING_WORKER_SLOT: String(slot) }
+    });
+    worker.child = child;
+    workers.push(worker);
+
+    // stdout transporta apenas o protocolo (uma mensagem JSON por linha)
+    readline.createInterface({ input: child.stdout }).on('line', (line) => {
+        let message;
+        try {
+            message = JSON.parse(line);
+        } catch (err) {
+            logger.warn(`[worker #${worker.id}] Mensagem inválida: ${line}`);
+            return;
+        }
+        handleMessage(worker, message);
+    });
+
+    // stderr contém os logs do processamento
+    readline.createInterface({ input: child.stderr }).on('line', (line) => {
+        logger.info(`[worker #${worker.id}] ${line}`);
+    });
+
+    child.on('error', (err) => {
+        logger.error(`Erro no worker de processamento #${worker.id}: ${err.message}`);
+    });
+
+    child.on('exit', (code, signal) => {
+        logger.warn(`Worker de processamento #${worker.id} finalizado (code=${code}, signal=${signal})`);
+        workers.splice(workers.indexOf(worker), 1);
+
+        if (worker.currentJob) {
+            // workerExited: o job não falhou por si, a fila pode tentar de novo
+            const error = new Error('Worker finalizado durante o processamento');
+            error.workerExited = true;
+            worker.currentJob.callback(error, null);
+        }
+
+        // Reinicia se ainda houver trabalho pendente
+        if (pendingJobs.length > 0 && !restartTimer) {
+            restartTimer = setTimeout(() => {
+                restartTimer = null;
+                dispatchNext();
+            }, RESTART_DELAY_MS);
+        }
+    });
+}
+
+// Trata mensagens recebidas de um worker
+function handleMessage(worker, message) {
+    if (message.event === 'ready') {
+        logger.info(`Worker de processamento #${worker.id} pronto (pid ${message.pid})`);
+        worker.ready = true;
+        dispatchNext();
+    } else if (message.event === 'result') {
+        const job = worker.currentJob;
+        worker.currentJob = null;
+
+        if (job) {
+            logger.info(`Job do upload ${message.upload_id} finalizado no worker #${worker.id}: ` +
+                `${message.success ? 'sucesso' : 'erro'} (${message.elapsed || 0}s)`);
+            job.callback(message.success ? null : new Error(message.error || 'Falha no processamento'), message);
+        }
+        dispatchNext();
+    } else if (message.event === 'fatal') {
+        logger.error(`Worker #${worker.id} não conseguiu inicializar: ${message.error}`);
+
+        // Sem worker não há como processar: falha os jobs em espera
+        pendingJobs.splice(0).forEach(job => {
+            job.callback(new Error('Worker indisponível: ' + message.error), null);
+        });
+    }
+}
+
+// Envia jobs da fila para os workers livres (um job por worker)
+function dispatchNext() {
+    while (pendingJobs.length > 0) {
+        const idle = workers.find(w => w.ready && !w.currentJob);
+        if (!idle) {
+            // Sobe mais um worker se o pool ainda não estiver completo e os
+            // workers que já estão inicializando não derem conta da fila
+            const starting = workers.filter(w => !w.ready).length;
+            if (starting < pendingJobs.length) {
+                startWorker();
+            }
+            return;
+        }
+
+        const job = pendingJobs.shift();
+        idle.currentJob = job;
+        idle.child.stdin.write(JSON.stringify({
+            audio_path: job.audioPath,
+            upload_id: job.uploadId
+        }) + '\n');
+    }
+}
+
+// Modo antigo: um processo Python por upload
+function runOneShot(audioPath, uploadId, callback) {
+    const command = `bash -c "source '${venvActivate}' && python3 '${pythonScript}' '${audioPath}' ${uploadId}"`;
+
+    exec(command, (error, stdout, stderr) => {
+        if (error) {
+            logger.error(`stderr: ${stderr}`);
+        } else {
+            logger.info(`stdout: ${stdout}`);
+        }
+        callback(error, null);
+    });
+}
+
+// Envia um arquivo para processamento
+// callback(err, result) é chamado quando o job termina
+// A quantidade de jobs simultâneos é controlada pela fila (job-queue.js)
+function submitJob(audioPath, uploadId, callback) {
+    callback = callback || (() => {});
+
+    if (!workerEnabled) {
+        return runOneShot(audioPath, uploadId, callback);
+    }
+
+    pendingJobs.push({ audioPath, uploadId, callback });
+    dispatchNext();
+}
+
+// Encerra os workers (usado ao desligar o servidor)
+function stopWorker() {
+    workers.forEach(worker => {
+        if (worker.child.stdin.writable) {
+            worker.child.stdin.write(JSON.stringify({ command: 'shutdown' }) + '\n');
+            worker.child.stdin.end();
+        }
+    });
+}
+
+module.exports = {
+    submitJob,
+    startWorker,
+    stopWorker
+};
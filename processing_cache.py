@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Processing Cache - Cache de resultados de processamento endereçado pelo conteúdo
+O hash é calculado sobre o PCM decodificado, de modo que o mesmo áudio em
+containers diferentes (MP3, WAV, M4A...) gera a mesma chave
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import subprocess
+from typing import List, Optional
+
+
+# Versão do formato do hash; mudar invalida todas as entradas antigas
+FINGERPRINT_VERSION = 'pcm-s16le-44100-2ch-v1'
+
+# Arquivos imutáveis são ligados (hard link); os demais são copiados,
+# pois podem ser reescritos depois (ex: regeneração de acordes). Os .npy/.npz
+# de features/ são sempre substituídos com os.replace, nunca reescritos no lugar
+LINKED_EXTENSIONS = ('.mp3', '.png', '.opus', '.m4a', '.peaks.bin', '.npy', '.npz')
+
+# Arquivos específicos de um job (perfil de execução, acordes parciais, checkpoints), nunca publicados no cache
+EXCLUDED_FILES = ('profile.json', 'profile.prof', 'profile.txt', 'chords.partial.ndjson', 'manifest.json')
+
+# Subdiretórios específicos de um job (stems separados para retomar etapas), nunca publicados
+EXCLUDED_DIRS = ('stems',)
+
+
+def audio_fingerprint(audio_path: str, sample_rate: int = 44100) -> Optional[str]:
+    """
+    Calcula o hash SHA-256 do áudio decodificado
+
+    O ffmpeg decodifica o arquivo para PCM 16 bits estéreo e o hash é
+    calculado em streaming, sem carregar o áudio inteiro em memória.
+
+    Args:
+        audio_path: Caminho do arquivo de áudio
+        sample_rate: Taxa de amostragem usada na decodificação
+
+    Returns:
+        Hash hexadecimal ou None se não for possível decodificar
+    """
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', audio_path,
+        '-map', '0:a:0', '-f', 's16le', '-ac', '2', '-ar', str(sample_rate), 'pipe:1'
+    ]
+
+    digest = hashlib.sha256(FINGERPRINT_VERSION.encode())
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        for block in iter(lambda: process.stdout.read(1 << 20), b''):
+            digest.update(block)
+        process.wait()
+    except OSError as e:
+        print(f"Aviso: não foi possível calcular o hash do áudio: {e}")
+        return None
+
+    if process.returncode != 0:
+        print(f"Aviso: ffmpeg falhou ao decodificar {audio_path} para o hash")
+        return None
+
+    return digest.hexdigest()
+
+
+def _directory_size(path: str) -> int:
+    """Soma do tamanho dos arquivos de um diretório (incluindo subdiretórios)"""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files)
+
+
+def _cached_files(directory: str) -> List[str]:
+    """
+    Arquivos de um diretório processado publicados no cache (ex: features/ incluído)
+
+    Returns:
+        Caminhos relativos a directory
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        if root == directory:
+            dirs[:] = [name for name in dirs if name not in EXCLUDED_DIRS]
+        relative = os.path.relpath(root, directory)
+        for name in files:
+            if root == directory and name in EXCLUDED_FILES:
+                continue
+            paths.append(name if relative == os.curdir else os.path.join(relative, name))
+    return paths
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Cria hard link para arquivos imutáveis (cópia como fallback); copia os demais"""
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    if src.endswith(LINKED_EXTENSIONS):
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+class ProcessingCache:
+    """
+    Cache de uploads processados
+
+    Cada entrada é um diretório <raiz>/<hash>/ com os stems, waveforms,
+    chords.json e as features/chromagrams (features/). Um índice SQLite (WAL) guarda tamanho e último uso de cada
+    entrada para a remoção por tamanho (LRU). As entradas são publicadas
+    com rename atômico, então jobs concorrentes nunca veem uma entrada pela
+    metade.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Args:
+            root: Diretório raiz do cache
+            max_bytes: Tamanho máximo do cache; as entradas menos usadas são removidas
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(root, 'index.db'), timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                hash TEXT PRIMARY KEY,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def restore(self, key: str, output_dir: str) -> bool:
+        """
+        Copia (hard link) uma entrada do cache para o diretório do upload
+
+        Args:
+            key: Hash do áudio
+            output_dir: Diretório de saída do upload
+
+        Returns:
+            True se a entrada existia e foi restaurada
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return False
+
+        try:
+            for name in _cached_files(entry_dir):
+                target = os.path.join(output_dir, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _link_or_copy(os.path.join(entry_dir, name), target)
+        except OSError as e:
+            # Entrada removida por outro job durante a cópia: processa normalmente
+            print(f"Aviso: falha ao restaurar do cache: {e}")
+            return False
+
+        with self._conn:
+            self._conn.execute('UPDATE entries SET last_used = ? WHERE hash = ?', (time.time(), key))
+        return True
+
+    def store(self, key: str, output_dir: str) -> bool:
+        """
+        Publica os arquivos de um upload processado no cache
+
+        Args:
+            key: Hash do áudio
+            output_dir: Diretório de saída do upload
+
+        Returns:
+            True se a entrada foi criada (False se já existia ou em caso de erro)
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return False
+
+        staging = os.path.join(self.root, f'.tmp-{key}-{os.getpid()}')
+        try:
+            os.makedirs(staging, exist_ok=True)
+            for name in _cached_files(output_dir):
+                target = os.path.join(staging, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _link_or_copy(os.path.join(output_dir, name), target)
+
+            size = _directory_size(staging)
+            os.rename(staging, entry_dir)
+        except OSError as e:
+            # Outro job publicou a mesma entrada primeiro
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                print(f"Aviso: falha ao salvar no cache: {e}")
+            return False
+
+        now = time.time()
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (hash, size_bytes, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, size, now, now)
+            )
+
+        self.evict()
+        return True
+
+    def evict(self) -> int:
+        """
+        Remove as entradas menos usadas até o cache caber em max_bytes
+
+        Returns:
+            Quantidade de entradas removidas
+        """
+        with self._conn:
+            total = self._conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+
+            removed = []
+            for key, size in self._conn.execute('SELECT hash, size_bytes FROM entries ORDER BY last_used ASC'):
+                if total <= self.max_bytes:
+                    break
+                removed.append(key)
+                total -= size
+
+            self._conn.executemany('DELETE FROM entries WHERE hash = ?', [(key,) for key in removed])
+
+        # Remove os diretórios fora da transação (os uploads continuam com seus links)
+        for key in removed:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+        if removed:
+            print(f"Cache: {len(removed)} entrada(s) removida(s) por tamanho")
+        return len(removed)
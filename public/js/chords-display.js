@@ -15,10 +15,13 @@
         const settings = $.extend({
             uploadId: null,              // ID do upload para buscar acordes
             apiEndpoint: '/api/chords',  // Endpoint da API
+            profilesEndpoint: '/api/chords/profiles', // Perfis de análise disponíveis
             updateInterval: 100,         // Intervalo de atualização em ms
+            partialPollInterval: 3000,   // Recarga dos acordes parciais (música em processamento) em ms
             autoCollapse: false,         // Colapsar automaticamente
             showTimeline: true,          // Mostrar timeline de acordes
             showConfidence: true,        // Mostrar indicador de confiança
+            analysisProfile: null,       // Perfil da regeneração (null = padrão do servidor)
             onChordChange: null,         // Callback quando acorde muda
             onLoad: null,                // Callback quando acordes carregam
             onError: null                // Callback em caso de erro
@@ -42,8 +45,11 @@
             this.$container = $container;
             this.settings = settings;
             this.chordsData = null;
+            this.baseEvents = null;
             this.currentChordIndex = -1;
             this.updateTimer = null;
+            this.pollTimer = null;
+            this.partial = false;
             this.collapsed = settings.autoCollapse;
         }
 
@@ -53,6 +59,7 @@
         init() {
             this.buildHTML();
             this.loadChords();
+            this.loadProfiles();
             this.setupEventListeners();
         }
 
@@ -62,8 +69,10 @@
         buildHTML() {
             const html = `
                 <div id="chords-container" class="loading">
-                    <h3>Acordes</h3>
+                    <h3>Acordes <small class="chords-partial-status"></small></h3>
                     <div class="chords-controls">
+                        <select id="chords-resolution" title="Resolução da timeline" style="display: none"></select>
+                        <select id="chords-profile" title="Perfil de análise da regeneração" style="display: none"></select>
                         <button id="chords-regenerate" title="Regenerar acordes">
                             <i class="fa fa-refresh"></i>
                         </button>
@@ -142,7 +151,7 @@
                                 <input type="radio" name="stem" id="stem-all" value="all">
                                 <label for="stem-all">
                                     Todos
-                                    <div class="stem-option-desc">Mix combinado</div>
+                                    <div class="stem-option-desc">Baixo + harmonia + voz combinados</div>
                                 </label>
                             </div>
                         </div>
@@ -178,7 +187,62 @@
                 method: 'GET',
                 dataType: 'json',
                 success: (data) => this.handleChordsLoaded(data),
-                error: (xhr, status, error) => this.handleError(error)
+                error: (xhr, status, error) => {
+                    // Entre o fim da análise e o status 'completed' o arquivo parcial
+                    // já foi removido: continua aguardando o resultado final
+                    if (this.partial) {
+                        this.schedulePoll();
+                        return;
+                    }
+                    this.handleError(error);
+                }
+            });
+        }
+
+        /**
+         * Recarrega os acordes enquanto a música ainda está em processamento
+         */
+        schedulePoll() {
+            clearTimeout(this.pollTimer);
+            this.pollTimer = setTimeout(() => this.loadChords(), this.settings.partialPollInterval);
+        }
+
+        /**
+         * Mostra até onde os acordes parciais já foram analisados
+         */
+        updatePartialStatus(data) {
+            const $status = this.$container.find('.chords-partial-status');
+            if (data.partial) {
+                $status.text(`(analisando... ${this.formatTime(data.analyzed_until || 0)})`);
+            } else {
+                $status.text('');
+            }
+        }
+
+        /**
+         * Preenche o seletor de perfil de análise com os perfis do servidor
+         * (sem resposta, o seletor fica oculto e a regeneração usa o padrão)
+         */
+        loadProfiles() {
+            $.ajax({
+                url: this.settings.profilesEndpoint,
+                method: 'GET',
+                dataType: 'json',
+                success: (data) => {
+                    const $select = this.$container.find('#chords-profile');
+                    const profiles = data.profiles || [];
+                    const selected = profiles.some(profile => profile.name === this.settings.analysisProfile)
+                        ? this.settings.analysisProfile
+                        : data.default;
+
+                    $select.empty();
+                    profiles.forEach((profile) => {
+                        $select.append($('<option>').val(profile.name).text(profile.label || profile.name));
+                    });
+                    $select.val(selected).toggle(profiles.length > 0);
+                    this.settings.analysisProfile = selected;
+                },
+                error: (xhr, status, error) => console.warn('Perfis de análise indisponíveis:', error)
             });
         }
 
@@ -188,21 +252,32 @@
         handleChordsLoaded(data) {
             this.$chordsContainer.removeClass('loading');
 
+            // Acordes parciais: recarrega até a análise terminar (partial = false)
+            this.partial = Boolean(data.partial);
+            this.updatePartialStatus(data);
+            if (this.partial) {
+                this.schedulePoll();
+            }
+
             if (data.error || !data.events || data.events.length === 0) {
                 this.$chordsContainer.addClass('no-chords');
                 this.updateChordDisplay({
                     previous: null,
-                    current: { chord: 'Sem dados', confidence: 0 },
+                    current: { chord: this.partial ? 'Analisando...' : 'Sem dados', confidence: 0 },
                     next: null
                 });
 
+                if (this.partial) return;
                 if (this.settings.onError) {
                     this.settings.onError(data.error || 'Nenhum acorde detectado');
                 }
                 return;
             }
 
+            this.$chordsContainer.removeClass('no-chords');
             this.chordsData = data;
+            this.currentChordIndex = -1;
+            this.setupResolutions();
             this.buildTimeline();
             this.updateChordDisplay({
                 previous: null,
@@ -217,6 +292,44 @@
             console.log(`Acordes carregados: ${data.events.length} eventos`);
         }
 
+        /**
+         * Preenche o seletor de resolução com as timelines extras do chords.json
+         * (calculadas na mesma análise: trocar não exige reprocessar)
+         */
+        setupResolutions() {
+            const $select = this.$container.find('#chords-resolution');
+            const resolutions = this.chordsData.resolutions || [];
+
+            this.baseEvents = this.chordsData.events;
+            $select.empty().append('<option value="">Padrão</option>');
+            resolutions.forEach((resolution, index) => {
+                const label = resolution.hop < resolution.window
+                    ? `${resolution.window}s / ${resolution.hop}s`
+                    : `${resolution.window}s`;
+                $select.append(`<option value="${index}">${label}</option>`);
+            });
+            $select.toggle(resolutions.length > 0);
+        }
+
+        /**
+         * Troca os eventos exibidos pela resolução escolhida ('' = padrão)
+         */
+        selectResolution(value) {
+            if (!this.chordsData) return;
+
+            const resolution = value === '' ? null : (this.chordsData.resolutions || [])[parseInt(value, 10)];
+            this.chordsData.events = resolution ? resolution.events : this.baseEvents;
+            this.currentChordIndex = -1;
+            this.buildTimeline();
+
+            const events = this.chordsData.events;
+            this.updateChordDisplay({
+                previous: null,
+                current: events[0] || { chord: 'Sem dados', confidence: 0 },
+                next: events.length > 1 ? events[1] : null
+            });
+        }
+
         /**
          * Constrói a timeline de acordes
          */
@@ -253,6 +366,16 @@
                 this.toggleCollapse();
             });
 
+            // Resolução da timeline
+            this.$container.on('change', '#chords-resolution', (e) => {
+                this.selectResolution($(e.currentTarget).val());
+            });
+
+            // Perfil de análise usado na regeneração
+            this.$container.on('change', '#chords-profile', (e) => {
+                this.settings.analysisProfile = $(e.currentTarget).val();
+            });
+
             // Botão regenerar
             this.$container.on('click', '#chords-regenerate', () => {
                 this.showRegenerateModal();
@@ -609,7 +732,7 @@
                 url: `/api/chords/${this.settings.uploadId}/regenerate`,
                 method: 'POST',
                 contentType: 'application/json',
-                data: JSON.stringify({ stem: stem }),
+                data: JSON.stringify({ stem: stem, profile: this.settings.analysisProfile }),
                 success: (data) => {
                     console.log('Acordes regenerados com sucesso!');
                     $status.find('.status-text').text('Acordes atualizados!');
@@ -618,6 +741,7 @@
                     // Atualiza dados locais
                     this.chordsData = data;
                     this.currentChordIndex = -1;
+                    this.setupResolutions();
 
                     // Reconstrói timeline
                     this.buildTimeline();
@@ -670,6 +794,7 @@
          */
         destroy() {
             this.stopTimeUpdate();
+            clearTimeout(this.pollTimer);
             this.$container.empty();
         }
     }
@@ -6,22 +6,31 @@ Script para regenerar acordes de um upload processado usando stem específico
 
 import sys
 import os
-from chord_analyzer import ChordAnalyzer
+import time
 
+# Tempo de importação medido desde o início do processo (a maior parte da
+# latência do endpoint de regeneração quando os chromagrams já estão salvos)
+_started = time.perf_counter()
+from chord_analyzer import (ANALYSIS_PROFILES, DEFAULT_PROFILE, ChordAnalyzer, ChromaStore, parse_fusion_weights,
+                            parse_resolutions)
+IMPORT_SECONDS = time.perf_counter() - _started
 
-def regenerate_chords(processed_dir, stem='other'):
+
+def regenerate_chords(processed_dir, stem='other', profile=DEFAULT_PROFILE):
     """
     Regenera acordes usando stem específico
 
     Args:
         processed_dir: Diretório com stems processados
         stem: Stem a usar ('vocals', 'drums', 'bass', 'other', 'all')
+        profile: Perfil de análise ('fast', 'standard', 'accurate')
 
     Returns:
         Caminho do arquivo JSON gerado ou None em caso de erro
     """
     print(f"Regenerando acordes do diretório: {processed_dir}")
     print(f"Usando stem: {stem}")
+    print(f"Perfil de análise: {profile}")
 
     # Constrói caminhos dos stems
     stems_paths = {}
@@ -48,22 +57,32 @@ def regenerate_chords(processed_dir, stem='other'):
         return None
 
     # Cria analyzer
-    analyzer = ChordAnalyzer(hop_length=512, frame_size=2048)
+    analyzer = ChordAnalyzer.from_profile(profile, resolutions=parse_resolutions(os.environ.get('CHORD_RESOLUTIONS')))
+
+    # Chromagrams já calculados (no processamento ou em regenerações
+    # anteriores) são reaproveitados: só a detecção de acordes é refeita
+    store = ChromaStore(processed_dir)
 
     # Analisa
+    analysis_started = time.perf_counter()
     if stem == 'all':
+        # Análise combinada: baixo define a fundamental, harmonia/voz o tipo do acorde
         print("Analisando todos os stems combinados...")
-        chord_data = analyzer.analyze_stems(stems_paths)
+        weights = parse_fusion_weights(os.environ.get('CHORD_FUSION_WEIGHTS'))
+        chord_data = analyzer.analyze_fused(stems_paths, store=store, weights=weights)
     else:
         print(f"Analisando stem: {stem}...")
-        chord_data = analyzer.analyze_audio_file(stems_paths[stem])
+        chord_data = analyzer.analyze_stem(stem, stems_paths[stem], store=store)
         chord_data['primary_stem'] = stem
+    analysis_seconds = time.perf_counter() - analysis_started
 
     # Salva
     output_path = os.path.join(processed_dir, 'chords.json')
     if analyzer.save_to_json(chord_data, output_path):
         print(f"✓ Acordes salvos em: {output_path}")
         print(f"✓ Total de eventos: {len(chord_data.get('events', []))}")
+        print(f"Tempo: importação {IMPORT_SECONDS:.2f}s | análise {analysis_seconds:.2f}s | "
+              f"total {time.perf_counter() - _started:.2f}s")
         return output_path
 
     print("✗ Erro ao salvar acordes")
@@ -72,13 +91,15 @@ def regenerate_chords(processed_dir, stem='other'):
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Uso: python3 regenerate_chords.py <diretório_processado> [stem]")
+        print("Uso: python3 regenerate_chords.py <diretório_processado> [stem] [perfil]")
         print("Stems válidos: vocals, drums, bass, other, all")
-        print("Padrão: other")
+        print(f"Perfis válidos: {', '.join(ANALYSIS_PROFILES)}")
+        print(f"Padrão: other, {DEFAULT_PROFILE}")
         sys.exit(1)
 
     processed_dir = sys.argv[1]
     stem = sys.argv[2] if len(sys.argv) > 2 else 'other'
+    profile = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PROFILE
 
     # Valida stem
     valid_stems = ['vocals', 'drums', 'bass', 'other', 'all']
@@ -87,13 +108,18 @@ if __name__ == '__main__':
         print(f"Válidos: {', '.join(valid_stems)}")
         sys.exit(1)
 
+    if profile not in ANALYSIS_PROFILES:
+        print(f"ERRO: Perfil inválido: {profile}")
+        print(f"Válidos: {', '.join(ANALYSIS_PROFILES)}")
+        sys.exit(1)
+
     # Verifica se diretório existe
     if not os.path.exists(processed_dir):
         print(f"ERRO: Diretório não encontrado: {processed_dir}")
         sys.exit(1)
 
     # Regenera
-    result = regenerate_chords(processed_dir, stem)
+    result = regenerate_chords(processed_dir, stem, profile)
 
     if result:
         print("\n✓ Regeneração concluída com sucesso!")
@@ -7,6 +7,8 @@ const util = require('util');
 const multer = require('multer');
 const { exec } = require('child_process');
 const { dbOperations } = require('./database');
+const processingWorker = require('./processing-worker');
+const jobQueue = require('./job-queue');
 const session = require('express-session');
 const bcrypt = require('bcryptjs');
 const { requireAuth, requireAdmin, createDefaultAdmin } = require('./auth');
@@ -26,6 +28,22 @@ const DATA_DIR = process.env.DATA_DIR
 const UPLOADS_DIR = path.join(DATA_DIR, 'uploads');
 const PROCESSED_DIR = path.join(DATA_DIR, 'processed');
 
+// Upload ainda em processamento que já pode ser aberto no player: acordes
+// parciais gravados (chords.partial.ndjson) e os MP3 dos stems em codificação
+function isPlayableWhileProcessing(uploadId) {
+    const dir = path.join(PROCESSED_DIR, `upload_${uploadId}`);
+    return ['chords.partial.ndjson', 'vocals.mp3', 'drums.mp3', 'bass.mp3', 'other.mp3']
+        .every(name => fs.existsSync(path.join(dir, name)));
+}
+
+// Perfis de análise de acordes aceitos na regeneração (ANALYSIS_PROFILES do chord_analyzer.py)
+const CHORD_ANALYSIS_PROFILES = [
+    { name: 'fast', label: 'Rápido' },
+    { name: 'standard', label: 'Padrão' },
+    { name: 'accurate', label: 'Preciso' }
+];
+const DEFAULT_CHORD_PROFILE = 'standard';
+
 // Log de configuração de caminhos (importante para diagnóstico)
 logger.info('========== CONFIGURAÇÃO DE DIRETÓRIOS ==========');
 logger.info('__dirname: ' + __dirname);
@@ -203,16 +221,22 @@ app.get('/', requireAuth, (req, res) => {
                 const musicList = uploads.map(u => {
                     const statusBadge = u.processing_status === 'completed' ? 'success' :
                                        u.processing_status === 'processing' ? 'warning' :
+                                       u.processing_status === 'queued' ? 'info' :
                                        u.processing_status === 'error' ? 'danger' : 'secondary';
 
                     const statusText = u.processing_status === 'completed' ? 'Processado' :
                                       u.processing_status === 'processing' ? 'Processando' :
+                                      u.processing_status === 'queued' ? 'Na fila' :
                                       u.processing_status === 'error' ? 'Erro' : 'Pendente';
 
                     const playLink = u.processing_status === 'completed' ?
                         `<a href="/player/${u.id}?autoplay=true" class="btn btn-sm btn-success" style="margin: 2px;">
                             <i class="fa fa-play"></i> Tocar
                         </a>` :
+                        u.processing_status === 'processing' && isPlayableWhileProcessing(u.id) ?
+                        `<a href="/player/${u.id}" class="btn btn-sm btn-warning" style="margin: 2px;" title="Acordes e áudio ainda em análise">
+                            <i class="fa fa-play"></i> Tocar (parcial)
+                        </a>` :
                         '';
 
                     // Mostra o nome do usuário apenas se for admin
@@ -775,21 +799,8 @@ app.post('/upload', requireAuth, upload.single('audioFile'), (req, res) => {
 
         logger.info(`Arquivo ${req.file.filename} salvo com sucesso. ID: ${uploadId}`);
 
-        // Inicia processamento da música em background
-        const pythonScript = path.join(__dirname, 'process_audio.py');
-        const venvActivate = path.join(__dirname, 'venv', 'bin', 'activate');
-        const command = `bash -c "source '${venvActivate}' && python3 '${pythonScript}' '${req.file.path}' ${uploadId}"`;
-
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                logger.error(`Erro ao processar áudio: ${error.message}`);
-                logger.error(`stderr: ${stderr}`);
-                dbOperations.updateProcessingStatus(uploadId, 'error', null, () => {});
-            } else {
-                logger.info(`Processamento iniciado para upload ID ${uploadId}`);
-                logger.info(`stdout: ${stdout}`);
-            }
-        });
+        // Coloca a música na fila de processamento (executada em background)
+        jobQueue.enqueue(uploadId, req.file.path, req.file.size, { isAdmin: req.session.isAdmin });
 
         res.send(`
             <html>
@@ -803,7 +814,7 @@ app.post('/upload', requireAuth, upload.single('audioFile'), (req, res) => {
                         <p><strong>Nome do arquivo:</strong> ${req.file.originalname}</p>
                         <p><strong>Tamanho:</strong> ${(req.file.size / 1024 / 1024).toFixed(2)} MB</p>
                         <p><strong>Salvo como:</strong> ${req.file.filename}</p>
-                        <p><strong>Status:</strong> Processamento iniciado</p>
+                        <p><strong>Status:</strong> Na fila de processamento</p>
                     </div>
                     <a href="/upload" class="btn btn-primary">Enviar outro arquivo</a>
                     <a href="/" class="btn btn-secondary">Voltar para home</a>
@@ -828,16 +839,22 @@ app.get('/my-uploads', requireAuth, (req, res) => {
         const linhas = uploads.map(u => {
             const statusBadge = u.processing_status === 'completed' ? 'success' :
                                u.processing_status === 'processing' ? 'warning' :
+                               u.processing_status === 'queued' ? 'info' :
                                u.processing_status === 'error' ? 'danger' : 'secondary';
 
             const statusText = u.processing_status === 'completed' ? 'Processado' :
                               u.processing_status === 'processing' ? 'Processando' :
+                              u.processing_status === 'queued' ? 'Na fila' :
                               u.processing_status === 'error' ? 'Erro' : 'Pendente';
 
             const playLink = u.processing_status === 'completed' ?
                 `<a href="/player/${u.id}?autoplay=true" class="btn btn-sm btn-success" style="margin: 2px;">
                     <i class="fa fa-play"></i> Tocar
                 </a>` :
+                u.processing_status === 'processing' && isPlayableWhileProcessing(u.id) ?
+                `<a href="/player/${u.id}" class="btn btn-sm btn-warning" style="margin: 2px;" title="Acordes e áudio ainda em análise">
+                    <i class="fa fa-play"></i> Tocar (parcial)
+                </a>` :
                 '';
 
             const exportLink = u.processing_status === 'completed' ?
@@ -891,7 +908,32 @@ app.get('/my-uploads', requireAuth, (req, res) => {
     });
 });
 
-// Rota para player de música processada
+// Arquivos de uma rendition alternativa dos stems (ex: vocals.preview.opus), gerados
+// pelo process_audio.py conforme ENCODE_RENDITIONS; null se faltar algum stem
+function findRenditionFiles(processedPath, quality) {
+    if (!/^[a-z0-9_-]+$/.test(quality)) {
+        return null;
+    }
+
+    let files;
+    try {
+        files = fs.readdirSync(path.join(PROCESSED_DIR, path.basename(processedPath)));
+    } catch (err) {
+        return null;
+    }
+
+    const renditions = {};
+    for (const stem of ['vocals', 'drums', 'bass', 'other']) {
+        const file = files.find(name => name.startsWith(`${stem}.${quality}.`));
+        if (!file) {
+            return null;
+        }
+        renditions[stem] = file;
+    }
+    return renditions;
+}
+
+// Rota para player de música processada (?quality=preview usa a rendition leve, se existir)
 app.get('/player/:uploadId', requireAuth, (req, res) => {
     const uploadId = req.params.uploadId;
     logger.info(`Requisição para /player/${uploadId}`);
@@ -907,9 +949,12 @@ app.get('/player/:uploadId', requireAuth, (req, res) => {
             return res.status(403).send('Você não tem permissão para acessar esta música');
         }
 
-        if (upload.processing_status !== 'completed') {
+        // Em processamento, abre com os acordes parciais (o player os atualiza até o fim da análise)
+        const partial = upload.processing_status === 'processing' && isPlayableWhileProcessing(upload.id);
+        if (upload.processing_status !== 'completed' && !partial) {
             return res.status(400).send('Música ainda não foi processada');
         }
+        const processedPath = upload.processed_path || `/processed/upload_${upload.id}`;
 
         const templatePath = path.join(__dirname, 'templates', 'player-upload.html');
         const autoplay = req.query.autoplay === 'true' ? 'true' : 'false';
@@ -920,8 +965,18 @@ app.get('/player/:uploadId', requireAuth, (req, res) => {
                 return res.status(500).send('Erro ao carregar template');
             }
 
-            const finalHtml = templateHtml
-                .replaceAll('{{URL}}', upload.processed_path)
+            let html = templateHtml;
+            const renditions = req.query.quality ? findRenditionFiles(processedPath, req.query.quality) : null;
+            if (renditions) {
+                Object.entries(renditions).forEach(([stem, file]) => {
+                    html = html.replaceAll(`{{URL}}/${stem}.mp3`, `{{URL}}/${file}`);
+                });
+            } else if (req.query.quality) {
+                logger.info(`Rendition '${req.query.quality}' indisponível para o upload ${uploadId}; usando MP3`);
+            }
+
+            const finalHtml = html
+                .replaceAll('{{URL}}', processedPath)
                 .replaceAll('{{NOME}}', upload.song_name)
                 .replaceAll('{{ARTISTA}}', upload.artist)
                 .replaceAll('{{ID}}', upload.id)
@@ -1136,11 +1191,13 @@ app.get('/api/diagnostic/env-python', requireAuth, requireAdmin, (req, res) => {
 app.get('/api/diagnostic/spleeter', requireAuth, requireAdmin, (req, res) => {
     logger.info('Executando diagnóstico do Spleeter');
 
+    // Verificação rápida por padrão; ?full=1 importa o Spleeter e inicializa o modelo
+    const fullCheck = req.query.full === '1';
     const verifyScript = path.join(__dirname, 'verify_spleeter.py');
     const venvActivate = path.join(__dirname, 'venv', 'bin', 'activate');
-    const command = `bash -c "source '${venvActivate}' && python3 '${verifyScript}'"`;
+    const command = `bash -c "source '${venvActivate}' && python3 '${verifyScript}'${fullCheck ? ' --full' : ''}"`;
 
-    exec(command, { timeout: 30000 }, (error, stdout, stderr) => {
+    exec(command, { timeout: fullCheck ? 120000 : 30000 }, (error, stdout, stderr) => {
         res.json({
             success: !error,
             title: error ? 'Erro na verificação do Spleeter' : 'Spleeter verificado com sucesso',
@@ -1152,6 +1209,98 @@ app.get('/api/diagnostic/spleeter', requireAuth, requireAdmin, (req, res) => {
     });
 });
 
+// API: Situação da fila de processamento
+app.get('/api/diagnostic/queue', requireAuth, requireAdmin, (req, res) => {
+    res.json(jobQueue.getStatus());
+});
+
+// Resume as etapas de um perfil: "separation 42.1s (61%) | postprocess ..."
+function formatProfileStages(profile) {
+    let detail;
+    try {
+        detail = JSON.parse(profile.stages || '{}');
+    } catch (err) {
+        return 'perfil inválido';
+    }
+
+    const total = profile.total_wall || 0;
+    const stages = (detail.stages || []).map(stage => {
+        const share = total > 0 ? ` (${Math.round(100 * stage.wall / total)}%)` : '';
+        return `${stage.name} ${stage.wall.toFixed(1)}s${share}`;
+    });
+    const tasks = (detail.tasks || []).map(task => `${task.name} ${task.wall.toFixed(1)}s`);
+
+    return stages.join(' | ') + (tasks.length ? `\ntarefas: ${tasks.join(', ')}` : '');
+}
+
+// Pico de memória do job; perfis sem reinício do pico (fora do Linux) só
+// têm o pico da vida do processo worker, que inclui os jobs anteriores
+function formatProfilePeak(profile) {
+    if (profile.peak_rss_mb != null) {
+        return `pico ${profile.peak_rss_mb.toFixed(0)} MB`;
+    }
+    try {
+        const lifetime = JSON.parse(profile.stages || '{}').lifetime_peak_rss_mb;
+        if (lifetime != null) {
+            return `pico do processo ${lifetime.toFixed(0)} MB`;
+        }
+    } catch (err) {
+        // perfil inválido: formatProfileStages já informa
+    }
+    return 'pico -';
+}
+
+// API: Onde o tempo é gasto no processamento de cada música (perfis recentes)
+app.get('/api/diagnostic/profiles', requireAuth, requireAdmin, (req, res) => {
+    const limit = Math.min(parseInt(req.query.limit, 10) || 20, 200);
+
+    dbOperations.getRecentProfiles(limit, (err, profiles) => {
+        if (err) {
+            logger.error('Erro ao ler perfis de processamento: ' + err.message);
+            return res.status(500).json({ error: 'Erro ao ler perfis de processamento' });
+        }
+
+        const diagnostics = (profiles || []).map(profile => {
+            const name = profile.song_name
+                ? `${profile.artist || ''} - ${profile.song_name}`
+                : (profile.original_filename || 'upload removido');
+            const factor = profile.total_wall > 0 ? (profile.input_duration / profile.total_wall).toFixed(1) : '-';
+
+            return {
+                label: `#${profile.upload_id} ${name} [${profile.status}] - ` +
+                    `${(profile.input_duration || 0).toFixed(0)}s de áudio em ${(profile.total_wall || 0).toFixed(1)}s ` +
+                    `(${factor}x tempo real, CPU ${(profile.total_cpu || 0).toFixed(1)}s, ${formatProfilePeak(profile)})`,
+                value: formatProfileStages(profile)
+            };
+        });
+
+        res.json({
+            success: true,
+            title: `Perfil de Processamento (${diagnostics.length} mais recentes)`,
+            diagnostics: diagnostics
+        });
+    });
+});
+
+// API: Perfil completo do processamento de um upload
+app.get('/api/diagnostic/profiles/:uploadId', requireAuth, requireAdmin, (req, res) => {
+    dbOperations.getUploadProfile(req.params.uploadId, (err, profile) => {
+        if (err) {
+            return res.status(500).json({ error: 'Erro ao ler perfil de processamento' });
+        }
+        if (!profile) {
+            return res.status(404).json({ error: 'Perfil não encontrado' });
+        }
+
+        try {
+            profile.stages = JSON.parse(profile.stages || '{}');
+        } catch (parseErr) {
+            profile.stages = {};
+        }
+        res.json(profile);
+    });
+});
+
 // API: Diagnóstico de caminhos e arquivos
 app.get('/api/diagnostic/paths', requireAuth, requireAdmin, (req, res) => {
     logger.info('Executando diagnóstico de caminhos');
@@ -1287,6 +1436,43 @@ app.get('/api/diagnostic/full', requireAuth, requireAdmin, (req, res) => {
     executeNext(0);
 });
 
+// Lê o arquivo de acordes parciais (NDJSON gravado pelo process_audio.py durante a análise):
+// primeira linha com metadados, depois eventos e linhas {"analyzed": segundos}
+function readPartialChords(partialFile, callback) {
+    fs.readFile(partialFile, 'utf8', (err, data) => {
+        if (err) {
+            return callback(err);
+        }
+
+        const chordsData = { duration: 0, events: [], partial: true, analyzed_until: 0 };
+        data.split('\n').forEach((line, index) => {
+            let entry;
+            try {
+                entry = JSON.parse(line);
+            } catch (parseErr) {
+                // Linha vazia ou ainda sendo escrita
+                return;
+            }
+            if (index === 0) {
+                Object.assign(chordsData, entry);
+            } else if (entry.chord !== undefined) {
+                chordsData.events.push(entry);
+            } else if (entry.analyzed !== undefined) {
+                chordsData.analyzed_until = entry.analyzed;
+            }
+        });
+
+        chordsData.duration = Math.max(chordsData.duration || 0, chordsData.analyzed_until);
+        callback(null, chordsData);
+    });
+}
+
+// Endpoint com os perfis de análise disponíveis para a regeneração de acordes
+// (registrado antes de /api/chords/:uploadId)
+app.get('/api/chords/profiles', requireAuth, (req, res) => {
+    res.json({ profiles: CHORD_ANALYSIS_PROFILES, default: DEFAULT_CHORD_PROFILE });
+});
+
 // Endpoint para obter dados de acordes de um upload específico
 app.get('/api/chords/:uploadId', requireAuth, (req, res) => {
     const uploadId = req.params.uploadId;
@@ -1303,6 +1489,17 @@ app.get('/api/chords/:uploadId', requireAuth, (req, res) => {
             return res.status(403).json({ error: 'Sem permissão' });
         }
 
+        // Durante o processamento, serve os acordes já analisados (arquivo parcial)
+        if (upload.processing_status === 'processing') {
+            const partialFile = path.join(PROCESSED_DIR, `upload_${uploadId}`, 'chords.partial.ndjson');
+            return readPartialChords(partialFile, (err, chordsData) => {
+                if (err) {
+                    return res.status(400).json({ error: 'Música ainda não processada' });
+                }
+                res.json(chordsData);
+            });
+        }
+
         if (upload.processing_status !== 'completed') {
             return res.status(400).json({ error: 'Música ainda não processada' });
         }
@@ -1345,8 +1542,9 @@ app.get('/api/chords/:uploadId', requireAuth, (req, res) => {
 app.post('/api/chords/:uploadId/regenerate', requireAuth, (req, res) => {
     const uploadId = req.params.uploadId;
     const { stem } = req.body;
+    const profile = req.body.profile || DEFAULT_CHORD_PROFILE;
 
-    logger.info(`Requisição para regenerar acordes do upload ${uploadId} com stem: ${stem}`);
+    logger.info(`Requisição para regenerar acordes do upload ${uploadId} com stem: ${stem} (perfil ${profile})`);
 
     dbOperations.getUploadById(uploadId, (err, upload) => {
         if (err || !upload) {
@@ -1372,14 +1570,24 @@ app.post('/api/chords/:uploadId/regenerate', requireAuth, (req, res) => {
             return res.status(400).json({ error: 'Stem inválido' });
         }
 
+        // Valida perfil de análise
+        if (!CHORD_ANALYSIS_PROFILES.some(option => option.name === profile)) {
+            return res.status(400).json({ error: 'Perfil de análise inválido' });
+        }
+
         // Executa script Python para regenerar acordes
         const pythonScript = path.join(__dirname, 'regenerate_chords.py');
-        const command = `source ${path.join(__dirname, 'venv/bin/activate')} && python3 "${pythonScript}" "${processedDir}" "${stem}"`;
+        const command = `source ${path.join(__dirname, 'venv/bin/activate')} && python3 "${pythonScript}" "${processedDir}" "${stem}" "${profile}"`;
 
         logger.info(`Executando: ${command}`);
 
         const { exec } = require('child_process');
+        const startedAt = Date.now();
         exec(command, { shell: '/bin/bash' }, (error, stdout, stderr) => {
+            // Latência total (inclui iniciar o interpretador); o script informa a parte dele
+            const timing = (stdout.match(/^Tempo: .*$/m) || [''])[0];
+            logger.info(`Regeneração de acordes (upload ${uploadId}, ${stem}, ${profile}) em ${Date.now() - startedAt}ms ${timing}`);
+
             if (error) {
                 logger.error('Erro ao regenerar acordes: ' + error.message);
                 logger.error('stderr: ' + stderr);
@@ -2378,4 +2586,18 @@ app.post('/api/music/import', requireAuth, zipUpload.single('zipFile'), (req, re
 // Start do servidor
 app.listen(PORT, () => {
     console.log(`Servidor rodando na porta ${PORT}`);
+
+    // Carrega o modelo do Spleeter antes do primeiro upload
+    processingWorker.startWorker();
+
+    // Retoma a fila de processamento (inclui jobs interrompidos por queda)
+    jobQueue.start();
+});
+
+// Encerra o worker de processamento junto com o servidor
+['SIGINT', 'SIGTERM'].forEach(signal => {
+    process.on(signal, () => {
+        processingWorker.stopWorker();
+        process.exit(0);
+    });
 });
\ No newline at end of file
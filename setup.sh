@@ -127,7 +127,7 @@ echo ""
 
 # Instala dependências Python
 echo "3. Instalando dependências Python (isso pode demorar alguns minutos)..."
-echo "   Isso inclui: Spleeter, TensorFlow, Matplotlib, Librosa..."
+echo "   Isso inclui: Spleeter, TensorFlow, Librosa..."
 source venv/bin/activate
 pip install --upgrade pip
 pip install -r requirements.txt
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage Manifest - Checkpoints das etapas do processamento de um upload
+Cada etapa concluída (separação, waveform, features, codificação, acordes)
+é registrada em manifest.json no diretório do upload com o fingerprint da
+entrada e dos parâmetros e os arquivos que gerou. Um novo processamento do
+mesmo upload (ex: depois de um OOM ou restart) pula as etapas ainda válidas.
+
+Os stems separados ficam em stems/<stem>.npy (int16), para que refazer uma
+etapa posterior não exija rodar o Spleeter de novo. Na separação em janelas,
+cada janela é salva à parte (stems/<stem>.<janela>.npy) e as etapas
+seguintes são retomadas relendo as janelas, sem os stems inteiros em memória.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+
+
+MANIFEST_FILE = 'manifest.json'
+
+# Versão do formato; mudar invalida os manifests antigos
+MANIFEST_VERSION = 1
+
+# Stems separados (saída da etapa 'separate')
+STEMS_DIR = 'stems'
+
+# Escala dos stems quantizados (a mesma do PCM s16 enviado ao ffmpeg)
+STEM_SCALE = 32767
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash do conteúdo do arquivo de entrada (SHA-256)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageManifest:
+    """
+    Manifest das etapas de um upload
+
+    O fingerprint de cada etapa combina o da entrada, os parâmetros da
+    etapa e os fingerprints das etapas de que ela depende: mudar o áudio,
+    o perfil de análise ou as renditions invalida só o que for afetado.
+
+    Uso:
+        manifest = StageManifest(output_dir, file_fingerprint(audio_path))
+        separate = manifest.fingerprint({'model': 'spleeter:4stems'})
+        manifest.expect({'separate': separate,
+                         'encode': manifest.fingerprint({'renditions': ...}, separate)})
+        if not manifest.is_done('encode'):
+            ...
+            manifest.complete('encode', ['/.../vocals.mp3', ...])
+    """
+
+    def __init__(self, output_dir: str, input_fingerprint: Optional[str]):
+        """
+        Args:
+            output_dir: Diretório do upload processado
+            input_fingerprint: Hash do arquivo de entrada (None = checkpoints
+                               desativados: nada é reaproveitado nem registrado)
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.input_fingerprint = input_fingerprint
+        self.enabled = input_fingerprint is not None
+        self.expected: Dict[str, str] = {}
+        self.stages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        # Outro áudio (reenvio com o mesmo ID) ou outro formato: nada é reaproveitado
+        if data.get('version') == MANIFEST_VERSION and data.get('input') == self.input_fingerprint:
+            self.stages = data.get('stages', {})
+
+    def _save(self) -> None:
+        data = {
+            'version': MANIFEST_VERSION,
+            'input': self.input_fingerprint,
+            'stages': self.stages
+        }
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar {MANIFEST_FILE}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fingerprint(self, params: Dict, *depends: str) -> str:
+        """
+        Fingerprint de uma etapa
+
+        Args:
+            params: Parâmetros que mudam o resultado da etapa (serializáveis em JSON)
+            depends: Fingerprints das etapas cuja saída ela consome
+
+        Returns:
+            Hash hexadecimal
+        """
+        payload = json.dumps({'input': self.input_fingerprint, 'params': params, 'depends': list(depends)},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def expect(self, fingerprints: Dict[str, str]) -> None:
+        """Define os fingerprints das etapas deste processamento"""
+        self.expected.update(fingerprints)
+
+    def is_done(self, stage: str) -> bool:
+        """
+        A etapa foi concluída com os mesmos fingerprints e os arquivos que
+        ela gerou continuam no disco (com o mesmo tamanho)?
+        """
+        if not self.enabled:
+            return False
+
+        entry = self.stages.get(stage)
+        if not entry or entry.get('fingerprint') != self.expected.get(stage):
+            return False
+
+        for name, size in entry.get('outputs', {}).items():
+            path = os.path.join(self.output_dir, name)
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def pending(self, stages: Optional[Iterable[str]] = None) -> List[str]:
+        """Etapas (todas as esperadas, por padrão) que precisam ser executadas"""
+        return [stage for stage in (stages if stages is not None else self.expected)
+                if not self.is_done(stage)]
+
+    def complete(self, stage: str, outputs: Iterable[str]) -> None:
+        """
+        Registra uma etapa concluída (grava o manifest imediatamente)
+
+        Args:
+            stage: Nome da etapa
+            outputs: Arquivos gerados pela etapa (caminhos absolutos ou relativos ao upload)
+        """
+        if not self.enabled:
+            return
+
+        files = {}
+        for path in outputs:
+            path = os.path.join(self.output_dir, path)
+            files[os.path.relpath(path, self.output_dir)] = os.path.getsize(path)
+
+        with self._lock:
+            self.stages[stage] = {
+                'fingerprint': self.expected.get(stage),
+                'outputs': files,
+                'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }
+            self._save()
+
+
+def stem_array_path(output_dir: str, stem: str) -> str:
+    """Arquivo com o stem separado (int16, amostras x canais)"""
+    return os.path.join(output_dir, STEMS_DIR, f'{stem}.npy')
+
+
+def chunk_array_path(output_dir: str, stem: str, index: int) -> str:
+    """Arquivo com uma janela de um stem (separação em janelas)"""
+    return os.path.join(output_dir, STEMS_DIR, f'{stem}.{index:04d}.npy')
+
+
+def _save_int16(path: str, samples: np.ndarray) -> None:
+    """Salva um array float como int16 (escrita atômica)"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    quantized = np.empty(samples.shape, dtype=np.int16)
+    np.multiply(np.clip(samples, -1.0, 1.0), STEM_SCALE, out=quantized, casting='unsafe')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, quantized)
+    os.replace(tmp_path, path)
+
+
+def save_stem_arrays(output_dir: str, prediction: Dict[str, np.ndarray]) -> List[str]:
+    """
+    Salva os stems separados como int16 (escrita atômica)
+
+    Args:
+        output_dir: Diretório do upload processado
+        prediction: Dicionário stem -> array float (amostras, canais)
+
+    Returns:
+        Caminhos dos arquivos gravados
+    """
+    os.makedirs(os.path.join(output_dir, STEMS_DIR), exist_ok=True)
+    paths = []
+    for stem, samples in prediction.items():
+        path = stem_array_path(output_dir, stem)
+        _save_int16(path, samples)
+        paths.append(path)
+    return paths
+
+
+def save_chunk_arrays(output_dir: str, index: int, chunk: Dict[str, np.ndarray]) -> List[str]:
+    """
+    Salva uma janela separada (todos os stems) como int16
+
+    Returns:
+        Caminhos dos arquivos gravados
+    """
+    os.makedirs(os.path.join(output_dir, STEMS_DIR), exist_ok=True)
+    paths = []
+    for stem, samples in chunk.items():
+        path = chunk_array_path(output_dir, stem, index)
+        _save_int16(path, samples)
+        paths.append(path)
+    return paths
+
+
+def iter_chunk_arrays(output_dir: str, stems: Iterable[str]) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Relê as janelas salvas por save_chunk_arrays, em ordem, uma de cada vez
+
+    Args:
+        output_dir: Diretório do upload processado
+        stems: Stems lidos de cada janela (os demais não são carregados)
+
+    Yields:
+        Dicionário stem -> array float32 (amostras, canais)
+    """
+    stems = list(stems)
+    index = 0
+    while stems and os.path.exists(chunk_array_path(output_dir, stems[0], index)):
+        yield {stem: np.load(chunk_array_path(output_dir, stem, index)).astype(np.float32) / STEM_SCALE
+               for stem in stems}
+        index += 1
+
+
+def load_stem_arrays(output_dir: str, stems: Iterable[str]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Lê os stems salvos por save_stem_arrays
+
+    Returns:
+        Dicionário stem -> array float32 (amostras, canais) ou None se faltar algum
+    """
+    prediction = {}
+    try:
+        for stem in stems:
+            quantized = np.load(stem_array_path(output_dir, stem), mmap_mode='r')
+            prediction[stem] = quantized.astype(np.float32) / STEM_SCALE
+    except (OSError, ValueError):
+        return None
+    return prediction
+
+
+def remove_stem_arrays(output_dir: str) -> None:
+    """Remove os stems e janelas separados (depois de um processamento completo)"""
+    shutil.rmtree(os.path.join(output_dir, STEMS_DIR), ignore_errors=True)
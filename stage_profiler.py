@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage Profiler - Tempo, CPU e memória de cada etapa do processamento de um upload
+O perfil é salvo em profile.json no diretório do upload; a linha da tabela
+upload_profiles é gravada pelo pipeline_db junto com o status final do job
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+
+def lifetime_peak_rss_mb() -> float:
+    """
+    Pico de memória residente desde o início do processo (MB)
+
+    No modo worker o processo atende vários jobs: este valor inclui os jobs
+    anteriores e não serve como pico de um job isolado (ver reset_peak_rss).
+    No Linux ele acompanha o VmHWM e também é reiniciado por reset_peak_rss.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reinicia o pico de memória residente do processo (VmHWM) no valor atual
+
+    Returns:
+        True se o pico foi reiniciado (Linux com /proc/self/clear_refs)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def hwm_rss_mb(pid: Union[int, str] = 'self') -> Optional[float]:
+    """
+    Pico de memória residente desde o último reset_peak_rss (MB); None fora do Linux
+
+    Args:
+        pid: Processo lido ('self' ou o PID de um subprocesso ainda em execução,
+             ex: ffmpeg; depois que ele termina o valor não existe mais)
+    """
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_mb() -> Optional[float]:
+    """Memória residente atual (MB); None fora do Linux"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cpu_seconds() -> float:
+    """CPU usada pelo processo e pelos filhos já finalizados (ex: ffmpeg)"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def tracemalloc_enabled() -> bool:
+    """PROFILE_TRACEMALLOC=true ativa o pico de alocações Python/numpy por etapa (mais lento)"""
+    return os.getenv('PROFILE_TRACEMALLOC', 'false').lower() in ('1', 'true', 'yes')
+
+
+class StageProfiler:
+    """
+    Perfil de um job: etapas sequenciais medidas com stage() e tarefas
+    paralelas (medidas nos workers) registradas com add()
+
+    Uso:
+        profiler = StageProfiler(upload_id)
+        with profiler.stage('separation'):
+            ...
+        profiler.add('waveform:vocals', wall=3.2, cpu=3.1)
+        profiler.add_process_peak(pid, 410.0)   # worker de um ProcessPoolExecutor
+        profiler.save(output_dir, 'completed')
+    """
+
+    def __init__(self, upload_id=None, input_duration: float = 0.0,
+                 trace_memory: Optional[bool] = None):
+        """
+        Args:
+            upload_id: ID do upload
+            input_duration: Duração do áudio de entrada (segundos)
+            trace_memory: Usa tracemalloc (None = variável PROFILE_TRACEMALLOC)
+        """
+        self.upload_id = upload_id
+        self.input_duration = input_duration
+        self.trace_memory = tracemalloc_enabled() if trace_memory is None else trace_memory
+        self.stages: List[Dict] = []
+        self.tasks: List[Dict] = []
+
+        # Pico do job: o VmHWM é reiniciado no início do job e de cada etapa
+        # e acumulado aqui antes de cada reinício. Sem reinício (fora do
+        # Linux) só existe o pico da vida do processo.
+        self.resets_peak = reset_peak_rss() and hwm_rss_mb() is not None
+        self._job_peak = hwm_rss_mb() if self.resets_peak else None
+        # Picos dos processos filhos (pid -> MB) informados durante a etapa atual
+        self._process_peaks: Dict[int, float] = {}
+
+        self._started_wall = time.perf_counter()
+        self._started_cpu = cpu_seconds()
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _job_peak_mb(self) -> Optional[float]:
+        """Acumula o VmHWM atual no pico do job"""
+        if not self.resets_peak:
+            return None
+        current = hwm_rss_mb()
+        if current is not None:
+            self._job_peak = max(self._job_peak or 0.0, current)
+        return self._job_peak
+
+    def add_process_peak(self, pid: int, peak_mb: Optional[float]) -> None:
+        """
+        Registra o pico de memória de um processo que executou tarefas da etapa
+        atual (ex: STEM_POOL=process); o VmHWM deste processo não o inclui
+
+        Informações do próprio processo (pool de threads) são ignoradas.
+        """
+        if peak_mb is None or pid == os.getpid():
+            return
+        self._process_peaks[pid] = max(self._process_peaks.get(pid, 0.0), peak_mb)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Mede uma etapa (tempo, CPU, pico de RSS e pico do tracemalloc)
+
+        rss_peak_mb é o pico da própria etapa e rss_growth_mb quanto ele
+        passou da memória residente no início da etapa. Processos filhos
+        registrados com add_process_peak entram somados em rss_peak_mb (e no
+        pico do job) e à parte em children_rss_peak_mb: os workers do pool
+        existem durante toda a etapa, então a soma é um limite superior.
+        Sem reinício do pico, a etapa registra o pico da vida do processo
+        (lifetime_peak_rss_mb) e quanto ela o aumentou.
+        """
+        if self.resets_peak:
+            self._job_peak_mb()
+            reset_peak_rss()
+            rss_before = current_rss_mb() or 0.0
+        else:
+            rss_before = lifetime_peak_rss_mb()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._process_peaks = {}
+
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+        try:
+            yield
+        finally:
+            entry = {
+                'name': name,
+                'wall': round(time.perf_counter() - wall_start, 3),
+                'cpu': round(cpu_seconds() - cpu_start, 3)
+            }
+            stage_peak = hwm_rss_mb() if self.resets_peak else None
+            children_peak = sum(self._process_peaks.values())
+            self._process_peaks = {}
+            if children_peak:
+                entry['children_rss_peak_mb'] = round(children_peak, 1)
+            if stage_peak is not None:
+                self._job_peak_mb()
+                stage_peak += children_peak
+                self._job_peak = max(self._job_peak or 0.0, stage_peak)
+                entry['rss_peak_mb'] = round(stage_peak, 1)
+                entry['rss_growth_mb'] = round(max(stage_peak - rss_before, 0.0), 1)
+            else:
+                lifetime_peak = lifetime_peak_rss_mb()
+                entry['lifetime_peak_rss_mb'] = round(lifetime_peak, 1)
+                entry['rss_growth_mb'] = round(lifetime_peak - rss_before, 1)
+            if self.trace_memory:
+                entry['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            self.stages.append(entry)
+
+    def add(self, name: str, wall: float, cpu: Optional[float] = None, **extra) -> None:
+        """Registra uma tarefa medida em outro lugar (ex: worker do pós-processamento)"""
+        entry = {'name': name, 'wall': round(wall, 3)}
+        if cpu is not None:
+            entry['cpu'] = round(cpu, 3)
+        entry.update(extra)
+        self.tasks.append(entry)
+
+    def to_dict(self, status: Optional[str] = None) -> Dict:
+        total_wall = time.perf_counter() - self._started_wall
+        rss_now = current_rss_mb()
+        job_peak = self._job_peak_mb()
+        return {
+            'upload_id': self.upload_id,
+            'status': status,
+            'input_duration': round(self.input_duration, 3),
+            'total_wall': round(total_wall, 3),
+            'total_cpu': round(cpu_seconds() - self._started_cpu, 3),
+            'realtime_factor': round(self.input_duration / total_wall, 2) if total_wall > 0 else None,
+            'peak_rss_mb': round(job_peak, 1) if job_peak is not None else None,
+            'lifetime_peak_rss_mb': None if self.resets_peak else round(lifetime_peak_rss_mb(), 1),
+            'rss_end_mb': round(rss_now, 1) if rss_now is not None else None,
+            'tracemalloc': self.trace_memory,
+            'stages': self.stages,
+            'tasks': self.tasks,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+    def save(self, output_dir: Optional[str], status: str) -> Dict:
+        """
+        Salva o perfil em profile.json
+
+        Falhas ao salvar são apenas registradas: o perfil nunca derruba o job.
+        A linha de upload_profiles é gravada com JobDatabase.finish(), na
+        mesma transação do status final.
+
+        Args:
+            output_dir: Diretório do upload (None para não gravar o JSON)
+            status: Status final do job ('completed', 'error'...)
+
+        Returns:
+            Dicionário do perfil
+        """
+        profile = self.to_dict(status)
+
+        if output_dir and os.path.isdir(output_dir):
+            try:
+                with open(os.path.join(output_dir, 'profile.json'), 'w', encoding='utf-8') as f:
+                    json.dump(profile, f, indent=2)
+            except OSError as e:
+                print(f"Aviso: não foi possível salvar profile.json: {e}")
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        return profile
+
+    def summary(self) -> str:
+        """Resumo em uma linha (para o log)"""
+        parts = [f"{stage['name']} {stage['wall']:.1f}s" for stage in self.stages]
+        return ' | '.join(parts)
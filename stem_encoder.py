@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stem Encoder - Codifica áudio enviando PCM bruto para o ffmpeg via pipe
+Os stems são codificados em blocos, sem manter o sinal inteiro em memória:
+MultiEncoder gera todos os stems e renditions de um job em um único ffmpeg
+"""
+
+import os
+import re
+import subprocess
+import numpy as np
+from typing import Dict, List, Optional
+
+from stage_profiler import hwm_rss_mb
+
+
+# Codecs das renditions: nome -> (encoder do ffmpeg, extensão, opções extras)
+CODECS = {
+    'mp3': ('libmp3lame', 'mp3', []),
+    # Complexidade 5 (padrão 10): ~20% mais rápido, diferença inaudível nas prévias
+    'opus': ('libopus', 'opus', ['-compression_level', '5']),
+    # faststart: o índice vai para o início e o player começa a tocar antes do fim do download
+    'aac': ('aac', 'm4a', ['-movflags', '+faststart']),
+}
+
+# Renditions padrão: MP3 completo (usado pelo player, acordes e exportação) e
+# uma prévia Opus pequena para conexões lentas
+DEFAULT_RENDITIONS = 'full:mp3:192k,preview:opus:64k'
+
+# Rendition obrigatória: gera <stem>.mp3, lido pelo resto do sistema
+MAIN_RENDITION = 'full'
+
+
+def parse_renditions(spec: Optional[str]) -> List[Dict]:
+    """
+    Interpreta a escada de renditions ('nome:codec:bitrate', separadas por vírgula)
+
+    Args:
+        spec: Ex: 'full:mp3:192k,preview:aac:96k' (None ou vazio = DEFAULT_RENDITIONS)
+
+    Returns:
+        Lista de {'name', 'codec', 'bitrate'}
+
+    Raises:
+        ValueError: Se a especificação for inválida ou não tiver 'full' em MP3
+    """
+    renditions = []
+    for item in (spec or DEFAULT_RENDITIONS).split(','):
+        parts = item.strip().split(':')
+        if len(parts) != 3:
+            raise ValueError(f"Rendition inválida (use nome:codec:bitrate): {item!r}")
+        name, codec, bitrate = (part.strip() for part in parts)
+        if not re.fullmatch(r'[a-z0-9_-]+', name):
+            raise ValueError(f"Nome de rendition inválido: {name!r}")
+        if codec not in CODECS:
+            raise ValueError(f"Codec desconhecido: {codec!r} (use {', '.join(CODECS)})")
+        if not re.fullmatch(r'\d+k?', bitrate):
+            raise ValueError(f"Bitrate inválido: {bitrate!r}")
+        if any(rendition['name'] == name for rendition in renditions):
+            raise ValueError(f"Rendition repetida: {name!r}")
+        renditions.append({'name': name, 'codec': codec, 'bitrate': bitrate})
+
+    if not any(r['name'] == MAIN_RENDITION and r['codec'] == 'mp3' for r in renditions):
+        raise ValueError(f"A rendition '{MAIN_RENDITION}' em mp3 é obrigatória")
+    return renditions
+
+
+def rendition_filename(stem: str, rendition: Dict) -> str:
+    """<stem>.mp3 para a rendition principal, <stem>.<nome>.<extensão> para as demais"""
+    extension = CODECS[rendition['codec']][1]
+    if rendition['name'] == MAIN_RENDITION:
+        return f'{stem}.{extension}'
+    return f'{stem}.{rendition["name"]}.{extension}'
+
+
+class MultiEncoder:
+    """
+    Codifica todos os stems de um job, em todas as renditions, com um único ffmpeg
+
+    Os stems são intercalados em um só fluxo PCM (stem 0 nos canais 0-1,
+    stem 1 nos canais 2-3...) e o filter_complex separa cada stem com pan e
+    duplica com asplit para as saídas de cada rendition.
+
+    Uso:
+        encoder = MultiEncoder(output_dir, ['vocals', 'drums'], parse_renditions(None))
+        encoder.write({'vocals': bloco_vocals, 'drums': bloco_drums})
+        encoder.close()
+        encoder.outputs['vocals']['full']   # caminho do vocals.mp3
+        encoder.peak_rss_mb                 # pico de memória do ffmpeg (None fora do Linux)
+    """
+
+    def __init__(self, output_dir: str, stems: List[str], renditions: List[Dict],
+                 sample_rate: int = 44100, channels: int = 2):
+        """
+        Args:
+            output_dir: Diretório de saída
+            stems: Stems, na ordem em que são intercalados
+            renditions: Lista retornada por parse_renditions
+            sample_rate: Taxa de amostragem dos blocos recebidos
+            channels: Canais de cada stem (1 ou 2)
+        """
+        self.stems = list(stems)
+        self.channels = channels
+        self.samples_written = 0
+        self.peak_rss_mb: Optional[float] = None
+        self.outputs = {stem: {rendition['name']: os.path.join(output_dir, rendition_filename(stem, rendition))
+                               for rendition in renditions}
+                        for stem in self.stems}
+
+        layout = 'stereo' if channels == 2 else 'mono'
+        graph = [f'[0:a]asplit={len(self.stems)}' + ''.join(f'[in{i}]' for i in range(len(self.stems)))]
+        for i in range(len(self.stems)):
+            mapping = '|'.join(f'c{c}=c{i * channels + c}' for c in range(channels))
+            labels = ''.join(f'[s{i}r{j}]' for j in range(len(renditions)))
+            graph.append(f'[in{i}]pan={layout}|{mapping},asplit={len(renditions)}{labels}')
+
+        command = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', str(len(self.stems) * channels), '-i', 'pipe:0',
+            '-filter_complex', ';'.join(graph)
+        ]
+        for i, stem in enumerate(self.stems):
+            for j, rendition in enumerate(renditions):
+                encoder, _, options = CODECS[rendition['codec']]
+                output_path = self.outputs[stem][rendition['name']]
+                # Pode ser um hard link compartilhado com o cache de processamento
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                command += ['-map', f'[s{i}r{j}]', '-codec:a', encoder, '-b:a', rendition['bitrate']]
+                command += options + [output_path]
+
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, blocks: Dict[str, np.ndarray]) -> None:
+        """
+        Envia um bloco de cada stem (amostras, canais) float32 [-1, 1]
+
+        Stems ausentes ou mais curtos são completados com silêncio, para que
+        todas as saídas fiquem com a mesma duração.
+        """
+        length = max((len(samples) for samples in blocks.values()), default=0)
+        if length == 0:
+            return
+
+        pcm = np.zeros((length, len(self.stems) * self.channels), dtype='<i2')
+        for i, stem in enumerate(self.stems):
+            samples = blocks.get(stem)
+            if samples is None:
+                continue
+            if samples.ndim == 1:
+                samples = samples[:, np.newaxis]
+            if samples.shape[1] != self.channels:
+                samples = np.repeat(samples.mean(axis=1, keepdims=True), self.channels, axis=1)
+            columns = slice(i * self.channels, (i + 1) * self.channels)
+            pcm[:len(samples), columns] = np.clip(samples, -1.0, 1.0) * 32767
+
+        self._process.stdin.write(pcm.tobytes())
+        self.samples_written += length
+        self._sample_peak()
+
+    def _sample_peak(self) -> None:
+        """
+        Atualiza o pico de memória do ffmpeg (VmHWM do próprio processo)
+
+        RUSAGE_CHILDREN não serve aqui: para filhos criados com fork+exec ele
+        informa o RSS do processo pai no momento do fork.
+        """
+        peak = hwm_rss_mb(self._process.pid)
+        if peak is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, round(peak, 1))
+
+    def close(self) -> bool:
+        """Finaliza a codificação; retorna True se o ffmpeg terminou sem erro"""
+        self._sample_peak()
+        self._process.stdin.close()
+        stderr = self._process.stderr.read()
+        self._process.wait()
+
+        if self._process.returncode != 0:
+            print(f"Erro ao codificar os stems: {stderr.decode(errors='replace').strip()}")
+            return False
+        return True
+
+    def abort(self) -> None:
+        """Interrompe o ffmpeg (em caso de erro no processamento)"""
+        try:
+            self._process.kill()
+            self._process.wait()
+        except Exception:
+            pass
@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 """
 Script para verificar a instalação do Spleeter e suas dependências
+
+Por padrão faz apenas verificações rápidas: os pacotes são localizados sem
+serem importados (importar o tensorflow leva vários segundos). Use --full
+para importar o Spleeter e inicializar o Separator de 4 stems.
 """
 
 import sys
 import os
+import time
+import shutil
+import importlib.util
+from importlib import metadata
+
+started = time.perf_counter()
+full_check = '--full' in sys.argv[1:]
 
 print("=" * 60)
 print("VERIFICAÇÃO DE INSTALAÇÃO DO SPLEETER")
@@ -22,72 +33,80 @@ for p in sys.path:
     print(f"   - {p}")
 print()
 
-# 3. Pacotes instalados
+# 3. Pacotes instalados (módulo importável, nome da distribuição)
 print("3. Verificando pacotes instalados:")
 packages_to_check = [
-    'numpy',
-    'tensorflow',
-    'spleeter',
-    'ffmpeg',
-    'librosa',
-    'matplotlib',
-    'pydub',
-    'soundfile'
+    ('numpy', 'numpy'),
+    ('tensorflow', 'tensorflow'),
+    ('spleeter', 'spleeter'),
+    ('ffmpeg', 'ffmpeg-python'),
+    ('librosa', 'librosa'),
+    ('soundfile', 'soundfile')
 ]
 
-for package in packages_to_check:
+for package, distribution in packages_to_check:
+    if importlib.util.find_spec(package) is None:
+        print(f"   ✗ {package}: NÃO INSTALADO")
+        continue
     try:
-        if package == 'ffmpeg':
-            import ffmpeg
-            print(f"   ✓ {package}: Instalado")
-        else:
-            mod = __import__(package)
-            version = getattr(mod, '__version__', 'unknown')
-            print(f"   ✓ {package}: {version}")
-    except ImportError as e:
-        print(f"   ✗ {package}: NÃO INSTALADO - {e}")
+        version = metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        version = 'unknown'
+    print(f"   ✓ {package}: {version}")
 print()
 
-# 4. Teste específico do Spleeter
-print("4. Teste de importação do Spleeter:")
-try:
-    from spleeter.separator import Separator
-    print("   ✓ Spleeter.Separator importado com sucesso!")
+# 4. Modelo pré-treinado e teste do Spleeter
+print("4. Modelo do Spleeter:")
+model_dir = os.path.join(os.environ.get('MODEL_PATH', 'pretrained_models'), '4stems')
+if os.path.isdir(model_dir):
+    print(f"   ✓ Modelo 4stems encontrado em: {os.path.abspath(model_dir)}")
+else:
+    print(f"   ⚠ Modelo 4stems não encontrado em {os.path.abspath(model_dir)} (será baixado no primeiro uso)")
 
-    # Tenta criar uma instância
+if full_check:
     try:
-        separator = Separator('spleeter:2stems')
-        print("   ✓ Separator inicializado com sucesso!")
-    except Exception as e:
-        print(f"   ⚠ Erro ao inicializar Separator: {e}")
+        from spleeter.separator import Separator
+        print("   ✓ Spleeter.Separator importado com sucesso!")
+
+        # Tenta criar uma instância (mesmo modelo usado no processamento)
+        try:
+            separator = Separator('spleeter:4stems')
+            print("   ✓ Separator inicializado com sucesso!")
+        except Exception as e:
+            print(f"   ⚠ Erro ao inicializar Separator: {e}")
 
-except ImportError as e:
-    print(f"   ✗ ERRO ao importar Spleeter: {e}")
-    print(f"   Detalhes: {sys.exc_info()}")
+    except ImportError as e:
+        print(f"   ✗ ERRO ao importar Spleeter: {e}")
+        print(f"   Detalhes: {sys.exc_info()}")
+else:
+    print("   - Importação do Separator não testada (use --full)")
 print()
 
 # 5. Verifica FFmpeg no sistema
 print("5. Verificando FFmpeg no sistema:")
 import subprocess
-try:
-    result = subprocess.run(['ffmpeg', '-version'],
-                          capture_output=True,
-                          text=True,
-                          timeout=5)
-    if result.returncode == 0:
-        first_line = result.stdout.split('\n')[0]
-        print(f"   ✓ FFmpeg encontrado: {first_line}")
-    else:
-        print(f"   ✗ FFmpeg não encontrado ou erro ao executar")
-except FileNotFoundError:
-    print("   ✗ FFmpeg não está instalado no sistema")
-except Exception as e:
-    print(f"   ⚠ Erro ao verificar FFmpeg: {e}")
+for binary in ('ffmpeg', 'ffprobe'):
+    binary_path = shutil.which(binary)
+    if binary_path is None:
+        print(f"   ✗ {binary} não está instalado no sistema")
+        continue
+    try:
+        result = subprocess.run([binary_path, '-version'],
+                              capture_output=True,
+                              text=True,
+                              timeout=5)
+        if result.returncode == 0:
+            first_line = result.stdout.split('\n')[0]
+            print(f"   ✓ {binary} encontrado: {first_line}")
+        else:
+            print(f"   ✗ Erro ao executar {binary}")
+    except Exception as e:
+        print(f"   ⚠ Erro ao verificar {binary}: {e}")
 print()
 
 # 6. Variáveis de ambiente
 print("6. Variáveis de ambiente relevantes:")
-env_vars = ['PATH', 'PYTHONPATH', 'LD_LIBRARY_PATH', 'VIRTUAL_ENV']
+env_vars = ['PATH', 'PYTHONPATH', 'LD_LIBRARY_PATH', 'VIRTUAL_ENV', 'MODEL_PATH']
 for var in env_vars:
     value = os.environ.get(var, 'NÃO DEFINIDA')
     if var == 'PATH':
@@ -99,5 +118,5 @@ for var in env_vars:
 print()
 
 print("=" * 60)
-print("VERIFICAÇÃO CONCLUÍDA")
+print(f"VERIFICAÇÃO CONCLUÍDA em {time.perf_counter() - started:.2f}s")
 print("=" * 60)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Waveform Renderer - Gera imagens de forma de onda a partir de picos (min/max/RMS)
+O sinal é reduzido a uma coluna por pixel em uma única passada vetorizada e o
+PNG é escrito diretamente, sem matplotlib
+"""
+
+import os
+import json
+import struct
+import zlib
+import numpy as np
+from typing import Dict
+
+
+# Dimensões padrão da imagem de waveform (pixels)
+WIDTH_PX = 1200
+HEIGHT_PX = 300
+
+# Opacidade do envelope (min/max) e do corpo RMS, equivalentes ao
+# fill_between (alpha 0.6) + plot (alpha 0.8) usados antes
+FILL_ALPHA = 0.6
+BODY_ALPHA = 0.92
+
+
+def compute_peaks(y: np.ndarray, columns: int = WIDTH_PX) -> Dict[str, np.ndarray]:
+    """
+    Reduz o sinal a picos por coluna
+
+    Args:
+        y: Sinal mono (amostras,)
+        columns: Quantidade de colunas (pixels de largura)
+
+    Returns:
+        Dicionário com arrays 'min', 'max' e 'rms' (um valor por coluna)
+    """
+    y = np.asarray(y, dtype=np.float32)
+
+    if len(y) == 0:
+        empty = np.zeros(columns, dtype=np.float32)
+        return {'min': empty, 'max': empty.copy(), 'rms': empty.copy()}
+
+    # Limites das colunas: a amostra i fica na coluna i * columns // len(y)
+    # (mesma regra do PeakAccumulator); com menos amostras que colunas, repete amostras
+    edges = (np.arange(columns + 1, dtype=np.int64) * len(y) + columns - 1) // columns
+    starts = np.minimum(edges[:-1], len(y) - 1)
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+
+    peaks_min = np.minimum.reduceat(y, starts)
+    peaks_max = np.maximum.reduceat(y, starts)
+    rms = np.sqrt(np.add.reduceat(y.astype(np.float64) ** 2, starts) / counts)
+
+    # Colunas vazias (reduceat devolve a própria amostra) ficam com RMS limitado ao pico
+    rms = np.minimum(rms, np.maximum(np.abs(peaks_min), np.abs(peaks_max)))
+
+    return {
+        'min': peaks_min.astype(np.float32),
+        'max': peaks_max.astype(np.float32),
+        'rms': rms.astype(np.float32)
+    }
+
+
+class PeakAccumulator:
+    """
+    Calcula os mesmos picos de compute_peaks recebendo o sinal em blocos
+
+    O total de amostras precisa ser conhecido (ou estimado) de antemão para
+    definir a coluna de cada amostra; amostras além do total caem na última
+    coluna.
+    """
+
+    def __init__(self, total_samples: int, columns: int = WIDTH_PX):
+        """
+        Args:
+            total_samples: Quantidade total (estimada) de amostras do sinal
+            columns: Quantidade de colunas (pixels de largura)
+        """
+        self.total_samples = max(1, int(total_samples))
+        self.columns = columns
+        self.samples_seen = 0
+
+        self._min = np.full(columns, np.inf, dtype=np.float32)
+        self._max = np.full(columns, -np.inf, dtype=np.float32)
+        self._sumsq = np.zeros(columns, dtype=np.float64)
+        self._counts = np.zeros(columns, dtype=np.int64)
+
+    def add(self, y: np.ndarray) -> None:
+        """Adiciona um bloco mono (amostras,)"""
+        y = np.asarray(y, dtype=np.float32)
+        if len(y) == 0:
+            return
+
+        # Coluna de cada amostra (não decrescente dentro do bloco)
+        positions = self.samples_seen + np.arange(len(y), dtype=np.int64)
+        column_of = np.minimum(positions * self.columns // self.total_samples, self.columns - 1)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(column_of)) + 1])
+        cols = column_of[starts]
+
+        np.minimum.at(self._min, cols, np.minimum.reduceat(y, starts))
+        np.maximum.at(self._max, cols, np.maximum.reduceat(y, starts))
+        np.add.at(self._sumsq, cols, np.add.reduceat(y.astype(np.float64) ** 2, starts))
+        np.add.at(self._counts, cols, np.diff(np.append(starts, len(y))))
+
+        self.samples_seen += len(y)
+
+    def peaks(self) -> Dict[str, np.ndarray]:
+        """Retorna os picos no mesmo formato de compute_peaks"""
+        filled = self._counts > 0
+        peaks_min = np.where(filled, self._min, 0.0).astype(np.float32)
+        peaks_max = np.where(filled, self._max, 0.0).astype(np.float32)
+        rms = np.sqrt(self._sumsq / np.maximum(self._counts, 1)).astype(np.float32)
+
+        return {'min': peaks_min, 'max': peaks_max, 'rms': rms}
+
+
+def _hex_to_rgb(color: str) -> tuple:
+    """Converte '#RRGGBB' em (r, g, b)"""
+    color = color.lstrip('#')
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _value_to_row(values: np.ndarray, height: int) -> np.ndarray:
+    """Converte amplitudes [-1, 1] em linhas da imagem (0 = topo)"""
+    values = np.clip(values, -1.0, 1.0)
+    return np.round((1.0 - values) / 2.0 * (height - 1)).astype(np.int64)
+
+
+def render_peaks(peaks: Dict[str, np.ndarray], color: str = '#4CAF50',
+                 height: int = HEIGHT_PX) -> np.ndarray:
+    """
+    Desenha os picos em uma imagem RGBA com fundo transparente
+
+    Args:
+        peaks: Dicionário retornado por compute_peaks
+        color: Cor da forma de onda ('#RRGGBB')
+        height: Altura da imagem em pixels
+
+    Returns:
+        Array (altura, largura, 4) uint8
+    """
+    width = len(peaks['max'])
+    rows = np.arange(height)[:, np.newaxis]
+
+    # Envelope: do menor ao maior valor da coluna, sempre incluindo o zero
+    env_top = _value_to_row(np.maximum(peaks['max'], 0.0), height)
+    env_bottom = _value_to_row(np.minimum(peaks['min'], 0.0), height)
+    envelope = (rows >= env_top) & (rows <= env_bottom)
+
+    # Corpo: faixa de +-RMS, mais opaca
+    body_top = _value_to_row(peaks['rms'], height)
+    body_bottom = _value_to_row(-peaks['rms'], height)
+    body = (rows >= body_top) & (rows <= body_bottom)
+
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[..., :3] = _hex_to_rgb(color)
+    image[..., 3] = np.where(body, round(BODY_ALPHA * 255),
+                             np.where(envelope, round(FILL_ALPHA * 255), 0))
+
+    return image
+
+
+def write_png(image: np.ndarray, output_path: str) -> None:
+    """
+    Escreve um array RGBA (altura, largura, 4) uint8 como PNG
+
+    Args:
+        image: Imagem RGBA
+        output_path: Caminho do arquivo PNG de saída
+    """
+    height, width, _ = image.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    # Cada linha começa com o byte de filtro 0 (nenhum)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 4)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)  # 8 bits, RGBA
+
+    # Escreve em arquivo temporário e substitui: o PNG antigo pode ser um
+    # hard link compartilhado com o cache de processamento
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', header))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+    os.replace(tmp_path, output_path)
+
+
+def save_peaks(peaks: Dict[str, np.ndarray], output_path: str, sample_rate: int,
+               total_samples: int) -> None:
+    """
+    Salva os picos em um arquivo JSON pequeno (sidecar do PNG)
+
+    Args:
+        peaks: Dicionário retornado por compute_peaks
+        output_path: Caminho do arquivo JSON de saída
+        sample_rate: Taxa de amostragem do sinal original
+        total_samples: Quantidade de amostras do sinal original
+    """
+    data = {
+        'sample_rate': int(sample_rate),
+        'samples': int(total_samples),
+        'columns': len(peaks['max']),
+        'min': np.round(peaks['min'], 4).tolist(),
+        'max': np.round(peaks['max'], 4).tolist(),
+        'rms': np.round(peaks['rms'], 4).tolist()
+    }
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def write_waveform(peaks: Dict[str, np.ndarray], output_image: str, color: str = '#4CAF50',
+                   peaks_file: str = None, sample_rate: int = 0, total_samples: int = 0) -> None:
+    """
+    Gera o PNG (e opcionalmente o sidecar) a partir de picos já calculados
+
+    Args:
+        peaks: Dicionário retornado por compute_peaks ou PeakAccumulator.peaks
+        output_image: Caminho do PNG de saída
+        color: Cor da forma de onda ('#RRGGBB')
+        peaks_file: Caminho do JSON de picos (None para não salvar)
+        sample_rate: Taxa de amostragem do sinal original
+        total_samples: Quantidade de amostras do sinal original
+    """
+    write_png(render_peaks(peaks, color, HEIGHT_PX), output_image)
+
+    if peaks_file:
+        save_peaks(peaks, peaks_file, sample_rate, total_samples)
+
+
+def render_waveform(y: np.ndarray, sr: int, output_image: str, color: str = '#4CAF50',
+                    peaks_file: str = None) -> Dict[str, np.ndarray]:
+    """
+    Gera o PNG da forma de onda (e opcionalmente o sidecar de picos)
+
+    Args:
+        y: Sinal mono (amostras,)
+        sr: Taxa de amostragem
+        output_image: Caminho do PNG de saída
+        color: Cor da forma de onda ('#RRGGBB')
+        peaks_file: Caminho do JSON de picos (None para não salvar)
+
+    Returns:
+        Dicionário de picos usado na imagem
+    """
+    peaks = compute_peaks(y, WIDTH_PX)
+    write_waveform(peaks, output_image, color, peaks_file, sr, len(y))
+
+    return peaks